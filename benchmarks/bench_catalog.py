@@ -0,0 +1,66 @@
+# benchmarks/bench_catalog.py
+#
+# Fills a capture catalog with a few years of synthetic captures and times the
+# batched inserts and typical time-range and Lux queries.
+#
+# Run from the project folder:
+#     python3 -m benchmarks.bench_catalog [years] [interval]
+
+import math
+import os
+import sys
+import tempfile
+import time
+from src.catalog.capture_catalog import CaptureCatalog, capture_entry
+
+DAY = 24 * 3600
+
+def synthetic_captures(count, interval, start):
+    """
+    Yields catalog entries with a daily Lux cycle, one every interval seconds.
+    """
+    for index in range(count):
+        timestamp = start + index * interval
+        daylight = max(math.sin((timestamp % DAY) / DAY * 2 * math.pi - math.pi / 2), 0)
+        metadata = {
+            'Lux': 0.5 + 20000 * daylight, 'ExposureTime': 2500, 'AnalogueGain': 1.0, 'DigitalGain': 1.0,
+            'ColourGains': (2.2, 1.9), 'SensorTemperature': 40.0,
+        }
+        yield capture_entry(timestamp, f"/images/{index}.jpg", metadata, 1200000, 0.4)
+
+def time_query(label, function, repeats=20):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    duration = (time.perf_counter() - start) / repeats
+    size = len(result) if isinstance(result, list) else result['count']
+    print(f"  {label:<40} {duration * 1000:8.2f} ms  ({size} rows)")
+
+if __name__ == "__main__":
+    years = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    count = int(years * 365 * DAY / interval)
+    start = time.time() - count * interval
+
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = CaptureCatalog(os.path.join(directory, 'captures.sqlite'), batch_size=1000, flush_interval=1)
+        print(f"Inserting {count} captures ({years:g} years at {interval:g} s)...")
+        insert_start = time.perf_counter()
+        for entry in synthetic_captures(count, interval, start):
+            catalog.record(entry)
+        catalog.flush()
+        insert_duration = time.perf_counter() - insert_start
+        print(f"  {count / insert_duration:.0f} inserts per second, "
+              f"{os.path.getsize(catalog.path) / 1e6:.0f} MB")
+
+        catalog.last_entry = None
+        end = start + count * interval
+        print("Queries:")
+        time_query("latest capture", lambda: [catalog.latest()])
+        time_query("one hour", lambda: catalog.query(start=end - 3600 * 1.5, end=end - 3600 * 0.5))
+        time_query("one day", lambda: catalog.query(start=end - DAY * 1.5, end=end - DAY * 0.5))
+        time_query("one day, Lux only", lambda: catalog.query(start=end - DAY * 1.5, end=end - DAY * 0.5, columns=['timestamp', 'lux']))
+        time_query("summary of one month", lambda: catalog.summary(start=end - 31 * DAY, end=end))
+        time_query("darkest night of one week (lux <= 1)", lambda: catalog.query(start=end - 7 * DAY, end=end, max_lux=1))
+        time_query("Lux range over all time, first 100", lambda: catalog.query(min_lux=100, max_lux=110, limit=100))
+        catalog.close()
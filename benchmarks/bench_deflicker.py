@@ -0,0 +1,71 @@
+# benchmarks/bench_deflicker.py
+#
+# Deflickers a full day of synthetic flickering frames (2880 at a 30 s interval)
+# and times each pass with 1 worker and with all CPUs: measuring the luma of every
+# frame, planning the corrections, and writing the corrected frames. The flicker
+# before and after is the standard deviation of the frame-to-frame luma change.
+#
+# Run from the project folder:
+#     python3 -m benchmarks.bench_deflicker [frames] [width]
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from benchmarks.bench_render import write_synthetic_tree
+from src.image.deflicker import Deflicker, correct_file, file_luma, plan_deflicker
+from PIL import Image
+
+WINDOW = 15
+
+def flicker(luma):
+    """
+    Standard deviation of the frame-to-frame change in log luma.
+    """
+    return float(np.std(np.diff(np.log(luma))))
+
+def timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    duration = time.perf_counter() - start
+    print(f"  {label:<36} {duration:8.2f} s")
+    return result, duration
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2880
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 1280
+    size = (width, width * 9 // 16)
+    cpus = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Writing {count} synthetic {size[0]}x{size[1]} frames with ±15% flicker...")
+        paths = write_synthetic_tree(root, count, datetime(2024, 6, 15), size=size, flicker=0.15)
+
+        print("Streaming deflicker over the folder:")
+        for workers in sorted({1, cpus}):
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                luma, _ = timed(f"measure luma, {workers} workers", lambda: list(executor.map(file_luma, paths, chunksize=16)))
+                luts, _ = timed("plan corrections (NumPy)", lambda: plan_deflicker(luma, WINDOW))
+                outputs = [os.path.join(root, f"out_{index:06d}.jpg") for index in range(count)]
+                _, duration = timed(f"write corrected frames, {workers} workers",
+                                    lambda: list(executor.map(correct_file, paths, outputs, luts, chunksize=4)))
+            print(f"  {count / duration:.1f} frames/s written")
+
+        with ProcessPoolExecutor() as executor:
+            corrected = list(executor.map(file_luma, outputs, chunksize=16))
+        print(f"Flicker: {flicker(luma):.4f} before, {flicker(corrected):.4f} after the streaming pass")
+
+        print("Inline deflicker (trailing window, at capture time):")
+        deflicker = Deflicker(WINDOW)
+        inline = []
+        start = time.perf_counter()
+        for path in paths[:min(count, 300)]:
+            with Image.open(path) as image:
+                frame = deflicker.correct(image.convert('RGB'))
+            inline.append(float(np.asarray(frame.convert('L')).mean()))
+        duration = time.perf_counter() - start
+        print(f"  {duration / len(inline) * 1000:.1f} ms per frame including decode")
+        print(f"Flicker: {flicker(luma[:len(inline)]):.4f} before, {flicker(inline):.4f} after the inline pass")
@@ -0,0 +1,66 @@
+# benchmarks/bench_derivatives.py
+#
+# Measures the cost of each derivative size on a synthetic 4K frame (scaling and
+# encoding separately), the wall time of saving the full-size image with and
+# without the derivatives running next to it, and what a web tier would pay to
+# decode and resize the full-size JPEG instead.
+#
+# Run from the project folder:
+#     python3 -m benchmarks.bench_derivatives [repeats]
+
+import io
+import os
+import sys
+import tempfile
+import time
+from PIL import Image
+from benchmarks.bench_overlay import synthetic_frame
+from capture_image import save_image
+from src.image.derivatives import get_derivative_executor, save_derivative, scale_to_width
+
+SIZES = [('thumb', 320, 75), ('web', 1920, 85)]
+CONFIG = {'camera_settings': {'image_quality': 85}, 'image_output': {'optimize': True}}
+
+def best_of(function, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    frame = synthetic_frame((3840, 2160))
+
+    with tempfile.TemporaryDirectory() as directory:
+        full_path = os.path.join(directory, 'full.jpg')
+        print("Per derivative, from the in-memory 4K frame:")
+        for name, width, quality in SIZES:
+            scaled = scale_to_width(frame, width)
+            scale = best_of(lambda: scale_to_width(frame, width), repeats)
+            encode = best_of(lambda: scaled.save(io.BytesIO(), 'JPEG', quality=quality), repeats)
+            print(f"  {name:<6} {width:>5} px: scale {scale * 1000:6.1f} ms, encode {encode * 1000:6.1f} ms")
+
+        full = best_of(lambda: save_image(frame, full_path, CONFIG), repeats)
+        print(f"Full-size save alone: {full * 1000:.1f} ms")
+
+        def with_derivatives(workers):
+            executor = get_derivative_executor(workers)
+            futures = [executor.submit(save_derivative, frame, os.path.join(directory, f'{name}.jpg'), width, quality)
+                       for name, width, quality in SIZES]
+            save_image(frame, full_path, CONFIG)
+            for future in futures:
+                future.result()
+
+        for workers in (1, 2):
+            duration = best_of(lambda: with_derivatives(workers), repeats)
+            print(f"Full-size save with derivatives, {workers} threads: {duration * 1000:.1f} ms "
+                  f"(+{(duration - full) * 1000:.1f} ms, {os.cpu_count()} CPUs)")
+
+        def web_tier_resize():
+            with Image.open(full_path) as image:
+                image.draft('RGB', (1920, 1080))
+                image.convert('RGB').resize((320, 180), Image.BICUBIC).save(io.BytesIO(), 'JPEG', quality=75)
+        print(f"Web tier thumbnail from the full JPEG (draft decode + resize): "
+              f"{best_of(web_tier_resize, repeats) * 1000:.1f} ms per request")
@@ -0,0 +1,84 @@
+# benchmarks/bench_hdr.py
+#
+# Fuses a synthetic exposure bracket at 1080p and 4K and reports the fusion time
+# per frame against the capture interval, for a range of worker counts and tile
+# sizes, with the peak memory allocated while fusing and how far the tiled result
+# is from fusing the whole frame at once (1080p only).
+#
+# Run from the project folder:
+#     python3 -m benchmarks.bench_hdr [interval in seconds]
+#
+# The interval defaults to timelapse.interval of config.yaml. With the save pipeline
+# the fusion of one frame overlaps the capture of the next, so it only has to stay
+# below the interval, divided by pipeline.workers if there are more.
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from src.config.settings import BASE_DIR, load_settings
+from src.image.hdr import fuse_exposures, fuse_tile
+
+SIZES = {'1080p': (1920, 1080), '4K': (3840, 2160)}
+
+# The bracket of the example config: the normal exposure and -2 / +2 EV
+STOPS = (0, -2, 2)
+
+TILE_SIZES = (256, 512, 1024)
+
+def synthetic_bracket(size, stops=STOPS):
+    """
+    Returns a bracket of a scene with about 12 stops of dynamic range: a gradient
+    with texture and a bright window, exposed at each stop with a gamma curve.
+    """
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    radiance = np.exp(x / width * 6 - 3) * (1 + 0.3 * np.sin(y / 17) * np.cos(x / 29))
+    radiance[height // 5:height * 2 // 5, width // 6:width // 3] *= 30
+    radiance = radiance[:, :, None] * np.array([1.0, 0.9, 0.8], dtype=np.float32)
+    return [np.clip(255 * (radiance * 2.0 ** stop / 4) ** (1 / 2.2), 0, 255).astype(np.uint8) for stop in stops]
+
+def time_fusion(frames, tile_size, workers, repeats=3):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fused = fuse_exposures(frames, tile_size=tile_size, workers=workers)
+        durations.append(time.perf_counter() - start)
+    return min(durations), fused
+
+def peak_memory(frames, tile_size, workers):
+    tracemalloc.start()
+    fuse_exposures(frames, tile_size=tile_size, workers=workers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        interval = float(sys.argv[1])
+    else:
+        config_path = os.path.join(BASE_DIR, 'config.yaml')
+        if not os.path.exists(config_path):
+            config_path = os.path.join(BASE_DIR, 'config_example.yaml')
+        interval = load_settings(config_path)['timelapse']['interval']
+
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, cores} & set(range(1, cores + 1)))
+    print(f"Fusing {len(STOPS)} exposures ({', '.join(f'{stop:+d} EV' for stop in STOPS)}) on {cores} cores, "
+          f"capture interval {interval:g} s")
+
+    for name, size in SIZES.items():
+        frames = synthetic_bracket(size)
+        whole = fuse_tile(frames) if name == '1080p' else None
+        print(f"{name}: bracket {sum(frame.nbytes for frame in frames) / 1e6:.0f} MB")
+        for tile_size in TILE_SIZES:
+            for workers in worker_counts:
+                duration, fused = time_fusion(frames, tile_size, workers)
+                line = (f"  tiles {tile_size:>4}, {workers} workers: {duration:6.2f} s  "
+                        f"{duration / interval * 100:5.1f} % of the interval")
+                if workers == worker_counts[-1]:
+                    line += f"  peak memory {peak_memory(frames, tile_size, workers) / 1e6:6.1f} MB"
+                    if whole is not None:
+                        line += f"  max difference to the whole frame {np.abs(fused.astype(int) - whole).max()}"
+                print(line)
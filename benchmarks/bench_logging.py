@@ -0,0 +1,89 @@
+# benchmarks/bench_logging.py
+#
+# Times a log call in the calling thread, as in the capture path, with the
+# previous synchronous file and console handlers and with the queue-backed
+# handler of src/log/logger.py. A slow handler simulates an SD card that stalls
+# on writes now and then.
+#
+# Run from the project folder:
+#     python3 -m benchmarks.bench_logging [calls]
+
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from src.log.logger import DATE_FORMAT, LOG_FORMAT, ColoredFormatter, LazyQueueHandler
+
+class StallingHandler(logging.Handler):
+    """
+    Writes nothing, but every 50th record takes 20 ms, like a write stalled by the SD card.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.format(record)
+        self.count += 1
+        if self.count % 50 == 0:
+            time.sleep(0.02)
+
+def make_handlers(directory):
+    file_handler = RotatingFileHandler(os.path.join(directory, 'bench.log'), maxBytes=5 * 1024 * 1024, backupCount=1)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+    console_handler = logging.StreamHandler(open(os.devnull, 'w'))
+    console_handler.setFormatter(ColoredFormatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+    stalling_handler = StallingHandler()
+    stalling_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+    return [file_handler, console_handler, stalling_handler]
+
+def time_calls(logger, calls, lazy):
+    stats = {'mean': 0.5, 'highlights': 0.0123}
+    durations = []
+    for frame in range(calls):
+        start = time.perf_counter()
+        if lazy:
+            logger.info("Histogram mean %.1f, highlights %.2f%%, next exposure %d µs at gain %s",
+                        stats['mean'] * frame, stats['highlights'] * 100, 20000 + frame, 2.0)
+        else:
+            logger.info(f"Histogram mean {stats['mean'] * frame:.1f}, highlights {stats['highlights'] * 100:.2f}%, "
+                        f"next exposure {20000 + frame} µs at gain {2.0}")
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return durations
+
+def report(label, durations):
+    print(f"  {label:<34} p50 {durations[len(durations) // 2] * 1e6:7.1f} µs  "
+          f"p99 {durations[int(len(durations) * 0.99)] * 1e6:8.1f} µs  max {durations[-1] * 1e3:6.2f} ms")
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{calls} log calls, timed in the calling thread:")
+
+        logger = logging.getLogger('bench.sync')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for handler in make_handlers(directory):
+            logger.addHandler(handler)
+        report("synchronous, f-string", time_calls(logger, calls, lazy=False))
+        report("synchronous, lazy args", time_calls(logger, calls, lazy=True))
+
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *make_handlers(directory))
+        listener.start()
+        logger = logging.getLogger('bench.queue')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(LazyQueueHandler(log_queue))
+        report("queue, f-string", time_calls(logger, calls, lazy=False))
+        report("queue, lazy args", time_calls(logger, calls, lazy=True))
+
+        drain_start = time.perf_counter()
+        listener.stop()
+        print(f"  Listener drained the queue in {(time.perf_counter() - drain_start) * 1000:.0f} ms after the last call")
@@ -0,0 +1,119 @@
+# benchmarks/bench_overlay.py
+#
+# Compares the old save -> reload -> overlay -> re-save path with the single-encode
+# in-memory overlay path, and the old full-frame compositing with the cached
+# region-only OverlayRenderer, on synthetic frames.
+#
+# Run from the project folder (config.yaml must exist):
+#     python3 -m benchmarks.bench_overlay [repeats]
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from datetime import datetime
+from PIL import Image, ImageDraw, ImageFont
+from capture_image import save_image
+from src.overlay.add_image_overlay import (
+    FONT_PATH, OVERLAY_IMAGE_PATH, TEXT_COLOR, OverlayRenderer, overlay_image, overlay_image_with_text
+)
+
+SIZES = {'1080p': (1920, 1080), '4K': (3840, 2160)}
+
+OVERLAY_DATA = {
+    'Iso': 1, 'Shutterspeed': None, 'Daylight': True, 'Quality': 85,
+    'camera_metadata': {
+        'Lux': 412.3, 'AnalogueGain': 1.0, 'DigitalGain': 1.0,
+        'ExposureTime': 2500, 'SensorTemperature': 41.0,
+    },
+}
+
+CONFIG = {'camera_settings': {'image_quality': 85}, 'image_output': {'optimize': True}}
+
+def synthetic_frame(size, seed=0):
+    """
+    Creates a frame with gradients and noise, so it encodes roughly like a real photo.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 200, width, dtype=np.float32)
+    y = np.linspace(0, 55, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    noise = rng.normal(0, 12, (height, width)).astype(np.float32)
+    frame[..., 0] = np.clip(x + y + noise, 0, 255)
+    frame[..., 1] = np.clip(y * 3 + noise, 0, 255)
+    frame[..., 2] = np.clip(255 - x + noise, 0, 255)
+    return Image.fromarray(frame)
+
+def full_frame_overlay(image, text, overlay_data):
+    """
+    The previous overlay implementation: reload the overlay and fonts, and composite a
+    full-frame RGBA layer over the whole image.
+    """
+    metadata = overlay_data['camera_metadata']
+    base_image = image.convert("RGBA")
+    overlay = Image.open(OVERLAY_IMAGE_PATH).convert("RGBA")
+    transparent_layer = Image.new("RGBA", base_image.size, (0, 0, 0, 0))
+    transparent_layer.paste(overlay, (0, 0))
+    combined = Image.alpha_composite(base_image, transparent_layer)
+
+    draw = ImageDraw.Draw(combined)
+    camerafont = ImageFont.truetype(FONT_PATH, 50)
+    datefont = ImageFont.truetype(FONT_PATH, 40)
+    text_bbox = draw.textbbox((0, 0), text, font=camerafont)
+    text_position = ((base_image.width - text_bbox[2]) // 2, 10)
+    draw.text(text_position, text, font=camerafont, fill=TEXT_COLOR)
+    full_date = datetime.now().strftime("%A, %d. %B %Y %H:%M")
+    date_bbox = draw.textbbox((0, 0), full_date, font=datefont)
+    draw.text(((base_image.width - date_bbox[2]) // 2, text_position[1] + text_bbox[3] + 10), full_date, font=datefont, fill=TEXT_COLOR)
+
+    overlay_font = ImageFont.truetype(FONT_PATH, 30)
+    draw.text((2450, 25), f"Lux: {metadata['Lux']}, AGain: {metadata['AnalogueGain']}, DGain: {metadata['DigitalGain']}", font=overlay_font, fill=TEXT_COLOR)
+    draw.text((2450, 80), f"Exposuretime: {metadata['ExposureTime']}, LensPos: 0.0, SensorTemp: {metadata['SensorTemperature']}", font=overlay_font, fill=TEXT_COLOR)
+    draw.text((20, 85), f"ISO: 1, Shutter: None, Light: {metadata['Lux']}, Day: True, HDR: Off", font=overlay_font, fill=TEXT_COLOR)
+    return combined.convert("RGB")
+
+def time_call(function, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return min(durations), sum(durations) / len(durations), result
+
+def bench_size(name, size, repeats, folder):
+    image = synthetic_frame(size)
+    path = os.path.join(folder, f"{name}.jpg")
+
+    def legacy():
+        image.save(path)
+        written = os.path.getsize(path)
+        overlay_image_with_text(path, output_image_path=path, overlay_data=OVERLAY_DATA)
+        return written + os.path.getsize(path)
+
+    def single_encode():
+        save_image(overlay_image(image, overlay_data=OVERLAY_DATA), path, CONFIG)
+        return os.path.getsize(path)
+
+    legacy_min, legacy_avg, legacy_bytes = time_call(legacy, repeats)
+    single_min, single_avg, single_bytes = time_call(single_encode, repeats)
+    print(f"{name:6} legacy        min {legacy_min * 1000:7.1f} ms  avg {legacy_avg * 1000:7.1f} ms  written {legacy_bytes / 1e6:6.2f} MB")
+    print(f"{name:6} single-encode min {single_min * 1000:7.1f} ms  avg {single_avg * 1000:7.1f} ms  written {single_bytes / 1e6:6.2f} MB"
+          f"  ({legacy_avg / single_avg:.2f}x faster)")
+
+    # Compositing only, without the encode
+    renderer = OverlayRenderer("Benchmark", lens_position=0.0)
+    full_min, full_avg, _ = time_call(lambda: full_frame_overlay(image, "Benchmark", OVERLAY_DATA), repeats)
+    # render() works in place, so give every run its own copy of the frame
+    frames = iter([image.copy() for _ in range(repeats)])
+    region_min, region_avg, _ = time_call(lambda: renderer.render(next(frames), OVERLAY_DATA), repeats)
+    print(f"{name:6} full-frame    min {full_min * 1000:7.1f} ms  avg {full_avg * 1000:7.1f} ms")
+    print(f"{name:6} region-only   min {region_min * 1000:7.1f} ms  avg {region_avg * 1000:7.1f} ms"
+          f"  ({full_avg / region_avg:.1f}x faster)")
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as folder:
+        for name, size in SIZES.items():
+            bench_size(name, size, repeats, folder)
@@ -0,0 +1,87 @@
+# benchmarks/bench_render.py
+#
+# Writes a dated tree of synthetic 4K JPEGs and times render_timelapse's frame
+# search and the decode/scale process pool with 1 and with all CPUs, writing
+# numbered frames (and a video if ffmpeg is installed).
+#
+# Run from the project folder:
+#     python3 -m benchmarks.bench_render [frames]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from PIL import Image
+from src.render.render_video import find_frames, render
+
+FRAME_SIZE = (3840, 2160)
+VIDEO_SIZE = (1920, 1080)
+
+def output_config(root):
+    """
+    The image_output settings of the synthetic tree.
+    """
+    return {'image_output': {
+        'root_folder': root, 'folder_structure': '%Y/%m/%d/', 'filename_prefix': 'tl_',
+        'filename_time_format': '%Y_%m_%d_%H_%M_%S', 'image_extension': 'jpg',
+    }}
+
+def write_synthetic_tree(root, count, start, interval=30, size=FRAME_SIZE, flicker=0.0, seed=0):
+    """
+    Writes count synthetic JPEGs into a dated tree under root, like capture_image() does.
+
+    The frames share one noisy gradient. Their brightness follows a slow ramp, and
+    with flicker > 0 each frame's brightness is also scaled by a random factor of
+    1 ± flicker, like exposure steps between frames.
+
+    Returns:
+        list: The file paths, in capture order.
+    """
+    config = output_config(root)['image_output']
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x = np.linspace(0, 200, width, dtype=np.float32)
+    y = np.linspace(0, 55, height, dtype=np.float32)[:, None]
+    base = np.empty((height, width, 3), dtype=np.float32)
+    noise = rng.normal(0, 12, (height, width)).astype(np.float32)
+    base[..., 0] = x + y + noise
+    base[..., 1] = y * 3 + noise
+    base[..., 2] = 255 - x + noise
+
+    paths = []
+    for index in range(count):
+        capture_time = start + timedelta(seconds=index * interval)
+        directory = os.path.join(root, capture_time.strftime(config['folder_structure']))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{config['filename_prefix']}{capture_time.strftime(config['filename_time_format'])}.jpg")
+        brightness = (0.6 + 0.4 * index / max(count - 1, 1)) * (1 + rng.uniform(-flicker, flicker))
+        Image.fromarray(np.clip(base * brightness, 0, 255).astype(np.uint8)).save(path, 'JPEG', quality=85)
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    start = datetime(2024, 6, 15, 23, 40)
+
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Writing {count} synthetic {FRAME_SIZE[0]}x{FRAME_SIZE[1]} frames...")
+        write_synthetic_tree(root, count, start)
+        config = output_config(root)
+
+        search_start = time.perf_counter()
+        frames = find_frames(config, start, start + timedelta(days=1))
+        print(f"Found {len(frames)} frames in {(time.perf_counter() - search_start) * 1000:.1f} ms")
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            frames_dir = os.path.join(root, f'frames_{workers}')
+            result = render(frames, VIDEO_SIZE, frames_dir=frames_dir, workers=workers)
+            print(f"  numbered frames, {workers} workers: {result['fps']:.1f} frames/s")
+
+        if shutil.which('ffmpeg'):
+            result = render(frames, VIDEO_SIZE, output=os.path.join(root, 'timelapse.mp4'))
+            print(f"  ffmpeg video, {os.cpu_count()} workers: {result['fps']:.1f} frames/s")
+        else:
+            print("  ffmpeg not installed, skipping the video")
@@ -0,0 +1,90 @@
+# benchmarks/bench_stacking.py
+#
+# Stacks synthetic night bursts with known shifts between the exposures, and
+# reports per size and method:
+#
+# - the alignment error against the known shifts, in pixels
+# - the time to align and to stack a burst
+# - the noise of the stacked frame against one exposure of the burst brightened as much
+# - the peak memory allocated while stacking, on top of the burst itself
+#
+# Run from the project folder:
+#     python3 -m benchmarks.bench_stacking [frames] [chunk rows]
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+from src.image.stacking import align_burst, linear_to_srgb, srgb_to_linear, stack_frames
+
+SIZES = {'1080p': (1920, 1080), '4K': (3840, 2160)}
+
+# Sensor noise of one exposure, in 8-bit levels
+NOISE = 12.0
+
+# Largest shift between the exposures, in pixels
+MAX_SHIFT = 24
+
+def synthetic_scene(size, margin, rng):
+    """
+    Returns a dark scene with some structure, larger than size by margin on every side, as float32.
+    """
+    width, height = size[0] + 2 * margin, size[1] + 2 * margin
+    blocks = rng.random((height // 8 + 1, width // 8 + 1), dtype=np.float32) * 60
+    scene = np.repeat(np.repeat(blocks, 8, axis=0), 8, axis=1)[:height, :width]
+    scene += np.linspace(0, 40, width, dtype=np.float32)
+    return np.repeat(scene[:, :, None], 3, axis=2)
+
+def synthetic_burst(size, frames, rng):
+    """
+    Returns the exposures of a burst, the clean reference exposure and the true shifts.
+
+    Every exposure is the scene moved by a random shift, at 1/frames of the light
+    like a burst splitting one long exposure, with the same read noise.
+    """
+    scene = synthetic_scene(size, MAX_SHIFT, rng)
+    width, height = size
+    shifts = [(0, 0)] + [tuple(int(value) for value in rng.integers(-MAX_SHIFT, MAX_SHIFT + 1, 2)) for _ in range(frames - 1)]
+    burst = []
+    for dy, dx in shifts:
+        crop = scene[MAX_SHIFT - dy:MAX_SHIFT - dy + height, MAX_SHIFT - dx:MAX_SHIFT - dx + width]
+        exposure = linear_to_srgb(srgb_to_linear(crop) / frames) + rng.normal(0, NOISE / frames, crop.shape).astype(np.float32)
+        burst.append(np.clip(exposure + 0.5, 0, 255).astype(np.uint8))
+    clean = scene[MAX_SHIFT:MAX_SHIFT + height, MAX_SHIFT:MAX_SHIFT + width]
+    return burst, clean, shifts
+
+def noise_level(frame, clean, margin=MAX_SHIFT):
+    # Leave out the border, where the shifted exposures do not overlap
+    difference = frame[margin:-margin, margin:-margin].astype(np.float32) - clean[margin:-margin, margin:-margin]
+    return float(difference.std())
+
+def bench(size, frames, chunk_rows, rng):
+    burst, clean, true_shifts = synthetic_burst(size, frames, rng)
+
+    start = time.perf_counter()
+    shifts = align_burst(burst, max_shift=2 * MAX_SHIFT)
+    align_time = time.perf_counter() - start
+    errors = [max(abs(shift[0] - true[0]), abs(shift[1] - true[1])) if shift else float('inf')
+              for shift, true in zip(shifts, true_shifts)]
+
+    # One exposure of the burst with the same gain, for the noise comparison
+    single = stack_frames(burst[:1], gain=frames)
+    print(f"{len(burst)} exposures, {size[0]}x{size[1]}: alignment {align_time * 1000:.0f} ms, "
+          f"max error {max(errors):.0f} px, noise of a single exposure {noise_level(single, clean):.2f}")
+
+    for method in ('mean', 'median'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        stacked = stack_frames(burst, shifts, method=method, gain=frames, chunk_rows=chunk_rows)
+        duration = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {method:<7} stack {duration * 1000:7.0f} ms  noise {noise_level(stacked, clean):5.2f}  "
+              f"peak memory {peak / 1e6:6.1f} MB (burst {sum(frame.nbytes for frame in burst) / 1e6:.0f} MB)")
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    chunk_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    rng = np.random.default_rng(0)
+    for size in SIZES.values():
+        bench(size, frames, chunk_rows, rng)
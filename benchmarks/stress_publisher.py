@@ -0,0 +1,92 @@
+# benchmarks/stress_publisher.py
+#
+# Publishes frames as fast as possible while reader processes keep opening the
+# status file, like web clients polling status.jpg. Every read must find the
+# file and get a complete JPEG. Runs the old remove-then-symlink path with a
+# plain write, then the atomic publisher, and prints the failed reads of each.
+#
+# Run from the project folder:
+#     python3 -m benchmarks.stress_publisher [seconds] [readers]
+
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from benchmarks.bench_overlay import synthetic_frame
+from src.pipeline.publisher import recent_path, replace_symlink, rotate_recent, save_atomic
+
+RECENT = 5
+
+def legacy_publish(data, file_name, status_file):
+    with open(file_name, 'wb') as file:
+        file.write(data)
+    if os.path.islink(status_file) or os.path.exists(status_file):
+        os.remove(status_file)
+    os.symlink(file_name, status_file)
+
+def atomic_publish(data, file_name, status_file):
+    save_atomic(file_name, lambda file: file.write(data), fsync='none')
+    replace_symlink(status_file, file_name)
+    rotate_recent(os.path.join(os.path.dirname(status_file), 'recent'), file_name, RECENT)
+
+def read_loop(paths, stop, results):
+    missing = partial = reads = 0
+    while not stop.is_set():
+        for path in paths:
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+            except FileNotFoundError:
+                missing += 1
+                continue
+            reads += 1
+            if not (data.startswith(b'\xff\xd8') and data.rstrip(b'\0').endswith(b'\xff\xd9')):
+                partial += 1
+    results.put((reads, missing, partial))
+
+def run(publish, directory, seconds, readers, frames, watch_recent):
+    status_file = os.path.join(directory, 'status.jpg')
+    for number in range(RECENT):
+        # Fill the ring before the readers start
+        publish(frames[0], os.path.join(directory, f'frame_{number}.jpg'), status_file)
+    paths = [status_file]
+    if watch_recent:
+        paths += [recent_path(os.path.join(directory, 'recent'), number) for number in range(1, RECENT + 1)]
+
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=read_loop, args=(paths, stop, results)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+
+    published = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        # Reuse a few file names, like the overlay pass rewriting the same image
+        publish(frames[published % len(frames)], os.path.join(directory, f'frame_{published % (RECENT + 2)}.jpg'), status_file)
+        published += 1
+
+    stop.set()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    reads, missing, partial = (sum(values) for values in zip(*totals))
+    return published, reads, missing, partial
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    frames = []
+    for seed in range(2):
+        buffer = io.BytesIO()
+        synthetic_frame((1920, 1080), seed).save(buffer, 'JPEG', quality=85)
+        frames.append(buffer.getvalue())
+
+    for name, publish, watch_recent in (('remove + symlink', legacy_publish, False), ('atomic publisher', atomic_publish, True)):
+        with tempfile.TemporaryDirectory() as directory:
+            published, reads, missing, partial = run(publish, directory, seconds, readers, frames, watch_recent)
+        print(f"{name:<18} {published:6d} frames published, {reads:8d} reads, "
+              f"{missing} not found, {partial} partial")
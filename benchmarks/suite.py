@@ -0,0 +1,286 @@
+# benchmarks/suite.py
+#
+# Runs the hardware-free benchmark suite on the fake camera backend and stores the
+# results in benchmarks/results/, so runs on other commits or machines can be compared:
+#
+# - capture:   the full capture_image() flow at 1080p and 4K, per phase
+# - overlay:   compositing the overlay at 1080p and 4K
+# - encode:    JPEG encode time and size by quality and optimize
+# - scheduler: slot jitter of the capture loop, idle and with a busy encoder thread
+# - startup:   import time of the command line tools, from python3 -X importtime
+#
+# Run from the project folder:
+#     python3 -m benchmarks.suite
+#     python3 -m benchmarks.suite --only encode overlay --repeats 3
+#     python3 -m benchmarks.suite --compare latest
+
+import argparse
+import glob
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import yaml
+from src.camera.fake_camera import FakeRequest
+from src.config.settings import BASE_DIR, load_settings
+
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+SIZES = {'1080p': (1920, 1080), '4K': (3840, 2160)}
+
+# Modules run as commands, their import time is the startup time of the command
+STARTUP_MODULES = (
+    'run_timelapse', 'capture_image', 'render_timelapse', 'src.image.evaluate_light',
+    'src.catalog.capture_catalog', 'src.catalog.frame_stats_index', 'src.storage.retention', 'src.metrics.metrics',
+)
+
+# Noise on the synthetic frames, so they compress about like real photos
+NOISE = 8.0
+
+OVERLAY_DATA = {
+    'Iso': 1, 'Shutterspeed': None, 'Daylight': True, 'Quality': 85,
+    'camera_metadata': {
+        'Lux': 412.3, 'AnalogueGain': 1.0, 'DigitalGain': 1.0,
+        'ExposureTime': 2500, 'SensorTemperature': 41.0,
+    },
+}
+
+def bench_config(folder, size, frame_time=0.03):
+    """
+    Writes a config.yaml for the fake camera into folder, based on config_example.yaml, and loads it.
+
+    All output goes to folder, and frames are saved inline so every phase is timed in the caller.
+    """
+    with open(os.path.join(BASE_DIR, 'config_example.yaml')) as file:
+        raw = yaml.safe_load(file)
+    raw['camera_settings'].update({'backend': 'fake', 'settle_time': 0, 'metering_time': 0, 'main_size': list(size)})
+    raw['fake_camera'] = {'frame_time': frame_time, 'noise': NOISE}
+    raw['image_output'].update({'root_folder': os.path.join(folder, 'images'), 'status_file': os.path.join(folder, 'status.jpg')})
+    raw['pipeline'] = {'enabled': False}
+    raw['catalog'] = {'file': os.path.join(folder, 'captures.sqlite')}
+    raw['frame_stats'] = {'index_file': os.path.join(folder, 'frame_stats.sqlite')}
+    raw['overlay'] = {'enabled': True, 'locale': None, 'snapshot': False}
+    path = os.path.join(folder, 'config.yaml')
+    with open(path, 'w') as file:
+        yaml.safe_dump(raw, file)
+    return load_settings(path)
+
+def synthetic_frame(size):
+    return FakeRequest(size, {}, noise=NOISE).make_image()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def time_runs(function, repeats, setup=None):
+    """
+    Returns the durations of repeats calls, in milliseconds. setup() runs untimed before each call.
+    """
+    durations = []
+    for _ in range(repeats):
+        arguments = (setup(),) if setup else ()
+        start = time.perf_counter()
+        function(*arguments)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+def summarize(durations):
+    return {'p50_ms': percentile(durations, 0.5), 'p95_ms': percentile(durations, 0.95), 'max_ms': max(durations)}
+
+def bench_capture(repeats):
+    from capture_image import capture_image
+    from src.camera.camera_session import CameraSession
+    from src.catalog.capture_catalog import close_capture_catalogs
+    from src.metrics.metrics import get_metrics
+
+    results = {}
+    for name, size in SIZES.items():
+        with tempfile.TemporaryDirectory() as folder:
+            config = bench_config(folder, size)
+            session = CameraSession(config)
+            try:
+                capture_image(config, session=session, raise_errors=True)  # Opens and configures the camera
+                get_metrics().reset()
+                capture_image(config, session=session, raise_errors=True)
+                durations = time_runs(lambda: capture_image(config, session=session, raise_errors=True), repeats)
+            finally:
+                session.close()
+                close_capture_catalogs()
+        results[name] = summarize(durations)
+        for phase, stats in get_metrics().snapshot()['spans'].items():
+            if '.' not in phase:
+                results[name][f'{phase}_ms'] = stats['p50'] * 1000
+    return results
+
+def bench_overlay(repeats):
+    from src.overlay.add_image_overlay import OverlayRenderer
+
+    results = {}
+    renderer = OverlayRenderer("Benchmark", lens_position=0.0)
+    for name, size in SIZES.items():
+        frame = synthetic_frame(size)
+        renderer.render(frame.copy(), OVERLAY_DATA)
+        # render() works in place, so every run gets its own copy of the frame
+        results[name] = summarize(time_runs(lambda image: renderer.render(image, OVERLAY_DATA), repeats, setup=frame.copy))
+    return results
+
+def bench_encode(repeats):
+    results = {}
+    for name, size in SIZES.items():
+        frame = synthetic_frame(size)
+        for quality in (75, 85, 95):
+            for optimize in (False, True):
+                def encode():
+                    buffer = io.BytesIO()
+                    frame.save(buffer, "JPEG", quality=quality, optimize=optimize)
+                    return buffer.tell()
+                durations = time_runs(encode, repeats)
+                results[f"{name} q{quality}{' optimize' if optimize else ''}"] = {
+                    'p50_ms': percentile(durations, 0.5), 'size_mb': encode() / 1e6,
+                }
+    return results
+
+def bench_scheduler(repeats, interval=0.05):
+    from src.timelapse.scheduler import Scheduler
+
+    def run(slots):
+        scheduler = Scheduler(interval, align=True)
+        rng = random.Random(0)
+        for _ in range(slots):
+            scheduler.next_slot()
+            time.sleep(rng.uniform(0, interval / 2))  # The capture
+        stats = scheduler.stats()
+        return {
+            'jitter_p50_ms': stats['jitter_p50'] * 1000, 'jitter_p95_ms': stats['jitter_p95'] * 1000,
+            'jitter_max_ms': stats['jitter_max'] * 1000, 'missed': stats['missed'],
+        }
+
+    slots = max(repeats * 10, 50)
+    results = {'idle': run(slots)}
+
+    # Encode 4K frames in another thread meanwhile, like the save pipeline
+    stop = threading.Event()
+    frame = synthetic_frame(SIZES['4K'])
+    def encode_loop():
+        while not stop.is_set():
+            frame.save(io.BytesIO(), "JPEG", quality=85)
+    encoder = threading.Thread(target=encode_loop, daemon=True)
+    encoder.start()
+    try:
+        results['busy encoder'] = run(slots)
+    finally:
+        stop.set()
+        encoder.join()
+    return results
+
+def import_time(module):
+    """
+    Returns the time to import a module in a fresh interpreter, in milliseconds, from -X importtime.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=BASE_DIR, capture_output=True, text=True, check=True)
+    total = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if line.startswith('import time:') and fields[0].split(':')[1].strip().isdigit():
+            total += int(fields[0].split(':')[1])
+    return total / 1000
+
+def bench_startup(repeats):
+    results = {}
+    for module in STARTUP_MODULES:
+        durations = [import_time(module) for _ in range(max(repeats // 2, 3))]
+        results[module] = {'import_ms': statistics.median(durations)}
+    return results
+
+BENCHMARKS = {
+    'capture': bench_capture,
+    'overlay': bench_overlay,
+    'encode': bench_encode,
+    'scheduler': bench_scheduler,
+    'startup': bench_startup,
+}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(results):
+    """
+    Returns {'case / name / metric': value} for comparing two runs.
+    """
+    return {f"{case} / {name} / {metric}": value
+            for case, entries in results.items() for name, metrics in entries.items() for metric, value in metrics.items()}
+
+def latest_result(exclude=None):
+    paths = [path for path in sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json'))) if path != exclude]
+    return paths[-1] if paths else None
+
+def print_comparison(run, baseline):
+    """
+    Prints every metric of the run next to the baseline run, with the change in percent.
+    """
+    print(f"\nCompared with {baseline.get('commit')} from {baseline['time']} on {baseline['machine']}:")
+    previous = flatten(baseline['results'])
+    for key, value in flatten(run['results']).items():
+        if key not in previous:
+            continue
+        before = previous[key]
+        change = f"{(value - before) / before * 100:+7.1f} %" if before else "        "
+        print(f"  {key:<52} {before:10.2f} -> {value:10.2f}  {change}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the hardware-free benchmark suite.")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument('--repeats', type=int, default=10, help="Timed runs per measurement")
+    parser.add_argument('--compare', help="An earlier results file, or 'latest'")
+    parser.add_argument('--no-save', action='store_true', help="Do not store the results")
+    arguments = parser.parse_args()
+
+    # The log lines of every captured frame would bury the results
+    logging.disable(logging.INFO)
+
+    run = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'machine': platform.node(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'repeats': arguments.repeats,
+        'results': {},
+    }
+    for case in arguments.only or BENCHMARKS:
+        start = time.perf_counter()
+        run['results'][case] = BENCHMARKS[case](arguments.repeats)
+        print(f"{case} ({time.perf_counter() - start:.1f} s)")
+        for name, metrics in run['results'][case].items():
+            print(f"  {name:<28} " + "  ".join(f"{metric} {value:.2f}" for metric, value in metrics.items()))
+
+    path = None
+    if not arguments.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{run['commit'] or 'unknown'}.json")
+        with open(path, 'w') as file:
+            json.dump(run, file, indent=2)
+        print(f"\nResults saved to {path}")
+
+    if arguments.compare:
+        baseline_path = latest_result(exclude=path) if arguments.compare == 'latest' else arguments.compare
+        if baseline_path is None:
+            print("No earlier results to compare with.")
+        else:
+            with open(baseline_path) as file:
+                print_comparison(run, json.load(file))
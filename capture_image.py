@@ -1,141 +1,397 @@
-import json
 import os
 import time
-import yaml
-from src.log.logger import get_logger, log, log_warning, log_error
+from src.config.settings import ConfigError, get_settings
+from src.log.logger import get_frame_id, get_logger, log, log_warning, log_error, reset_frame_id, set_frame_id
 from src.image.evaluate_light import evaluate_light
-from picamera2 import Picamera2
-from src.image.configure_camera import configure_camera
+from src.camera.camera_session import CameraSession
+from src.image.configure_camera import build_camera_controls
 from datetime import datetime
-from src.overlay.add_image_overlay import overlay_image_with_text
+from src.overlay.add_image_overlay import overlay_image
+from src.overlay.add_to_overlay_data import write_json_atomic
+from src.overlay.frame_context import FrameContext
+from src.pipeline.save_pipeline import FrameJob
+from src.pipeline.publisher import replace_symlink, rotate_recent, save_atomic
+from src.image.frame_stats import compute_frame_stats
+from src.catalog.frame_stats_index import get_frame_stats_index
+from src.catalog.capture_catalog import capture_entry, get_capture_catalog
+from src.image.deflicker import get_deflicker
+from src.image.derivatives import derivative_status_file, start_derivatives
+from src.image.stacking import burst_controls, burst_size, stack_burst
+from src.image.hdr import bracket_stops, capture_bracket, fuse_bracket
+from src.metrics.metrics import REPORT_ENV, get_metrics, write_report
+from src.timelapse.scheduler import CAPTURE_TIME_ENV
 
 # Set the config path
 BASE_PATH = os.path.dirname(__file__) 
-CONFIG_FILE = os.path.join(BASE_PATH, 'config.yaml')
 METADATA_FILE = os.path.join(BASE_PATH, 'data', 'capture_metadata.json')
 
+# Frame IDs in the logs are the capture time, e.g. 20240601T120000
+FRAME_ID_FORMAT = '%Y%m%dT%H%M%S'
+
 # Create a logger instance for capture_image.py
 logger = get_logger('capture_image.log', echo_to_console=True)
 
-def read_config(config_path=CONFIG_FILE):
+def save_metadata(metadata):
     """
-    Reads the configuration from a YAML file.
-    
+    Saves the captured metadata to a JSON file.
+
     Parameters:
-        config_path (str): The path to the configuration file.
-    
+        metadata (dict): The metadata dictionary to save.
+    """
+    try:
+        write_json_atomic(METADATA_FILE, metadata)
+        # print(f"Metadata saved to {METADATA_FILE}")
+    except Exception as e:
+        log_error(logger, f"Error saving metadata: {e}")
+        
+def record_capture(job, encode_time):
+    """
+    Records a saved frame in the capture catalog, or in capture_metadata.json if the catalog is disabled.
+
+    Parameters:
+        job (FrameJob): The saved frame.
+        encode_time (float): Seconds spent encoding and writing the image.
+    """
+    catalog = get_capture_catalog(job.config)
+    if catalog is None:
+        save_metadata(job.metadata)
+        return
+    try:
+        timestamp = (job.capture_time or datetime.now()).timestamp()
+        file_size = os.path.getsize(job.file_name)
+        catalog.record(capture_entry(timestamp, job.file_name, job.metadata, file_size, encode_time))
+    except Exception as e:
+        log_error(logger, f"Error recording the capture: {e}")
+
+def save_frame_stats(job):
+    """
+    Computes the brightness, sharpness and colour stats of a frame and appends them to the frame stats index.
+
+    Parameters:
+        job (FrameJob): The captured frame, before the overlay is added.
+
     Returns:
-        dict: The configuration dictionary.
+        dict: The stats, or None if they could not be computed.
     """
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r') as file:
-                config = yaml.safe_load(file)
-                log(logger, f"Configuration loaded from {config_path}")
-                return config
-        except yaml.YAMLError as e:
-            log_error(logger, f"Error parsing configuration file: {e}")
+    frame_stats = job.config['frame_stats']
+    try:
+        stats = compute_frame_stats(job.image, frame_stats['max_width'])
+        timestamp = (job.capture_time or datetime.now()).timestamp()
+        get_frame_stats_index(frame_stats['index_file']).add(timestamp, job.file_name, stats)
+        return stats
+    except Exception as e:
+        log_error(logger, f"Error saving frame stats: {e}")
+        return None
+
+def record_phase(timings, phase, start_time):
+    """
+    Records the time spent in a capture phase, in the timings and as a span of the shared metrics.
+
+    Parameters:
+        timings (dict): The dictionary to record the phase duration in, or None to only record the span.
+        phase (str): The name of the phase.
+        start_time (float): The time.monotonic() value when the phase started.
+
+    Returns:
+        float: The time.monotonic() value when the phase ended, to start the next phase from.
+    """
+    end_time = time.monotonic()
+    get_metrics().observe(phase, end_time - start_time)
+    if timings is not None:
+        timings[phase] = end_time - start_time
+    return end_time
+
+def save_image(image, file_name, config):
+    """
+    Encodes and saves an image with the quality settings from the config.
+
+    The image is written to a temporary file and renamed into place, so readers
+    never see a partially written image.
+
+    Parameters:
+        image (PIL.Image): The image to save.
+        file_name (str): The output path, its extension selects JPEG or PNG.
+        config (dict): The configuration dictionary.
+    """
+    camera_settings = config.get('camera_settings', {})
+    fsync = config.get('publish', {}).get('fsync', 'file')
+    if file_name.lower().endswith('.png'):
+        save_atomic(file_name, lambda file: image.save(file, "PNG", compress_level=camera_settings.get('compress_level', 6)), fsync)
     else:
-        log_error(logger, f"Configuration file {config_path} not found.")
-    
-    return {}
+        save_atomic(file_name, lambda file: image.save(
+            file, "JPEG",
+            quality=camera_settings.get('image_quality', 85),
+            optimize=config['image_output'].get('optimize', True)
+        ), fsync)
 
-def save_metadata(metadata):
+def update_status_symlink(config, file_name, symlink_path=None):
     """
-    Saves the captured metadata to a JSON file.
+    Points the status_file symlink at the latest image.
+
+    The symlink is replaced with an atomic rename, so the status file never
+    disappears for web clients.
 
     Parameters:
-        metadata (dict): The metadata dictionary to save.
+        config (dict): The configuration dictionary.
+        file_name (str): The path of the latest image.
+        symlink_path (str, optional): The symlink to update, image_output.status_file if None.
     """
+    symlink_path = symlink_path or config['image_output'].get('status_file')
+    if not symlink_path:
+        return
     try:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=4)
-        # print(f"Metadata saved to {METADATA_FILE}")
+        replace_symlink(symlink_path, file_name)
     except Exception as e:
-        log_error(f"Error saving metadata: {e}")
-        
-def capture_image(config):
+        log_error(logger, f"Error updating symlink: {e}")
+
+def update_recent_frames(config, file_name):
+    """
+    Adds the latest image to the ring of recent frames, if publish.recent is set.
+
+    Parameters:
+        config (Settings): The settings.
+        file_name (str): The path of the latest image.
+    """
+    publish = config['publish']
+    if not publish['recent']:
+        return
+    directory = publish['recent_dir']
+    if not directory:
+        status_file = config['image_output'].get('status_file')
+        if not status_file:
+            return
+        directory = os.path.join(os.path.dirname(status_file), 'recent')
     try:
-        log(logger, "Starting image capture...")
+        rotate_recent(directory, file_name, publish['recent'], os.path.splitext(file_name)[1].lstrip('.'))
+    except Exception as e:
+        log_error(logger, f"Error updating the recent frames: {e}")
+
+def process_frame(job, timings=None, is_latest=None):
+    """
+    Stacks a night burst or fuses an HDR bracket, indexes the frame stats, deflickers the frame, adds the overlay, saves the frame and its derivatives, writes the metadata and updates the status symlink.
+
+    Runs inline in capture_image(), or in a SavePipeline worker thread.
 
-        # Get the Lux reading without passing picam2
-        lux = evaluate_light()
-        log(logger, f"Lux value: {lux}")
+    Parameters:
+        job (FrameJob): The captured frame.
+        timings (dict, optional): If set, the duration of each stage is recorded in it (seconds).
+        is_latest (callable, optional): Returns False if a newer frame was already published,
+            so the status symlink is not moved back to an older frame.
+    """
+    # In a pipeline worker thread the log records get the frame ID of the job
+    frame_token = set_frame_id(job.frame_id)
+    try:
+        _process_frame(job, timings, is_latest)
+    finally:
+        reset_frame_id(frame_token)
 
-        # Initialize the camera
-        picam2 = Picamera2()
-        log(logger, "Camera initialized.")
+def _process_frame(job, timings, is_latest):
+    phase_start = time.monotonic()
 
-        # Configure the camera
-        still_config = configure_camera(picam2, config, lux)
-        
-        picam2.configure(still_config)
-        log(logger, "Camera configured for still capture.")
+    # Stack a night burst into one frame, in a pipeline worker this overlaps the next burst
+    if job.burst is not None:
+        job.image = stack_burst(job.burst, job.config)
+        job.burst = None
+        phase_start = record_phase(timings, 'stack', phase_start)
 
-        # Start the camera
-        picam2.start()
-        log(logger, "Camera started for image capture.")
+    # Fuse an HDR bracket into one frame, the tiles are fused in parallel
+    if job.bracket is not None:
+        job.image = fuse_bracket(job.bracket, job.config)
+        job.bracket = None
+        phase_start = record_phase(timings, 'fuse', phase_start)
 
-        # Allow time for auto exposure to adjust
-        time.sleep(2)  # Increase if necessary
+    # Stats of the frame as captured, without the overlay
+    stats = None
+    if job.config['frame_stats']['enabled']:
+        stats = save_frame_stats(job)
+        phase_start = record_phase(timings, 'stats', phase_start)
 
-        # # Optionally, capture and discard initial frames
-        # for _ in range(3):
-        #     picam2.capture_request().release()
+    # Even out the brightness steps between frames, before the overlay is drawn on top
+    image = job.image
+    if job.config['deflicker']['enabled']:
+        image = get_deflicker(job.config, job.file_name).correct(image, luma=stats['mean_luma'] if stats else None)
+        phase_start = record_phase(timings, 'deflicker', phase_start)
+
+    # Composite the overlay on the in-memory frame, so the image is only encoded once
+    if job.config.get('overlay', {}).get('enabled', True):
+        image = overlay_image(image, overlay_data=job.overlay_data, config=job.config, capture_time=job.capture_time)
+    phase_start = record_phase(timings, 'overlay', phase_start)
+
+    # Scale and save the smaller versions in other threads while the full-size image is encoded
+    derivatives = start_derivatives(image, job.file_name, job.config) if job.config['derivatives']['enabled'] else []
+
+    # Save the image file
+    save_image(image, job.file_name, job.config)
+    log(logger, "Image saved to %s", job.file_name)
+    encode_time = time.monotonic() - phase_start
+    phase_start = record_phase(timings, 'save', phase_start)
+
+    saved_derivatives = []
+    for name, path, future in derivatives:
+        try:
+            duration = future.result()
+            saved_derivatives.append((name, path))
+            get_metrics().observe(f'derivative_{name}', duration)
+            if timings is not None:
+                timings[f'derivative_{name}'] = duration
+        except Exception as e:
+            log_error(logger, f"Error saving the {name} derivative: {e}")
+    if derivatives:
+        phase_start = record_phase(timings, 'derivatives', phase_start)
+
+    # Only the newest frame may update the files that point at the latest frame
+    latest = is_latest is None or is_latest()
+
+    record_capture(job, encode_time)
+    if latest and job.config.get('overlay', {}).get('snapshot', True):
+        # Snapshot of the overlay data for external readers
+        FrameContext(job.overlay_data).snapshot()
+    phase_start = record_phase(timings, 'metadata', phase_start)
+
+    # Create or update symlink to the latest image
+    if latest:
+        update_status_symlink(job.config, job.file_name)
+        update_recent_frames(job.config, job.file_name)
+        status_file = job.config['image_output'].get('status_file')
+        for name, path in saved_derivatives:
+            if status_file:
+                update_status_symlink(job.config, path, derivative_status_file(status_file, name))
+    record_phase(timings, 'symlink', phase_start)
+
+def capture_image(config, timings=None, raise_errors=False, session=None, pipeline=None, capture_time=None, exposure_engine=None, histogram_exposure=None):
+    """
+    Captures a single image, adds the overlay and updates the status symlink.
 
-        now = datetime.now()
+    Parameters:
+        config (dict): The configuration dictionary.
+        timings (dict, optional): If set, the duration of each capture phase is recorded in it (seconds).
+        raise_errors (bool): Re-raise errors after logging them, so a caller can count failed frames.
+        session (CameraSession, optional): A camera session that stays open between frames.
+            If None, a session is opened for this frame and closed afterwards.
+        pipeline (SavePipeline, optional): If set, the frame is queued for saving in the
+            background and this function returns as soon as the sensor capture is done.
+        capture_time (datetime, optional): The scheduled time of the frame, used for the
+            folder and file name. Defaults to now.
+        exposure_engine (ExposureEngine, optional): Keeps the exposure smoothing and
+            day/night hysteresis across frames.
+        histogram_exposure (HistogramExposure, optional): Measures the night frames' lores
+            histogram to set the next frame's exposure.
+
+    Returns:
+        str: The path of the image, or None if the capture failed or the frame was dropped.
+    """
+    phase_start = time.monotonic()
+    frame_token = set_frame_id((capture_time or datetime.now()).strftime(FRAME_ID_FORMAT))
+    own_session = session is None
+    if own_session:
+        session = CameraSession(config)
+    try:
+        log(logger, "Starting image capture...")
+
+        # Get the Lux reading from the same camera session
+        context = FrameContext()
+        lux = evaluate_light(session=session, context=context, config=config)
+        log(logger, "Lux value: %s", lux)
+        phase_start = record_phase(timings, 'evaluate_light', phase_start)
+
+        # Apply the controls, the camera is only reconfigured if the stream changed
+        controls = build_camera_controls(config, lux, context, exposure_engine, histogram_exposure)
+        # A long night exposure can be split into a burst of shorter ones that are stacked
+        stack_count = burst_size(config, controls)
+        if stack_count > 1:
+            controls = burst_controls(controls, stack_count)
+        stops = bracket_stops(config, stack_count)
+        context.set('HDR', bool(stops))
+        session.apply(config, controls)
+        phase_start = record_phase(timings, 'configure', phase_start)
+
+        now = capture_time or datetime.now()
         dir_name = os.path.join(config['image_output']['root_folder'], now.strftime(config['image_output']['folder_structure']))
         os.makedirs(dir_name, exist_ok=True)
         time_format = config['image_output'].get('filename_time_format', '%Y_%m_%d_%H_%M_%S')
         file_name = os.path.join(dir_name, f"{config['image_output']['filename_prefix']}{now.strftime(time_format)}.{config['image_output']['image_extension']}")
 
         # Capture request and metadata
-        request = picam2.capture_request()
-        if request:
-            image = request.make_image("main")
+        request = session.capture_request()
+        if not request:
+            raise ValueError("Failed to capture request, request is None")
+        try:
+            # The exposures of a burst or bracket are copied out and combined in process_frame()
+            frames = [request.make_array("main")] if stack_count > 1 or stops else None
+            image = request.make_image("main") if frames is None else None
             metadata = request.get_metadata()
+            if histogram_exposure is not None and not context.get('Daylight'):
+                # Measure the lores stream in place, before the buffers are returned to the camera
+                histogram_exposure.measure(request, metadata, stack_gain=stack_count)
+        finally:
+            # Always return the buffers, or the camera runs out of them
             request.release()
-            save_metadata(metadata)
-        else:
-            raise ValueError("Failed to capture request, request is None")
-        
-        # Save the image file
-        image.save(file_name)
-        log(logger, f"Image saved to {file_name}")
+        for _ in range(stack_count - 1):
+            request = session.capture_request()
+            if not request:
+                raise ValueError("Failed to capture burst request, request is None")
+            try:
+                frames.append(request.make_array("main"))
+            finally:
+                request.release()
+        if stack_count > 1:
+            metadata = dict(metadata, StackedFrames=stack_count)
+            log(logger, "Captured a burst of %d exposures of %d µs.", stack_count, controls['ExposureTime'])
+        if stops:
+            # The normal frame's metadata stays the frame's metadata, the bracket is around it
+            frames.extend(capture_bracket(session, config, controls, metadata, stops))
+            metadata = dict(metadata, HdrStops=[0] + stops)
+        phase_start = record_phase(timings, 'capture', phase_start)
 
-        # Stop the camera after capturing the image
-        picam2.stop()
-        log(logger, "Camera stopped after image capture.")
+        # Show the metadata of this frame in the overlay
+        context.add_camera_metadata(metadata)
+        job = FrameJob(config, image, metadata, file_name, overlay_data=context.as_overlay_data(), capture_time=now,
+                       frame_id=get_frame_id(), burst=frames if stack_count > 1 else None,
+                       bracket=frames if stops else None)
 
-        overlay_image_with_text(file_name, output_image_path=file_name)
+        if pipeline is not None:
+            if not pipeline.submit(job):
+                return None
+            record_phase(timings, 'submit', phase_start)
+        else:
+            process_frame(job, timings)
 
-        # Update symlink to the latest image
-        # Create or update symlink to the latest image
-        symlink_path = config['image_output']['status_file']
-        try:
-            if os.path.islink(symlink_path) or os.path.exists(symlink_path):
-                os.remove(symlink_path)
-            os.symlink(file_name, symlink_path)
-
-        except Exception as e:
-            log_error(f"Error updating symlink: {e}")
-            if logger:
-                log(logger, f"Error updating symlink: {e}")   
+        return file_name
 
     except Exception as e:
         log_error(logger, f"Error during image capture: {e}")
+        if not own_session:
+            # Reopen the camera on the next frame in case it is in a bad state
+            session.close()
+        if raise_errors:
+            raise
+        return None
+
+    finally:
+        if own_session:
+            session.close()
+        reset_frame_id(frame_token)
         
 if __name__ == "__main__":
     try:
-        # Load the configuration
-        config = read_config()
+        # Load the configuration, fails fast on missing or invalid settings
+        config = get_settings()
+        log(logger, f"Configuration loaded from {config.path}")
 
-        # If the config is empty, warn the user and use defaults
-        if not config:
-            log_warning(logger, "Configuration is empty or missing, using default settings.")
+        # In subprocess mode, the frame is named after its scheduled slot, not the start of this process
+        capture_time = os.environ.get(CAPTURE_TIME_ENV)
+        capture_time = datetime.fromtimestamp(float(capture_time)) if capture_time else None
 
         # Capture the image with the loaded configuration
-        capture_image(config)
-        
+        try:
+            capture_image(config, capture_time=capture_time)
+        finally:
+            # In subprocess mode, the timelapse loop collects the phase timings of this process
+            if os.environ.get(REPORT_ENV):
+                write_report(os.environ[REPORT_ENV])
+
+    except ConfigError as e:
+        log_error(logger, f"Invalid configuration: {e}")
+        raise SystemExit(1)
     except Exception as e:
         log_error(logger, f"Fatal error in main execution: {e}")
@@ -0,0 +1,89 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+from src.config.settings import ConfigError, load_settings
+from src.log.logger import get_logger, log, log_error
+logger = get_logger('render_timelapse.log', echo_to_console=True)
+
+def parse_size(value):
+    """
+    Parses a video size like "1920x1080".
+    """
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Render the captured frames of a time range into a timelapse video.")
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(__file__), 'config.yaml'))
+    parser.add_argument('--day', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        help="Render one day, like 2024-06-15")
+    parser.add_argument('--start', type=datetime.fromisoformat, help="Start of the range, like 2024-06-15T04:00")
+    parser.add_argument('--end', type=datetime.fromisoformat, help="End of the range, default now")
+    parser.add_argument('--output', help="The video file, encoded with ffmpeg")
+    parser.add_argument('--frames-dir', help="Write numbered JPEG frames here instead of a video")
+    parser.add_argument('--fps', type=float)
+    parser.add_argument('--size', type=parse_size, help="Video size, like 1920x1080")
+    parser.add_argument('--workers', type=int, help="Decoding processes, default the number of CPUs")
+    parser.add_argument('--min-luma', type=float, help="Skip frames darker than this (0-255)")
+    parser.add_argument('--min-sharpness', type=float, help="Skip frames less sharp than this")
+    parser.add_argument('--max-highlights', type=float, help="Skip frames with a larger fraction of clipped pixels")
+    parser.add_argument('--deflicker', action='store_true', help="Even out the brightness between frames")
+    parser.add_argument('--deflicker-window', type=int, help="Frames in the deflicker window, default deflicker.window")
+    arguments = parser.parse_args()
+    if not arguments.output and not arguments.frames_dir:
+        parser.error("one of --output or --frames-dir is required")
+    return arguments
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    # Imported after the arguments are checked, so --help and usage errors need no PIL or numpy
+    from src.render.render_video import deflicker_frames, filter_by_stats, find_frames, render
+
+    try:
+        config = load_settings(arguments.config)
+    except ConfigError as e:
+        log_error(logger, f"Invalid configuration: {e}")
+        raise SystemExit(1)
+    render_config = config['render']
+
+    if arguments.day:
+        start, end = arguments.day, arguments.day + timedelta(days=1)
+    else:
+        end = arguments.end or datetime.now()
+        start = arguments.start or end - timedelta(days=1)
+
+    frames = find_frames(config, start, end)
+    log(logger, f"Found {len(frames)} frames between {start} and {end}.")
+    index = None
+    if config['frame_stats']['enabled']:
+        from src.catalog.frame_stats_index import get_frame_stats_index
+        index = get_frame_stats_index(config['frame_stats']['index_file'])
+    if index is not None and (arguments.min_luma is not None or arguments.min_sharpness is not None or arguments.max_highlights is not None):
+        frames = filter_by_stats(
+            frames, index,
+            min_luma=arguments.min_luma, min_sharpness=arguments.min_sharpness, max_highlights=arguments.max_highlights,
+        )
+
+    luts = None
+    if arguments.deflicker:
+        luts = deflicker_frames(
+            frames, arguments.deflicker_window or config['deflicker']['window'], config['deflicker']['method'],
+            # Frames deflickered while capturing no longer have the luma of the index
+            workers=arguments.workers or render_config['workers'],
+            index=None if config['deflicker']['enabled'] else index,
+        )
+
+    result = render(
+        frames,
+        arguments.size or render_config['size'],
+        output=arguments.output,
+        frames_dir=arguments.frames_dir,
+        fps=arguments.fps or render_config['fps'],
+        workers=arguments.workers or render_config['workers'],
+        codec=render_config['codec'],
+        crf=render_config['crf'],
+        quality=render_config['quality'],
+        luts=luts,
+    )
+    print(f"{result['frames']} frames in {result['seconds']:.1f} s ({result['fps']:.1f} frames/s)")
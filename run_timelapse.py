@@ -1,44 +1,378 @@
 import os
 import subprocess
 import time
-import yaml
+from src.config.settings import ConfigError, load_settings
 from src.log.logger import get_logger, log, log_warning, log_error
 logger = get_logger('run_timelapse.log', echo_to_console=True)
 
 def load_config(config_path):
     """
-    Loads the configuration from a YAML file.
+    Loads and validates the configuration from a YAML file.
 
     Parameters:
         config_path (str): Path to the config.yaml file.
 
     Returns:
-        dict: The configuration dictionary.
+        Settings: The immutable settings.
+
+    Raises:
+        ConfigError: If the file is missing or has invalid values.
+    """
+    return load_settings(config_path)
+
+def format_timings(timings):
+    """
+    Formats per-phase capture timings for a log line.
+
+    Parameters:
+        timings (dict): Phase name to duration in seconds.
+
+    Returns:
+        str: The timings, like "evaluate_light=1.02s, capture=0.31s".
+    """
+    return ", ".join(f"{phase}={duration:.2f}s" for phase, duration in timings.items())
+
+def format_pipeline_stats(stats):
+    """
+    Formats save pipeline statistics for a log line.
+
+    Parameters:
+        stats (dict): The result of SavePipeline.stats().
+
+    Returns:
+        str: Queue depth, frame counters and the average latency of each stage.
+    """
+    stages = ", ".join(f"{stage}={values['avg']:.2f}s" for stage, values in stats['stages'].items())
+    return (f"queue depth {stats['queue_depth']} ({stats['queued_bytes'] / 1024 / 1024:.0f} MB), {stats['completed']} saved, "
+            f"{stats['dropped']} dropped, {stats['failed']} failed ({stages})")
+
+def create_pipeline(config, handler):
+    """
+    Creates the background save pipeline if it is enabled in the configuration.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        handler (callable): The function that processes each frame.
+
+    Returns:
+        SavePipeline: The pipeline, or None to save frames inline.
+    """
+    pipeline_config = config.get('pipeline', {})
+    if not pipeline_config.get('enabled', False):
+        return None
+
+    from src.pipeline.save_pipeline import SavePipeline
+    return SavePipeline(
+        handler,
+        workers=pipeline_config.get('workers', 1),
+        queue_size=pipeline_config.get('queue_size', 4),
+        policy=pipeline_config.get('policy', 'latest'),
+        max_bytes=int(pipeline_config['max_queue_mb'] * 1024 * 1024) or None,
+    )
+
+def run_subprocess_capture(slot=None):
+    """
+    Captures one frame by running capture_image.py in a fresh interpreter.
+
+    The subprocess names the frame after the slot's time, and reports its phase timings
+    and counters in a temporary file, which are merged into the metrics of this process.
+
+    Parameters:
+        slot (Slot, optional): The scheduled slot of the frame, the current time if None.
+    """
+    import tempfile
+    from src.metrics.metrics import REPORT_ENV, read_report
+    from src.timelapse.scheduler import CAPTURE_TIME_ENV
+
+    descriptor, report = tempfile.mkstemp(prefix='timelapse-metrics-', suffix='.json')
+    os.close(descriptor)
+    env = dict(os.environ, **{REPORT_ENV: report})
+    if slot is not None:
+        env[CAPTURE_TIME_ENV] = repr(slot.wall_time)
+    try:
+        script_path = os.path.join(os.path.dirname(__file__), 'capture_image.py')
+        subprocess.run(['python3', script_path], check=True, env=env)
+    except subprocess.CalledProcessError as e:
+        log(logger, f"Error during image capture: {e}")
+    finally:
+        read_report(report)
+        os.remove(report)
+
+def apply_config_changes(config, changes, session, pipeline, handler):
+    """
+    Applies reloaded settings at a frame boundary.
+
+    Exposure, overlay and output settings are read from the config for every frame, so
+    they need nothing here. The camera is only reopened when a session setting such as
+    the backend changed; a new main_size is handled by CameraSession.apply() with a
+    reconfigure. The save pipeline is recreated when its settings changed.
+
+    Parameters:
+        config (Settings): The new settings.
+        changes (dict): The changed settings, from diff_settings().
+        session (CameraSession): The current camera session.
+        pipeline (SavePipeline): The current save pipeline, or None.
+        handler (callable): The function that processes each frame in the pipeline.
+
+    Returns:
+        tuple: The camera session and save pipeline to use from now on.
+    """
+    from src.camera.camera_session import CameraSession
+    from src.config.watcher import SESSION_KEYS, changed_under
+
+    if changed_under(changes, SESSION_KEYS):
+        log(logger, "Camera session settings changed, reopening the camera.")
+        session.close()
+        session = CameraSession(config)
+
+    if changed_under(changes, ('pipeline',)):
+        log(logger, "Save pipeline settings changed, restarting the pipeline.")
+        if pipeline is not None:
+            pipeline.close()
+        pipeline = create_pipeline(config, handler)
+
+    return session, pipeline
+
+def create_scheduler(config, clock=None):
+    """
+    Creates the capture scheduler from the timelapse settings.
+
+    Parameters:
+        config (Settings): The settings.
+        clock (optional): The clock, e.g. a SimulatedClock. The real clock if None.
+
+    Returns:
+        Scheduler: The scheduler.
+    """
+    from src.timelapse.scheduler import Scheduler
+
+    timelapse = config['timelapse']
+    return Scheduler(
+        timelapse['interval'],
+        policy=timelapse['schedule_policy'],
+        max_lateness=timelapse['max_lateness'],
+        max_catch_up=timelapse['max_catch_up'],
+        align=timelapse['align'],
+        clock=clock,
+    )
+
+def update_scheduler(scheduler, config, changes):
     """
-    with open(config_path, 'r') as file:
-        return yaml.safe_load(file)
+    Applies changed timelapse settings to the running scheduler.
+
+    The policy is changed in place and a new interval re-anchors the schedule from
+    the next slot, keeping the missed-slot and jitter stats. Only a change of align
+    needs a new scheduler.
+
+    Parameters:
+        scheduler (Scheduler): The running scheduler.
+        config (Settings): The new settings.
+        changes (dict): The changed settings, from diff_settings().
+
+    Returns:
+        Scheduler: The updated scheduler, or a new one.
+    """
+    from src.config.watcher import changed_under
+
+    timelapse = config['timelapse']
+    if changed_under(changes, ('timelapse.align',)):
+        return create_scheduler(config, clock=scheduler.clock)
+    scheduler.set_policy(timelapse['schedule_policy'], timelapse['max_lateness'], timelapse['max_catch_up'])
+    if changed_under(changes, ('timelapse.interval',)):
+        scheduler.set_interval(timelapse['interval'])
+    return scheduler
+
+def start_retention(config):
+    """
+    Starts the background retention service if it is enabled in the configuration.
+
+    Parameters:
+        config (Settings): The settings.
+
+    Returns:
+        RetentionService: The running service, or None.
+    """
+    if not config['retention']['enabled']:
+        return None
+
+    from src.storage.retention import RetentionService
+    retention = RetentionService(config)
+    retention.start()
+    return retention
+
+def start_metrics(config):
+    """
+    Starts the metrics endpoint and stats file if they are enabled in the configuration.
+
+    Parameters:
+        config (Settings): The settings.
+
+    Returns:
+        MetricsService: The running service, or None.
+    """
+    if not config['metrics']['enabled']:
+        return None
+
+    from src.metrics.metrics import MetricsService
+    metrics = MetricsService(config)
+    metrics.start()
+    return metrics
+
+def format_scheduler_stats(stats):
+    """
+    Formats scheduler statistics for a log line.
+
+    Parameters:
+        stats (dict): The result of Scheduler.stats().
+
+    Returns:
+        str: Missed slots and jitter.
+    """
+    text = f"{stats['frames']} frames, {stats['missed']} missed slots"
+    if 'jitter_mean' in stats:
+        text += (f", jitter mean {stats['jitter_mean'] * 1000:.1f} ms, p95 {stats['jitter_p95'] * 1000:.1f} ms,"
+                 f" max {stats['jitter_max'] * 1000:.1f} ms")
+    return text
+
+def run_daemon(config):
+    """
+    Runs the timelapse as a long-lived capture engine.
+
+    Picamera2, PIL and the configuration are loaded once, and capture_image() is
+    called directly for every frame. The camera stays open and streaming between
+    frames. A failing frame is logged and counted but never stops the loop.
+    Changes to config.yaml are applied at the next frame boundary. Frames are
+    captured on wall-clock aligned slots, see Scheduler.
+
+    Parameters:
+        config (Settings): The settings.
+    """
+    # Imported here so the subprocess mode does not pay for picamera2 and PIL
+    from capture_image import capture_image, process_frame
+    from src.camera.camera_session import CameraSession
+    from src.config.watcher import ConfigWatcher, changed_under
+    from src.image.exposure_engine import ExposureEngine
+    from src.image.histogram_exposure import HistogramExposure
+    from src.metrics.metrics import get_metrics
+
+    watcher = ConfigWatcher(config)
+    exposure_engine = ExposureEngine(config)
+    histogram_exposure = HistogramExposure(config) if config['image']['exposure_mode'] == 'histogram' else None
+    session = CameraSession(config)
+    pipeline = create_pipeline(config, process_frame)
+    scheduler = create_scheduler(config)
+    retention = start_retention(config)
+    metrics = start_metrics(config)
+    frames = 0
+    dropped = 0
+    failures = 0
+    try:
+        while True:
+            # Pick up config changes between frames, never during a capture
+            new_config, changes = watcher.poll()
+            if new_config is not None:
+                config = new_config
+                session, pipeline = apply_config_changes(config, changes, session, pipeline, process_frame)
+                exposure_engine.reconfigure(config)
+                if config['image']['exposure_mode'] != 'histogram':
+                    histogram_exposure = None
+                elif histogram_exposure is None:
+                    histogram_exposure = HistogramExposure(config)
+                else:
+                    histogram_exposure.reconfigure(config)
+                if changed_under(changes, ('timelapse',)):
+                    scheduler = update_scheduler(scheduler, config, changes)
+                if changed_under(changes, ('retention', 'derivatives', 'image_output')):
+                    if retention is not None and config['retention']['enabled']:
+                        retention.update(config)
+                    else:
+                        if retention is not None:
+                            retention.stop()
+                        retention = start_retention(config)
+                if changed_under(changes, ('metrics',)):
+                    if metrics is not None:
+                        metrics.stop()
+                    metrics = start_metrics(config)
+
+            slot = scheduler.next_slot()
+            start_time = time.monotonic()
+            log(logger, "Starting a new capture cycle for slot %s (%.0f ms late).", slot.datetime.strftime("%H:%M:%S"), slot.lateness * 1000)
+
+            timings = {}
+            try:
+                file_name = capture_image(config, timings=timings, raise_errors=True, session=session, pipeline=pipeline, capture_time=slot.datetime,
+                                          exposure_engine=exposure_engine, histogram_exposure=histogram_exposure)
+                if file_name:
+                    frames += 1
+                    get_metrics().increment('frames_captured')
+                    log(logger, "Captured frame %d: %s", frames, file_name)
+                else:
+                    # The save pipeline was full and its policy dropped the frame
+                    dropped += 1
+                    get_metrics().increment('frames_dropped')
+                    log_warning(logger, "Frame dropped by the save pipeline (%d dropped so far).", dropped)
+            except Exception as e:
+                failures += 1
+                get_metrics().increment('frames_failed')
+                log_error(logger, f"Error during image capture ({failures} failed frames so far): {e}")
+
+            capture_duration = time.monotonic() - start_time
+            get_metrics().observe('cycle', capture_duration)
+            log(logger, "Capture took %.2f seconds (%s).", capture_duration, format_timings(timings))
+            log(logger, "Schedule: %s", format_scheduler_stats(scheduler.stats()))
+            if pipeline is not None:
+                log(logger, "Save pipeline: %s", format_pipeline_stats(pipeline.stats()))
+    finally:
+        session.close()
+        if pipeline is not None:
+            pipeline.close()
+        if retention is not None:
+            retention.stop()
+        if metrics is not None:
+            metrics.stop()
+
+def run_subprocess_loop(config):
+    """
+    Runs the timelapse by spawning capture_image.py for every frame.
+
+    Parameters:
+        config (Settings): The settings.
+    """
+    from src.metrics.metrics import get_metrics
+
+    scheduler = create_scheduler(config)
+    retention = start_retention(config)
+    metrics = start_metrics(config)
+    try:
+        while True:
+            slot = scheduler.next_slot()
+
+            # Start the timer to measure the time taken for capturing the image
+            start_time = time.monotonic()
+            log(logger, "Starting a new capture cycle for slot %s (%.0f ms late).", slot.datetime.strftime("%H:%M:%S"), slot.lateness * 1000)
+
+            run_subprocess_capture(slot)
+
+            # Calculate the time taken to capture the image
+            capture_duration = time.monotonic() - start_time
+            get_metrics().observe('cycle', capture_duration)
+            log(logger, f"Capture took {capture_duration:.2f} seconds. Schedule: {format_scheduler_stats(scheduler.stats())}")
+    finally:
+        if retention is not None:
+            retention.stop()
+        if metrics is not None:
+            metrics.stop()
 
 if __name__ == "__main__":
     # Load the configuration
     config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
-    config = load_config(config_path)
-
-    interval = config['timelapse']['interval']
-    
-    while True:
-        # Start the timer to measure the time taken for capturing the image
-        start_time = time.time()
-        log(logger, f"Starting a new capture cycle.")
-        
-        try:
-            script_path = os.path.join(os.path.dirname(__file__), 'capture_image.py')
-            subprocess.run(['python3', script_path], check=True)
-        except subprocess.CalledProcessError as e:
-            log(logger, f"Error during image capture: {e}")
-        
-        # Calculate the time taken to capture the image
-        capture_duration = time.time() - start_time
-        remaining_sleep = max(0, interval - capture_duration)  # Ensure no negative sleep times
-
-        log(logger, f"Capture took {capture_duration:.2f} seconds. Sleeping for {remaining_sleep:.2f} seconds before next capture.")
-        time.sleep(remaining_sleep)
+    try:
+        config = load_config(config_path)
+    except ConfigError as e:
+        log_error(logger, f"Invalid configuration: {e}")
+        raise SystemExit(1)
+
+    if config['timelapse']['mode'] == 'subprocess':
+        run_subprocess_loop(config)
+    else:
+        run_daemon(config)
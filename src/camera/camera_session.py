@@ -0,0 +1,272 @@
+# src/camera/camera_session.py
+
+import time
+from src.log.logger import get_logger, log, log_warning, log_error
+from src.metrics.metrics import span
+
+logger = get_logger('camera_session.log', echo_to_console=True)
+
+# Relative tolerance when checking that a frame was taken with the requested manual exposure
+CONTROL_TOLERANCE = 0.05
+
+def create_camera(config):
+    """
+    Creates the camera backend selected in the configuration.
+
+    Parameters:
+        config (dict): The configuration dictionary. camera_settings.backend selects
+            'picamera2' (default) or 'fake' for running without camera hardware.
+
+    Returns:
+        object: A Picamera2 instance, or a FakePicamera2 with the same interface.
+    """
+    backend = config.get('camera_settings', {}).get('backend', 'picamera2')
+    if backend == 'fake':
+        from src.camera.fake_camera import FakePicamera2
+        return FakePicamera2(**config.get('fake_camera', {}))
+
+    from picamera2 import Picamera2
+    return Picamera2()
+
+def get_lores_size(config):
+    """
+    Returns the size of the low-resolution stream, or None if nothing uses it.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        tuple: (width, height) or None.
+    """
+    lores_size = config['camera_settings'].get('lores_size')
+    if not lores_size or config.get('image', {}).get('exposure_mode', 'lux') != 'histogram':
+        return None
+    return tuple(lores_size)
+
+class CameraSession:
+    """
+    Owns a single camera for the lifetime of the process.
+
+    The camera is configured and started once and keeps streaming between frames.
+    New exposure and colour controls are applied with set_controls(), and the
+    camera is only reconfigured when the stream configuration (main_size, lores_size)
+    changes.
+    """
+
+    def __init__(self, config, camera_factory=create_camera):
+        """
+        Parameters:
+            config (dict): The configuration dictionary.
+            camera_factory (callable): Called with the config to create the camera instance.
+        """
+        camera_settings = config.get('camera_settings', {})
+        self.camera_factory = camera_factory
+        self.settle_time = camera_settings.get('settle_time', 2)
+        self.metering_time = camera_settings.get('metering_time', 1)
+        self.settle_frames = camera_settings.get('settle_frames', 3)
+        self.max_settle_time = camera_settings.get('max_settle_time', 5)
+        self.camera = None
+        self.stream_key = None
+        self.controls = None
+        self.running = False
+        self.last_metadata = None
+        self.expected_controls = None
+        self.configure_count = 0
+        self._config = config
+
+    def open(self):
+        """
+        Creates the camera instance if it is not open yet.
+
+        Returns:
+            object: The camera instance.
+        """
+        if self.camera is None:
+            with span('camera.open'):
+                self.camera = self.camera_factory(self._config)
+            log(logger, "Camera opened.")
+        return self.camera
+
+    def close(self):
+        """
+        Stops and closes the camera.
+        """
+        if self.camera is None:
+            return
+        try:
+            if self.running:
+                self.camera.stop()
+            self.camera.close()
+            log(logger, "Camera closed.")
+        except Exception as e:
+            log_error(logger, f"Error closing camera: {e}")
+        finally:
+            self.camera = None
+            self.running = False
+            self.stream_key = None
+            self.controls = None
+            self.last_metadata = None
+            self.expected_controls = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def get_stream_key(config):
+        """
+        Returns the part of the configuration that requires a camera reconfigure when it changes.
+
+        Parameters:
+            config (dict): The configuration dictionary.
+
+        Returns:
+            tuple: The stream configuration key.
+        """
+        camera_settings = config['camera_settings']
+        return ('still', tuple(camera_settings['main_size']), get_lores_size(config))
+
+    @span('camera.configure')
+    def _configure(self, config, controls):
+        """
+        (Re)configures and starts the camera for still capture with the given controls.
+        """
+        camera = self.open()
+        if self.running:
+            camera.stop()
+            self.running = False
+
+        lores_size = get_lores_size(config)
+        still_config = camera.create_still_configuration(
+            main={"size": tuple(config['camera_settings']['main_size'])},
+            lores={"size": lores_size} if lores_size else None,
+            display=None,
+            controls=controls
+        )
+        camera.configure(still_config)
+        camera.start()
+        self.running = True
+        self.last_metadata = None  # A new mode needs a fresh metering pass
+        self.expected_controls = None  # The configured controls apply from the first frame
+        self.configure_count += 1
+        self.stream_key = self.get_stream_key(config)
+        self.controls = dict(controls)
+        log(logger, f"Camera configured for still capture: {self.stream_key}")
+
+    def apply(self, config, controls):
+        """
+        Applies the controls for the next frame.
+
+        The camera is only reconfigured if it is not running yet or the stream
+        configuration changed. Otherwise only the changed controls are sent with
+        set_controls(). Frames exposed before new manual exposure controls took
+        effect are discarded by the next capture_request().
+
+        Parameters:
+            config (dict): The configuration dictionary.
+            controls (dict): The libcamera controls for the next frame.
+
+        Returns:
+            bool: True if the camera was (re)configured.
+        """
+        if not self.running or self.stream_key != self.get_stream_key(config):
+            self._configure(config, controls)
+            # Allow time for auto exposure to adjust after a (re)start
+            with span('camera.settle'):
+                time.sleep(self.settle_time)
+            return True
+
+        if controls == self.controls:
+            return False
+
+        changed = {key: value for key, value in controls.items() if self.controls.get(key) != value and value is not None}
+        ae_enabled_now = controls.get('AeEnable', True) and not self.controls.get('AeEnable', True)
+        self.camera.set_controls(changed)
+        self.controls = dict(controls)
+        log(logger, "Camera controls updated: %s", ', '.join(changed))
+
+        if ae_enabled_now:
+            # Switching back to auto exposure, give the AE algorithm time to converge
+            self.expected_controls = None
+            with span('camera.settle'):
+                time.sleep(self.settle_time)
+        elif not controls.get('AeEnable', True) and controls.get('ExposureTime') is not None:
+            self.expected_controls = controls
+        return False
+
+    def _discard_stale(self, request, discarded, deadline):
+        """
+        Returns True if the request was exposed before the expected manual controls
+        took effect, and another frame still fits in settle_frames and max_settle_time.
+        """
+        if self.expected_controls is None:
+            return False
+        metadata = request.get_metadata()
+        exposure_time = self.expected_controls['ExposureTime']
+        if _close_to(metadata.get('ExposureTime'), exposure_time) and _close_to(metadata.get('AnalogueGain'), self.expected_controls.get('AnalogueGain')):
+            self.expected_controls = None
+            return False
+        if discarded >= self.settle_frames or time.monotonic() + exposure_time / 1e6 > deadline:
+            log_warning(logger, "Exposure controls not reflected after %d frames, capturing anyway.", discarded)
+            self.expected_controls = None
+            return False
+        return True
+
+    def meter(self, config):
+        """
+        Reads sensor metadata for light evaluation.
+
+        If the camera is not streaming yet it is started with auto exposure, so the
+        following apply() for the same stream configuration does not reconfigure it.
+
+        Parameters:
+            config (dict): The configuration dictionary.
+
+        Returns:
+            dict: The sensor metadata.
+        """
+        if not self.running:
+            self._configure(config, {"AeEnable": True})
+            with span('camera.warm_up'):
+                time.sleep(self.metering_time)  # Allow camera to warm up
+        with span('camera.metadata'):
+            return self.camera.capture_metadata()
+
+    def capture_request(self):
+        """
+        Captures a request from the running camera. The caller must release() it.
+
+        After a manual exposure change, requests whose metadata does not match the
+        new controls yet are released and captured again, up to settle_frames times.
+        A frame is only discarded if the next one ends within max_settle_time, so
+        long night exposures are not repeated to wait for the controls.
+
+        The request metadata is kept in last_metadata, so the next frame's exposure
+        can be calculated from it without a separate metering pass.
+
+        Returns:
+            object: The completed request.
+        """
+        if not self.running:
+            raise RuntimeError("Camera session is not running, call apply() first")
+        deadline = time.monotonic() + self.max_settle_time
+        discarded = 0
+        with span('camera.capture_request'):
+            request = self.camera.capture_request()
+            while request and self._discard_stale(request, discarded, deadline):
+                request.release()
+                discarded += 1
+                request = self.camera.capture_request()
+        if request:
+            self.last_metadata = request.get_metadata()
+        return request
+
+def _close_to(actual, expected):
+    if expected is None:
+        return True
+    if actual is None:
+        return False
+    return abs(actual - expected) <= abs(expected) * CONTROL_TOLERANCE
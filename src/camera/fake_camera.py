@@ -0,0 +1,211 @@
+# src/camera/fake_camera.py
+
+import time
+from contextlib import contextmanager
+
+class AfModeEnum:
+    Manual = 0
+    Auto = 1
+    Continuous = 2
+
+class AwbModeEnum:
+    Auto = 0
+    Incandescent = 1
+    Tungsten = 2
+    Fluorescent = 3
+    Indoor = 4
+    Daylight = 5
+    Cloudy = 6
+    Custom = 7
+
+class controls:
+    """
+    Stands in for libcamera.controls, with the enums build_camera_controls() uses.
+    """
+    AfModeEnum = AfModeEnum
+    AwbModeEnum = AwbModeEnum
+
+# Sensor noise patterns by frame shape and strength, generated once per process
+_noise_patterns = {}
+
+def noise_pattern(shape, noise):
+    """
+    Returns a fixed pattern of gaussian noise, so synthetic frames compress like photos.
+    """
+    import numpy as np
+    key = (shape, noise)
+    if key not in _noise_patterns:
+        rng = np.random.default_rng(0)
+        _noise_patterns[key] = rng.normal(0, noise, shape).astype(np.float32)
+    return _noise_patterns[key]
+
+class FakeMappedArray:
+    def __init__(self, array):
+        self.array = array
+
+class FakeRequest:
+    """
+    A completed capture request from FakePicamera2, mirroring the parts of
+    picamera2's CompletedRequest that this project uses.
+    """
+
+    def __init__(self, size, metadata, lores_size=None, brightness=1.0, noise=0.0):
+        self.size = size
+        self.lores_size = lores_size
+        self.metadata = metadata
+        self.brightness = brightness
+        self.noise = noise
+        self.released = False
+
+    def make_array(self, name="main"):
+        """
+        Returns a synthetic RGB frame as a numpy array of shape (height, width, 3),
+        or for the "lores" stream a YUV420 buffer of shape (height * 3 / 2, width).
+        With noise set, the main stream gets a fixed noise pattern on top of the gradient.
+        """
+        import numpy as np
+        width, height = self.lores_size if name == "lores" else self.size
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        if name == "lores":
+            frame = np.full((height * 3 // 2, width), 128, dtype=np.uint8)
+            frame[:height] = np.clip((x + y) / 2 * self.brightness, 0, 255)
+            return frame
+        noise = noise_pattern((height, width), self.noise) if self.noise else 0
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[..., 0] = np.clip(x * self.brightness + noise, 0, 255)
+        frame[..., 1] = np.clip(y * self.brightness + noise, 0, 255)
+        frame[..., 2] = np.clip((x + y) / 2 * self.brightness + noise, 0, 255)
+        return frame
+
+    @contextmanager
+    def mapped_array(self, name="main"):
+        """
+        Stands in for picamera2's MappedArray(request, name).
+        """
+        yield FakeMappedArray(self.make_array(name))
+
+    def make_image(self, name="main"):
+        """
+        Returns the synthetic frame as a PIL image.
+        """
+        from PIL import Image
+        return Image.fromarray(self.make_array(name))
+
+    def get_metadata(self):
+        return dict(self.metadata)
+
+    def release(self):
+        self.released = True
+
+class FakePicamera2:
+    """
+    A camera backend with the Picamera2 interface that needs no hardware.
+
+    It returns synthetic frames and metadata. Manual ExposureTime and AnalogueGain
+    controls are reflected in the metadata after `control_delay` frames, like on a
+    real sensor, and each frame takes `frame_time` seconds. Opening the camera takes
+    `open_time` and each configure() `configure_time` seconds, like the sensor mode
+    switch of a real camera.
+    """
+
+    def __init__(self, lux=400.0, frame_time=0.0, control_delay=1, open_time=0.0, configure_time=0.0, noise=0.0):
+        self.lux = lux
+        self.frame_time = frame_time
+        self.control_delay = control_delay
+        self.configure_time = configure_time
+        self.noise = noise
+        self.configuration = None
+        self.controls = {}
+        self.started = False
+        self.closed = False
+        self.configure_count = 0
+        self.start_count = 0
+        self.set_controls_count = 0
+        self.frame_count = 0
+        self._pending = []
+        if open_time:
+            time.sleep(open_time)
+
+    def create_still_configuration(self, main=None, lores=None, display=None, controls=None):
+        return {"main": dict(main or {"size": (4056, 3040)}), "lores": lores, "display": display, "controls": dict(controls or {})}
+
+    def create_preview_configuration(self, main=None, lores=None, display=None, controls=None):
+        return {"main": dict(main or {"size": (640, 480)}), "lores": lores, "display": display, "controls": dict(controls or {})}
+
+    def configure(self, configuration):
+        if self.started:
+            raise RuntimeError("Camera must be stopped before configuring")
+        if self.configure_time:
+            time.sleep(self.configure_time)
+        self.configuration = configuration
+        self.controls = dict(configuration.get("controls") or {})
+        self._pending = []
+        self.configure_count += 1
+
+    def start(self):
+        if self.configuration is None:
+            raise RuntimeError("Camera must be configured before starting")
+        self.started = True
+        self.start_count += 1
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.started = False
+        self.closed = True
+
+    def set_controls(self, controls):
+        self.set_controls_count += 1
+        self._pending.append([self.control_delay, dict(controls)])
+
+    def _next_frame(self):
+        if not self.started:
+            raise RuntimeError("Camera is not started")
+        if self.frame_time:
+            time.sleep(self.frame_time)
+        self.frame_count += 1
+
+        # Controls take effect a few frames after set_controls(), as on the real pipeline
+        for pending in self._pending:
+            pending[0] -= 1
+            if pending[0] < 0:
+                self.controls.update(pending[1])
+        self._pending = [pending for pending in self._pending if pending[0] >= 0]
+        return self._metadata()
+
+    def _metadata(self):
+        if self.controls.get("AeEnable", True) or "ExposureTime" not in self.controls:
+            exposure_time = int(min(100000, 1000000 / max(self.lux, 1)))
+            analogue_gain = 1.0
+        else:
+            exposure_time = int(self.controls["ExposureTime"])
+            analogue_gain = float(self.controls.get("AnalogueGain", 1.0))
+        return {
+            "Lux": float(self.lux),
+            "ExposureTime": exposure_time,
+            "AnalogueGain": analogue_gain,
+            "DigitalGain": 1.0,
+            "FrameDuration": max(exposure_time, 33333),
+            "SensorTemperature": 40.0,
+            "LensPosition": float(self.controls.get("LensPosition") or 0.0),
+            "ColourTemperature": 5000,
+            "ColourGains": tuple(self.controls.get("ColourGains", (1.0, 1.0))),
+            "SensorTimestamp": time.monotonic_ns(),
+        }
+
+    def capture_metadata(self):
+        return self._next_frame()
+
+    def capture_request(self):
+        metadata = self._next_frame()
+        lores = self.configuration.get("lores")
+        # Scene brightness follows Lux and exposure, auto exposure gives the plain gradient
+        brightness = self.lux * metadata["ExposureTime"] / 1e6 * metadata["AnalogueGain"]
+        return FakeRequest(
+            tuple(self.configuration["main"]["size"]), metadata,
+            lores_size=tuple(lores["size"]) if lores else None,
+            brightness=min(max(brightness, 0.01), 10.0),
+            noise=self.noise,
+        )
@@ -0,0 +1,329 @@
+# src/catalog/capture_catalog.py
+
+import atexit
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from src.config.settings import BASE_DIR
+from src.log.logger import get_logger, log, log_error
+
+logger = get_logger('capture_catalog.log', echo_to_console=True)
+
+# Default location of the catalog, next to the other data files
+CATALOG_FILE = os.path.join(BASE_DIR, 'data', 'captures.sqlite')
+
+# Columns of the captures table after the id, in insert order
+COLUMNS = (
+    'timestamp', 'file_name', 'lux', 'exposure_time', 'analogue_gain', 'digital_gain',
+    'colour_gain_red', 'colour_gain_blue', 'sensor_temperature', 'file_size', 'encode_time',
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    file_name TEXT NOT NULL,
+    lux REAL,
+    exposure_time INTEGER,
+    analogue_gain REAL,
+    digital_gain REAL,
+    colour_gain_red REAL,
+    colour_gain_blue REAL,
+    sensor_temperature REAL,
+    file_size INTEGER,
+    encode_time REAL
+);
+CREATE INDEX IF NOT EXISTS captures_timestamp ON captures (timestamp);
+CREATE INDEX IF NOT EXISTS captures_lux ON captures (lux);
+"""
+
+# Queue markers for the writer thread
+_STOP = object()
+
+def capture_entry(timestamp, file_name, metadata, file_size=None, encode_time=None):
+    """
+    Builds a catalog entry from a frame's request metadata.
+
+    Parameters:
+        timestamp (float): The capture time as a Unix timestamp.
+        file_name (str): The image path.
+        metadata (dict): The capture request metadata.
+        file_size (int, optional): The size of the saved image in bytes.
+        encode_time (float, optional): Seconds spent encoding and writing the image.
+
+    Returns:
+        dict: The entry, with a key for every catalog column.
+    """
+    metadata = metadata or {}
+    colour_gains = metadata.get('ColourGains') or (None, None)
+    return {
+        'timestamp': timestamp,
+        'file_name': file_name,
+        'lux': metadata.get('Lux'),
+        'exposure_time': metadata.get('ExposureTime'),
+        'analogue_gain': metadata.get('AnalogueGain'),
+        'digital_gain': metadata.get('DigitalGain'),
+        'colour_gain_red': colour_gains[0],
+        'colour_gain_blue': colour_gains[1],
+        'sensor_temperature': metadata.get('SensorTemperature'),
+        'file_size': file_size,
+        'encode_time': encode_time,
+    }
+
+class CaptureCatalog:
+    """
+    A WAL-mode SQLite catalog of every captured frame.
+
+    record() only puts the entry on a queue. A writer thread inserts the entries in
+    batches, one transaction per batch, so the capture loop and the save pipeline
+    never wait for the SD card. With WAL, readers such as query() never block the
+    writer. The catalog has indexes on the capture time and on Lux.
+    """
+
+    def __init__(self, path=CATALOG_FILE, batch_size=32, flush_interval=10.0):
+        """
+        Parameters:
+            path (str): The SQLite file, created if it does not exist.
+            batch_size (int): Max entries inserted in one transaction.
+            flush_interval (float): Max seconds an entry waits for its batch to fill up.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.last_entry = None
+        self._queue = queue.Queue()
+        self._read_lock = threading.Lock()
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        connection.close()
+        self._reader = self._connect()
+
+        self._writer = threading.Thread(target=self._run, name='capture-catalog', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        # WAL is crash-safe with NORMAL sync, only the last transactions can be lost on power failure
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record(self, entry):
+        """
+        Queues an entry for insertion, without waiting for the database.
+
+        Parameters:
+            entry (dict): The entry, see capture_entry().
+        """
+        self.last_entry = entry
+        self._queue.put(entry)
+
+    def _run(self):
+        connection = self._connect()
+        sql = f"INSERT INTO captures ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        stop = False
+        while not stop:
+            batch = []
+            flushes = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    flushes.append(item)
+                else:
+                    batch.append(item)
+                if stop or flushes or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany(sql, [[entry.get(column) for column in COLUMNS] for entry in batch])
+                except Exception as e:
+                    log_error(logger, f"Error writing {len(batch)} entries to the capture catalog: {e}")
+            for flushed in flushes:
+                flushed.set()
+        connection.close()
+
+    def flush(self, timeout=None):
+        """
+        Waits until every entry recorded so far is written.
+
+        Parameters:
+            timeout (float, optional): Max seconds to wait.
+
+        Returns:
+            bool: True if the entries were written in time.
+        """
+        if not self._writer.is_alive():
+            return False
+        flushed = threading.Event()
+        self._queue.put(flushed)
+        return flushed.wait(timeout)
+
+    def close(self):
+        """
+        Writes the pending entries and stops the writer thread.
+        """
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def _select(self, sql, parameters=()):
+        with self._read_lock:
+            cursor = self._reader.execute(sql, parameters)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def latest(self):
+        """
+        Returns the newest entry, including one that is still waiting to be written.
+
+        Returns:
+            dict: The entry, or None if the catalog is empty.
+        """
+        if self.last_entry is not None:
+            return self.last_entry
+        rows = self._select("SELECT * FROM captures ORDER BY timestamp DESC LIMIT 1")
+        return rows[0] if rows else None
+
+    def query(self, start=None, end=None, min_lux=None, max_lux=None, limit=None, columns=None):
+        """
+        Returns the captures in a time range and Lux range.
+
+        Parameters:
+            start (float, optional): Earliest capture time (Unix timestamp), inclusive.
+            end (float, optional): Latest capture time (Unix timestamp), exclusive.
+            min_lux (float, optional): Only captures with at least this Lux value.
+            max_lux (float, optional): Only captures with at most this Lux value.
+            limit (int, optional): Max number of captures.
+            columns (list, optional): The columns to return, all if None.
+
+        Returns:
+            list: A dict per capture, in capture order.
+        """
+        conditions, parameters = self._conditions(start, end, min_lux, max_lux)
+        selected = ', '.join(column for column in columns if column in COLUMNS + ('id',)) if columns else '*'
+        sql = f"SELECT {selected} FROM captures{conditions} ORDER BY timestamp"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        return self._select(sql, parameters)
+
+    def summary(self, start=None, end=None, min_lux=None, max_lux=None):
+        """
+        Returns aggregate values of the captures in a time range and Lux range.
+
+        Parameters:
+            start, end, min_lux, max_lux: See query().
+
+        Returns:
+            dict: 'count', 'first' and 'last' timestamp, 'min_lux', 'max_lux',
+                'avg_lux', 'total_size' (bytes) and 'avg_encode_time' (seconds).
+        """
+        conditions, parameters = self._conditions(start, end, min_lux, max_lux)
+        return self._select(
+            "SELECT COUNT(*) AS count, MIN(timestamp) AS first, MAX(timestamp) AS last, "
+            "MIN(lux) AS min_lux, MAX(lux) AS max_lux, AVG(lux) AS avg_lux, "
+            f"SUM(file_size) AS total_size, AVG(encode_time) AS avg_encode_time FROM captures{conditions}",
+            parameters,
+        )[0]
+
+    @staticmethod
+    def _conditions(start, end, min_lux, max_lux):
+        conditions = []
+        parameters = []
+        for clause, value in (("timestamp >= ?", start), ("timestamp < ?", end),
+                              ("lux >= ?", min_lux), ("lux <= ?", max_lux)):
+            if value is not None:
+                conditions.append(clause)
+                parameters.append(value)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+# One catalog per file for the whole process, closed (and flushed) at exit
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_capture_catalog(config):
+    """
+    Returns the shared CaptureCatalog from the catalog settings, opening it on first use.
+
+    Parameters:
+        config (Settings): The settings.
+
+    Returns:
+        CaptureCatalog: The catalog, or None if catalog.enabled is false.
+    """
+    catalog_config = config['catalog']
+    if not catalog_config['enabled']:
+        return None
+    path = catalog_config['file'] or CATALOG_FILE
+    with _catalogs_lock:
+        if path not in _catalogs:
+            _catalogs[path] = CaptureCatalog(
+                path, batch_size=catalog_config['batch_size'], flush_interval=catalog_config['flush_interval']
+            )
+            log(logger, f"Capture catalog opened: {path}")
+        return _catalogs[path]
+
+@atexit.register
+def close_capture_catalogs():
+    """
+    Closes the shared catalogs, writing their pending entries.
+    """
+    with _catalogs_lock:
+        for catalog in _catalogs.values():
+            catalog.close()
+        _catalogs.clear()
+
+if __name__ == "__main__":
+    # Summarize or list captures, e.g.:
+    #     python3 -m src.catalog.capture_catalog --since 2024-06-01 --until 2024-07-01
+    #     python3 -m src.catalog.capture_catalog --max-lux 1 --list
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="Query the capture catalog.")
+    parser.add_argument('--catalog', default=CATALOG_FILE)
+    parser.add_argument('--since', type=datetime.fromisoformat)
+    parser.add_argument('--until', type=datetime.fromisoformat)
+    parser.add_argument('--min-lux', type=float)
+    parser.add_argument('--max-lux', type=float)
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--list', action='store_true', help="List the captures instead of a summary")
+    args = parser.parse_args()
+
+    catalog = CaptureCatalog(args.catalog)
+    filters = dict(
+        start=args.since.timestamp() if args.since else None,
+        end=args.until.timestamp() if args.until else None,
+        min_lux=args.min_lux, max_lux=args.max_lux,
+    )
+    start_time = time.perf_counter()
+    if args.list:
+        captures = catalog.query(limit=args.limit, columns=['timestamp', 'lux', 'exposure_time', 'analogue_gain', 'file_name'], **filters)
+        duration = time.perf_counter() - start_time
+        for capture in captures:
+            print(f"{datetime.fromtimestamp(capture['timestamp']):%Y-%m-%d %H:%M:%S}  lux {capture['lux'] or 0:8.2f}  "
+                  f"exposure {capture['exposure_time'] or 0:>9} µs  gain {capture['analogue_gain'] or 0:5.2f}  {capture['file_name']}")
+        print(f"{len(captures)} captures in {duration * 1000:.1f} ms", file=sys.stderr)
+    else:
+        summary = catalog.summary(**filters)
+        duration = time.perf_counter() - start_time
+        for key, value in summary.items():
+            print(f"{key}: {value}")
+        print(f"Queried in {duration * 1000:.1f} ms", file=sys.stderr)
+    catalog.close()
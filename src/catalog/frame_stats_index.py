@@ -0,0 +1,259 @@
+# src/catalog/frame_stats_index.py
+
+import atexit
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from src.config.settings import BASE_DIR
+from src.log.logger import get_logger, log_error
+
+logger = get_logger('frame_stats_index.log', echo_to_console=True)
+
+# Default location of the index, next to the other data files
+FRAME_STATS_FILE = os.path.join(BASE_DIR, 'data', 'frame_stats.sqlite')
+
+# The stat columns, in the order of compute_frame_stats()
+STAT_COLUMNS = ('mean_luma', 'sharpness', 'highlights', 'shadows', 'mean_r', 'mean_g', 'mean_b')
+
+# Max frames inserted in one transaction, and max seconds a frame waits for its batch
+BATCH_SIZE = 32
+FLUSH_INTERVAL = 10.0
+
+# Queue marker for the writer thread
+_STOP = object()
+
+class FrameStatsIndex:
+    """
+    An append-only, WAL-mode SQLite index of per-frame statistics, keyed by capture time.
+
+    Tools can find dark, blurry or over-exposed frames with query() without
+    decoding any images. Like the capture catalog, add() only queues the stats and
+    a writer thread inserts them in batches, so the capture path never waits for
+    the SD card, and readers such as render_timelapse.py never block the writer.
+    """
+
+    def __init__(self, path=FRAME_STATS_FILE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        """
+        Parameters:
+            path (str): The SQLite file, created if it does not exist.
+            batch_size (int): Max frames inserted in one transaction.
+            flush_interval (float): Max seconds a frame waits for its batch to fill up.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        columns = ', '.join(f"{column} REAL" for column in STAT_COLUMNS)
+        with connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS frame_stats (timestamp REAL NOT NULL, file_name TEXT NOT NULL, {columns})"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS frame_stats_timestamp ON frame_stats (timestamp)")
+        connection.close()
+        self._connection = self._connect()
+
+        self._writer = threading.Thread(target=self._run, name='frame-stats-index', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        # WAL is crash-safe with NORMAL sync, only the last transactions can be lost on power failure
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def add(self, timestamp, file_name, stats):
+        """
+        Queues the stats of one frame for insertion, without waiting for the database.
+
+        Parameters:
+            timestamp (float): The capture time as a Unix timestamp.
+            file_name (str): The image path.
+            stats (dict): The result of compute_frame_stats().
+        """
+        self._queue.put([timestamp, file_name] + [stats.get(column) for column in STAT_COLUMNS])
+
+    def _run(self):
+        connection = self._connect()
+        sql = f"INSERT INTO frame_stats VALUES ({', '.join('?' * (len(STAT_COLUMNS) + 2))})"
+        stop = False
+        while not stop:
+            batch = []
+            flushes = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    flushes.append(item)
+                else:
+                    batch.append(item)
+                if stop or flushes or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany(sql, batch)
+                except Exception as e:
+                    log_error(logger, "Error writing %d frames to the frame stats index: %s", len(batch), e)
+            for flushed in flushes:
+                flushed.set()
+        connection.close()
+
+    def flush(self, timeout=None):
+        """
+        Waits until the stats of every frame added so far are written.
+
+        Parameters:
+            timeout (float, optional): Max seconds to wait.
+
+        Returns:
+            bool: True if the stats were written in time.
+        """
+        if not self._writer.is_alive():
+            return False
+        flushed = threading.Event()
+        self._queue.put(flushed)
+        return flushed.wait(timeout)
+
+    def query(self, start=None, end=None, min_luma=None, max_luma=None, max_sharpness=None, min_highlights=None, limit=None):
+        """
+        Returns the frames in a time range that match all the given limits.
+
+        Parameters:
+            start (float, optional): Earliest capture time (Unix timestamp), inclusive.
+            end (float, optional): Latest capture time (Unix timestamp), exclusive.
+            min_luma (float, optional): Only frames at least this bright (0-255).
+            max_luma (float, optional): Only frames at most this bright, e.g. 20 for dark frames.
+            max_sharpness (float, optional): Only frames at most this sharp, for blurry frames.
+            min_highlights (float, optional): Only frames with at least this fraction of clipped pixels.
+            limit (int, optional): Max number of frames.
+
+        Returns:
+            list: A dict per frame with 'timestamp', 'file_name' and the stats, in capture order.
+        """
+        conditions = []
+        parameters = []
+        for clause, value in (("timestamp >= ?", start), ("timestamp < ?", end),
+                              ("mean_luma >= ?", min_luma), ("mean_luma <= ?", max_luma),
+                              ("sharpness <= ?", max_sharpness), ("highlights >= ?", min_highlights)):
+            if value is not None:
+                conditions.append(clause)
+                parameters.append(value)
+
+        sql = "SELECT * FROM frame_stats"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        # Frames added by this process are included, even if their batch was not written yet
+        self.flush()
+        with self._lock:
+            cursor = self._connection.execute(sql, parameters)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def recent(self, count):
+        """
+        Returns the most recent frames.
+
+        Parameters:
+            count (int): Max number of frames.
+
+        Returns:
+            list: A dict per frame, like query(), oldest first.
+        """
+        self.flush()
+        with self._lock:
+            cursor = self._connection.execute("SELECT * FROM frame_stats ORDER BY timestamp DESC LIMIT ?", (count,))
+            names = [description[0] for description in cursor.description]
+            rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        return rows[::-1]
+
+    def close(self):
+        """
+        Writes the pending stats and stops the writer thread.
+        """
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        with self._lock:
+            self._connection.close()
+
+# One index per file for the whole process, shared by the pipeline workers
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_frame_stats_index(path=None):
+    """
+    Returns the shared FrameStatsIndex for a file, opening it on first use.
+
+    Parameters:
+        path (str, optional): The SQLite file, FRAME_STATS_FILE if None.
+
+    Returns:
+        FrameStatsIndex: The index.
+    """
+    path = path or FRAME_STATS_FILE
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = FrameStatsIndex(path)
+        return _indexes[path]
+
+@atexit.register
+def close_frame_stats_indexes():
+    """
+    Closes the shared indexes, writing their pending stats.
+    """
+    with _indexes_lock:
+        for index in _indexes.values():
+            index.close()
+        _indexes.clear()
+
+if __name__ == "__main__":
+    # List dark, blurry or over-exposed frames, e.g.:
+    #     python3 -m src.catalog.frame_stats_index --max-luma 20
+    #     python3 -m src.catalog.frame_stats_index --max-sharpness 5 --since 2024-06-01
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="Query the frame statistics index.")
+    parser.add_argument('--index', default=FRAME_STATS_FILE)
+    parser.add_argument('--since', type=datetime.fromisoformat)
+    parser.add_argument('--until', type=datetime.fromisoformat)
+    parser.add_argument('--min-luma', type=float)
+    parser.add_argument('--max-luma', type=float)
+    parser.add_argument('--max-sharpness', type=float)
+    parser.add_argument('--min-highlights', type=float)
+    parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    index = FrameStatsIndex(args.index)
+    frames = index.query(
+        start=args.since.timestamp() if args.since else None,
+        end=args.until.timestamp() if args.until else None,
+        min_luma=args.min_luma, max_luma=args.max_luma,
+        max_sharpness=args.max_sharpness, min_highlights=args.min_highlights,
+        limit=args.limit,
+    )
+    for frame in frames:
+        print(f"{datetime.fromtimestamp(frame['timestamp']):%Y-%m-%d %H:%M:%S}  luma {frame['mean_luma']:6.1f}  "
+              f"sharpness {frame['sharpness']:8.1f}  highlights {frame['highlights'] * 100:5.1f}%  {frame['file_name']}")
+    print(f"{len(frames)} frames", file=sys.stderr)
+    index.close()
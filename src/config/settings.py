@@ -0,0 +1,411 @@
+# src/config/settings.py
+
+import os
+import threading
+from collections.abc import Mapping
+
+# The project's config.yaml, independent of the current working directory
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+CONFIG_FILE = os.path.join(BASE_DIR, 'config.yaml')
+
+class ConfigError(ValueError):
+    """
+    Raised when config.yaml is missing, cannot be parsed or has invalid values.
+    """
+
+# Marks a setting that has no default and must be set in config.yaml
+REQUIRED = object()
+
+NUMBER = (int, float)
+OPTIONAL_STRING = (str, type(None))
+
+def _positive(value):
+    return value > 0
+
+def _not_negative(value):
+    return value >= 0
+
+def _size(value):
+    return len(value) == 2 and all(isinstance(v, int) and v > 0 for v in value)
+
+def _pair(value):
+    return len(value) == 2 and all(isinstance(v, NUMBER) for v in value)
+
+def _one_of(*choices):
+    check = lambda value: value in choices
+    check.__doc__ = f"one of {', '.join(repr(choice) for choice in choices)}"
+    return check
+
+def _derivative_sizes(value):
+    return all(
+        isinstance(size, dict) and isinstance(size.get('name'), str) and size['name']
+        and isinstance(size.get('width'), int) and size['width'] > 0
+        and isinstance(size.get('quality', 85), int) and 0 <= size.get('quality', 85) <= 100
+        for size in value
+    )
+_derivative_sizes.__doc__ = "a list of {name, width, quality}"
+
+def _retention_tiers(value):
+    optional_number = lambda tier, key: tier.get(key) is None or (isinstance(tier[key], NUMBER) and tier[key] >= 0)
+    return all(
+        isinstance(tier, dict) and isinstance(tier.get('tree'), str) and tier['tree']
+        and optional_number(tier, 'max_age_days') and optional_number(tier, 'max_size_gb')
+        and tier.get('expire', 'delete') in ('delete', 'hourly')
+        for tier in value
+    )
+_retention_tiers.__doc__ = "a list of {tree, max_age_days, max_size_gb, expire}"
+
+def _between(low, high):
+    check = lambda value: low <= value <= high
+    check.__doc__ = f"between {low} and {high}"
+    return check
+
+# section -> key -> (allowed types, default, check)
+SCHEMA = {
+    'log': {
+        'levels': ((list, str), ['info', 'warning', 'error'], None),
+        'json_file': (OPTIONAL_STRING, None, None),
+    },
+    'image': {
+        'evaluate_light_every': (NUMBER, 0, _not_negative),
+        'lux_source': (str, 'feedback', _one_of('feedback', 'metering')),
+        'lux_day_night_threshold': (NUMBER, REQUIRED, _positive),
+        'lux_night_min': (NUMBER, REQUIRED, _not_negative),
+        'shutter_speed_day': (int, 0, _not_negative),
+        'shutter_speed_start': (int, REQUIRED, _positive),
+        'exposure_curve': (str, 'linear', _one_of('linear', 'log')),
+        'exposure_smoothing': (NUMBER, 0.0, _between(0, 0.99)),
+        'exposure_hysteresis': (NUMBER, 0.0, _not_negative),
+        'exposure_mode': (str, 'lux', _one_of('lux', 'histogram')),
+        'histogram_target': (NUMBER, 0.4, _between(0.05, 0.95)),
+        'histogram_max_clipped': (NUMBER, 0.01, _between(0, 1)),
+        'histogram_damping': (NUMBER, 0.5, _between(0, 0.95)),
+    },
+    'image_output': {
+        'root_folder': (str, REQUIRED, None),
+        'folder_structure': (str, '%Y/%m/%d/', None),
+        'filename_prefix': (str, '', None),
+        'filename_time_format': (str, '%Y_%m_%d_%H_%M_%S', None),
+        'status_file': (OPTIONAL_STRING, None, None),
+        'image_extension': (str, 'jpg', _one_of('jpg', 'jpeg', 'png')),
+        'optimize': (bool, True, None),
+    },
+    'overlay': {
+        'enabled': (bool, True, None),
+        'locale': (OPTIONAL_STRING, None, None),
+        'snapshot': (bool, True, None),
+    },
+    'publish': {
+        'fsync': (str, 'file', _one_of('none', 'file', 'full')),
+        'recent': (int, 0, _not_negative),
+        'recent_dir': (OPTIONAL_STRING, None, None),
+    },
+    'derivatives': {
+        'enabled': (bool, False, None),
+        'root_folder': (OPTIONAL_STRING, None, None),
+        'workers': (int, 2, _positive),
+        'sizes': (list, [{'name': 'thumb', 'width': 320, 'quality': 75}, {'name': 'web', 'width': 1920, 'quality': 85}],
+                  _derivative_sizes),
+    },
+    'retention': {
+        'enabled': (bool, False, None),
+        'check_interval': (NUMBER, 600, _positive),
+        'min_free_gb': (NUMBER, 1.0, _not_negative),
+        'tiers': (list, [{'tree': 'full'}], _retention_tiers),
+    },
+    'frame_stats': {
+        'enabled': (bool, True, None),
+        'index_file': (OPTIONAL_STRING, None, None),
+        'max_width': (int, 320, _positive),
+    },
+    'deflicker': {
+        'enabled': (bool, False, None),
+        'window': (int, 15, _positive),
+        'method': (str, 'gain', _one_of('gain', 'gamma')),
+        'max_gain': (NUMBER, 4.0, lambda value: value >= 1),
+    },
+    'stacking': {
+        'enabled': (bool, False, None),
+        'frames': (int, 8, lambda value: value >= 2),
+        'min_exposure_time': (int, 1000000, _positive),
+        'method': (str, 'mean', _one_of('mean', 'median')),
+        'align': (bool, True, None),
+        'align_width': (int, 640, _positive),
+        'max_shift': (int, 100, _not_negative),
+        'chunk_rows': (int, 128, _positive),
+    },
+    'hdr': {
+        'stops': (list, [-2, 2], lambda value: value and all(isinstance(stop, (int, float)) and stop != 0 for stop in value)),
+        'max_exposure_time': ((int, type(None)), None, lambda value: value is None or value > 0),
+        'levels': (int, 5, _positive),
+        'tile_size': (int, 512, lambda value: value >= 64),
+        'workers': ((int, type(None)), None, lambda value: value is None or value > 0),
+        'contrast_weight': (NUMBER, 1.0, _not_negative),
+        'saturation_weight': (NUMBER, 1.0, _not_negative),
+        'exposure_weight': (NUMBER, 1.0, _not_negative),
+    },
+    'catalog': {
+        'enabled': (bool, True, None),
+        'file': (OPTIONAL_STRING, None, None),
+        'batch_size': (int, 32, _positive),
+        'flush_interval': (NUMBER, 10, _not_negative),
+    },
+    'metrics': {
+        'enabled': (bool, False, None),
+        'host': (str, '127.0.0.1', None),
+        'port': (int, 9108, lambda value: 0 <= value < 65536),
+        'stats_file': (OPTIONAL_STRING, None, None),
+        'interval': (NUMBER, 60, _positive),
+    },
+    'pipeline': {
+        'enabled': (bool, False, None),
+        'workers': (int, 1, _positive),
+        'queue_size': (int, 4, _positive),
+        'policy': (str, 'latest', _one_of('block', 'drop', 'latest')),
+        'max_queue_mb': (NUMBER, 256, _not_negative),
+    },
+    'camera_settings': {
+        'name': (str, 'Camera Name', None),
+        'backend': (str, 'picamera2', _one_of('picamera2', 'fake')),
+        'settle_time': (NUMBER, 2, _not_negative),
+        'metering_time': (NUMBER, 1, _not_negative),
+        'settle_frames': (int, 3, _not_negative),
+        'max_settle_time': (NUMBER, 5, _not_negative),
+        'main_size': (list, REQUIRED, _size),
+        'lores_size': ((list, type(None)), None, lambda value: value is None or _size(value)),
+        'display': (OPTIONAL_STRING, None, None),
+        'awb_enable': (bool, False, None),
+        'awb_mode': (str, 'Auto', None),
+        'colour_gains_day': (list, REQUIRED, _pair),
+        'colour_gains_night': (list, REQUIRED, _pair),
+        'focus_mode': (str, 'manual', _one_of('manual', 'auto')),
+        'lens_position': (NUMBER, 0.0, _not_negative),
+        'hdr': (bool, False, None),
+        'image_quality': (int, 85, _between(0, 100)),
+        'compress_level': (int, 6, _between(0, 9)),
+        'light_threshold': (NUMBER, 50, None),
+        'iso_day': (NUMBER, REQUIRED, _positive),
+        'iso_night': (NUMBER, REQUIRED, _positive),
+        'shutter_speed_day': (int, 0, _not_negative),
+        'shutter_speed_night': (int, REQUIRED, _positive),
+        'exposure_value': ((int, float, type(None)), None, _between(-8, 8)),
+    },
+    'render': {
+        'fps': (NUMBER, 25, _positive),
+        'size': (list, [1920, 1080], _size),
+        'workers': ((int, type(None)), None, lambda value: value is None or value > 0),
+        'codec': (str, 'libx264', None),
+        'crf': (int, 20, _between(0, 51)),
+        'quality': (int, 95, _between(0, 100)),
+    },
+    'fake_camera': {
+        'lux': (NUMBER, 400.0, _not_negative),
+        'frame_time': (NUMBER, 0.0, _not_negative),
+        'open_time': (NUMBER, 0.0, _not_negative),
+        'configure_time': (NUMBER, 0.0, _not_negative),
+        'control_delay': (int, 1, _not_negative),
+        'noise': (NUMBER, 0.0, _not_negative),
+    },
+    'timelapse': {
+        'interval': (NUMBER, REQUIRED, _positive),
+        'mode': (str, 'daemon', _one_of('daemon', 'subprocess')),
+        'align': (bool, True, None),
+        'schedule_policy': (str, 'skip', _one_of('skip', 'catch_up')),
+        'max_lateness': ((int, float, type(None)), None, _not_negative),
+        'max_catch_up': (int, 1, _not_negative),
+    },
+}
+
+def freeze(value):
+    """
+    Returns an immutable copy of a parsed YAML value: dicts become Sections, lists become tuples.
+    """
+    if isinstance(value, Mapping):
+        return Section({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+class Section(Mapping):
+    """
+    An immutable mapping of settings. Values can be read as settings['key'],
+    settings.get('key') or settings.key.
+    """
+
+    def __init__(self, values):
+        object.__setattr__(self, '_values', dict(values))
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getattr__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Settings are read-only")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._values!r})"
+
+class Settings(Section):
+    """
+    The validated configuration, with defaults applied for missing settings.
+    """
+
+    def __init__(self, values, path=None, mtime=None):
+        super().__init__(values)
+        object.__setattr__(self, 'path', path)
+        object.__setattr__(self, 'mtime', mtime)
+
+def _check_type(value, types, name):
+    types = types if isinstance(types, tuple) else (types,)
+    # bool is a subclass of int, but true/false is never a valid number
+    if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+        raise ConfigError(f"{name} must be {_type_names(types)}, got {value!r}")
+
+def _type_names(types):
+    types = types if isinstance(types, tuple) else (types,)
+    return " or ".join('null' if t is type(None) else t.__name__ for t in types)
+
+def validate(raw):
+    """
+    Validates a parsed config.yaml and applies the defaults.
+
+    Unknown sections and keys are kept as they are, so settings used by newer
+    code do not have to be listed here.
+
+    Parameters:
+        raw (dict): The parsed YAML.
+
+    Returns:
+        dict: The validated configuration.
+
+    Raises:
+        ConfigError: If a required setting is missing or a value is invalid.
+    """
+    if raw is None:
+        raw = {}
+    if not isinstance(raw, dict):
+        raise ConfigError("The configuration must be a mapping of sections")
+
+    config = dict(raw)
+    for section, fields in SCHEMA.items():
+        values = config.get(section) or {}
+        if not isinstance(values, dict):
+            raise ConfigError(f"Section '{section}' must be a mapping, got {values!r}")
+        values = dict(values)
+
+        for key, (types, default, check) in fields.items():
+            name = f"{section}.{key}"
+            if key not in values:
+                if default is REQUIRED:
+                    raise ConfigError(f"Missing required setting {name}")
+                values[key] = default
+                continue
+
+            value = values[key]
+            _check_type(value, types, name)
+            if check is not None and value is not None and not check(value):
+                expected = f" (expected {check.__doc__})" if check.__doc__ else ""
+                raise ConfigError(f"Invalid value for {name}: {value!r}{expected}")
+        config[section] = values
+
+    # The histogram is measured on the lores stream, which is only configured with a size
+    if config['image']['exposure_mode'] == 'histogram' and not config['camera_settings']['lores_size']:
+        raise ConfigError("image.exposure_mode 'histogram' needs camera_settings.lores_size")
+
+    # Every other log key enables logging for a script
+    for key, value in config['log'].items():
+        if key not in SCHEMA['log'] and not isinstance(value, bool):
+            raise ConfigError(f"log.{key} must be true or false, got {value!r}")
+
+    return config
+
+def load_settings(config_path=CONFIG_FILE):
+    """
+    Loads, validates and freezes config.yaml.
+
+    Parameters:
+        config_path (str): The path to the configuration file.
+
+    Returns:
+        Settings: The immutable settings.
+
+    Raises:
+        ConfigError: If the file is missing, cannot be parsed or has invalid values.
+    """
+    # Imported here, so modules that only need the schema or BASE_DIR start fast
+    import yaml
+
+    try:
+        mtime = os.path.getmtime(config_path)
+        with open(config_path, 'r') as file:
+            # The libyaml parser is several times faster, where PyYAML was built with it
+            raw = yaml.load(file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    except OSError as e:
+        raise ConfigError(f"Cannot read configuration file {config_path}: {e}") from e
+    except yaml.YAMLError as e:
+        raise ConfigError(f"Error parsing configuration file {config_path}: {e}") from e
+
+    config = validate(raw)
+    return Settings({key: freeze(value) for key, value in config.items()}, path=config_path, mtime=mtime)
+
+class SettingsLoader:
+    """
+    Keeps the loaded settings and only parses config.yaml again when its mtime changes.
+    """
+
+    def __init__(self, config_path=CONFIG_FILE):
+        self.config_path = config_path
+        self.settings = None
+        self.error = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns the current settings, reloading the file if it changed.
+
+        The first load fails fast with a ConfigError. If a later edit breaks the
+        file, the previous settings are kept and the error is stored in self.error.
+
+        Returns:
+            Settings: The settings.
+        """
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.config_path)
+            except OSError:
+                mtime = None
+            if self.settings is None:
+                self.settings = load_settings(self.config_path)
+                self._mtime = self.settings.mtime
+            elif mtime != self._mtime:
+                self._mtime = mtime
+                try:
+                    self.settings = load_settings(self.config_path)
+                    self.error = None
+                except ConfigError as e:
+                    self.error = e
+            return self.settings
+
+# The settings shared by all modules of this process
+_loader = SettingsLoader()
+
+def get_settings():
+    """
+    Returns the project's settings, loaded once and reloaded only when config.yaml changes.
+
+    Returns:
+        Settings: The settings.
+    """
+    return _loader.get()
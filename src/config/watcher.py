@@ -0,0 +1,101 @@
+# src/config/watcher.py
+
+import os
+from collections.abc import Mapping
+from src.config.settings import ConfigError, load_settings
+from src.log.logger import get_logger, log, log_error, log_warning
+
+logger = get_logger('config_watcher.log', echo_to_console=True)
+
+# Settings that need a new camera session (a new camera instance) when they change
+SESSION_KEYS = (
+    'camera_settings.backend',
+    'camera_settings.settle_time',
+    'camera_settings.metering_time',
+    'camera_settings.settle_frames',
+    'camera_settings.max_settle_time',
+)
+
+# Settings that are only read at startup
+RESTART_KEYS = ('log', 'timelapse.mode')
+
+def diff_settings(old, new, prefix=''):
+    """
+    Compares two settings objects.
+
+    Parameters:
+        old (Mapping): The previous settings.
+        new (Mapping): The new settings.
+        prefix (str): Used for the recursion.
+
+    Returns:
+        dict: Dotted setting name -> (old value, new value) for every changed setting.
+    """
+    changes = {}
+    for key in sorted(set(old) | set(new), key=str):
+        name = f"{prefix}{key}"
+        old_value, new_value = old.get(key), new.get(key)
+        if isinstance(old_value, Mapping) and isinstance(new_value, Mapping):
+            changes.update(diff_settings(old_value, new_value, f"{name}."))
+        elif old_value != new_value:
+            changes[name] = (old_value, new_value)
+    return changes
+
+def changed_under(changes, names):
+    """
+    Returns True if any changed setting is one of names, or inside a section in names.
+
+    Parameters:
+        changes (dict): The result of diff_settings().
+        names (iterable): Dotted setting or section names.
+    """
+    return any(change == name or change.startswith(f"{name}.") for change in changes for name in names)
+
+class ConfigWatcher:
+    """
+    Watches config.yaml by mtime, so a running timelapse can pick up changes at the next frame.
+    """
+
+    def __init__(self, settings):
+        """
+        Parameters:
+            settings (Settings): The settings the timelapse is running with.
+        """
+        self.settings = settings
+        self._mtime = settings.mtime
+
+    def poll(self):
+        """
+        Reloads the config if the file changed since the last poll.
+
+        An invalid file is logged and ignored, the timelapse keeps running with the
+        current settings until the file is fixed.
+
+        Returns:
+            tuple: (settings, changes) if the settings changed, otherwise (None, {}).
+        """
+        try:
+            mtime = os.path.getmtime(self.settings.path)
+        except OSError:
+            return None, {}
+        if mtime == self._mtime:
+            return None, {}
+        self._mtime = mtime
+
+        try:
+            settings = load_settings(self.settings.path)
+        except ConfigError as e:
+            log_error(logger, f"Ignoring config change, keeping the current settings: {e}")
+            return None, {}
+
+        changes = diff_settings(self.settings, settings)
+        if not changes:
+            return None, {}
+
+        for name, (old_value, new_value) in changes.items():
+            log(logger, f"Config changed: {name}: {old_value!r} -> {new_value!r}")
+        if changed_under(changes, RESTART_KEYS):
+            log_warning(logger, f"Changes to {', '.join(RESTART_KEYS)} take effect after a restart.")
+
+        self.settings = settings
+        return settings, changes
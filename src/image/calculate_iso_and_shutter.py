@@ -1,56 +1,34 @@
 # src/image/calculate_iso_and_shutter.py
 from src.log.logger import get_logger, log
+from src.image.exposure_engine import ExposureEngine
 
 logger = get_logger('calculate_iso_and_shutter.log', echo_to_console=True)
 
-def calculate_iso_and_shutter(lux, config):
+def calculate_iso_and_shutter(lux, config, exposure_engine=None):
     """
     Calculate ISO and shutter speed based on the Lux value.
-    """
-    log(logger, f"Calculating ISO and shutter speed for Lux value: {lux}")
-
-    # Define Lux thresholds
-    lux_day_night_threshold = config['image']['lux_day_night_threshold']    # Start manual adjustments below this Lux
-    lux_night_min = config['image']['lux_night_min']                        # Minimum Lux value (darkest night)
-
-    # Get ISO and shutter speed settings from config
-    iso_day = config['camera_settings']['iso_day']                                    # Auto ISO during the day
-    iso_night = config['camera_settings']['iso_night']
-    shutter_speed_day = config['image']['shutter_speed_day']                     # 0 for auto-exposure during the day
-    shutter_speed_start = config['image']['shutter_speed_start']                  # Start manual shutter speed from here (µs)
-    shutter_speed_night = config['camera_settings']['shutter_speed_night']            # Max shutter speed at night
-
-    if lux >= lux_day_night_threshold:
-        # Daytime settings
-        iso = iso_day
-        shutter_speed = shutter_speed_day  # Use auto-exposure
-        daylight = True
-    elif lux <= lux_night_min:
-        # Nighttime settings
-        iso = iso_night
-        shutter_speed = shutter_speed_night
-        daylight = False
-    else:
-        # Transition period - interpolate between start and night settings
-        daylight = False
-        # Compute interpolation factor
-        factor = (lux_day_night_threshold - lux) / (lux_day_night_threshold - lux_night_min)
-        factor = max(0, min(factor, 1))
 
-        # Interpolate ISO
-        iso = iso_day + factor * (iso_night - iso_day)
-        iso = round(max(iso_day, min(iso, iso_night)), 1)
+    Between lux_day_night_threshold and lux_night_min the ISO and shutter speed are
+    interpolated, see ExposureEngine. Pass the running timelapse's engine to get
+    smoothing and hysteresis across frames.
 
-        # Interpolate shutter speed
-        shutter_speed = shutter_speed_start + factor * (shutter_speed_night - shutter_speed_start)
-        shutter_speed = int(round(max(shutter_speed_start, min(shutter_speed, shutter_speed_night)), 0))
+    Parameters:
+        lux (float): The Lux value.
+        config (Settings): The settings.
+        exposure_engine (ExposureEngine, optional): The engine of the running timelapse.
+            If None, the values are calculated from this Lux value alone.
 
-        # If shutter speed hasn't increased beyond the start point, use auto-exposure
-        if shutter_speed <= shutter_speed_start:
-            shutter_speed = 0  # Use auto-exposure
-            iso = iso_day      # Use auto ISO
+    Returns:
+        tuple: (iso, shutter_speed, daylight), iso and shutter_speed are None for auto exposure.
+    """
+    log(logger, "Calculating ISO and shutter speed for Lux value: %s", lux)
+
+    if exposure_engine is not None:
+        iso, shutter_speed, daylight = exposure_engine.update(lux)
+    else:
+        iso, shutter_speed, daylight = ExposureEngine(config).calculate(lux)
 
-    log(logger, f"ISO: {iso}, Shutter Speed: {shutter_speed if shutter_speed else 'auto'}, Daylight: {daylight}")
+    log(logger, "ISO: %s, Shutter Speed: %s, Daylight: %s", iso, shutter_speed or 'auto', daylight)
 
-    # Return None for shutter_speed and iso if auto-exposure is to be used
-    return iso if shutter_speed else None, shutter_speed if shutter_speed else None, daylight
+    # None for shutter_speed and iso if auto-exposure is to be used
+    return iso, shutter_speed, daylight
@@ -1,29 +1,70 @@
 # scripts/image/configure_camera.py
 
-import libcamera
-# from scripts.image.set_hdr_status import set_hdr_state  # Importing HDR functions
 from src.overlay.add_to_overlay_data import add_to_overlay_data
 from src.image.calculate_iso_and_shutter import calculate_iso_and_shutter  # Import the new function
 from src.log.logger import get_logger, log, log_warning, log_error
+from src.metrics.metrics import span
 logger = get_logger('configure_camera.log', echo_to_console=True)
 
-def configure_camera(picam2, config, lux=None):
+def get_control_enums(config):
+    """
+    Returns the module with the AfModeEnum and AwbModeEnum control values of the camera backend.
+
+    libcamera is only imported for the real camera, so the fake backend runs on any machine.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        module: libcamera.controls, or its stand-in from fake_camera.py.
+    """
+    if config['camera_settings'].get('backend', 'picamera2') == 'fake':
+        from src.camera.fake_camera import controls
+        return controls
+
+    import libcamera
+    return libcamera.controls
+
+@span('configure_camera.controls')
+def build_camera_controls(config, lux=None, context=None, exposure_engine=None, histogram_exposure=None):
+    """
+    Builds the libcamera controls for the next frame from the config and the Lux value.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        lux (float): The measured Lux value.
+        context (FrameContext, optional): Receives the ISO, shutter speed, daylight and quality
+            for the overlay. If None, they are written to overlay_data.json.
+        exposure_engine (ExposureEngine, optional): Smooths the exposure across frames, see calculate_iso_and_shutter().
+        histogram_exposure (HistogramExposure, optional): At night, replaces the Lux-based exposure
+            with the one measured from the previous frame's histogram.
+
+    Returns:
+        dict: The controls, for create_still_configuration() or set_controls().
+    """
     log(logger, "Configuring camera...")
-    focus_mode = libcamera.controls.AfModeEnum.Manual if config['camera_settings']['focus_mode'] == 'manual' else libcamera.controls.AfModeEnum.Auto  # type: ignore
+    control_enums = get_control_enums(config)
+    focus_mode = control_enums.AfModeEnum.Manual if config['camera_settings']['focus_mode'] == 'manual' else control_enums.AfModeEnum.Auto  # type: ignore
     lens_position = config['camera_settings']['lens_position'] if config['camera_settings']['focus_mode'] == 'manual' else None
 
-    iso, shutter_speed, daylight = calculate_iso_and_shutter(lux, config)
-    add_to_overlay_data('Iso', iso)
-    add_to_overlay_data('Shutterspeed', shutter_speed) 
-    add_to_overlay_data('Daylight', daylight) 
-    
-
+    iso, shutter_speed, daylight = calculate_iso_and_shutter(lux, config, exposure_engine)
+    if histogram_exposure is not None:
+        if daylight:
+            histogram_exposure.reset()
+        else:
+            iso, shutter_speed = histogram_exposure.adjust(iso, shutter_speed)
     quality = config['camera_settings']['image_quality']
-    add_to_overlay_data('Quality', quality)  # Add the quality to the overlay data
+
+    # Add the values to the overlay data
+    set_overlay_value = context.set if context is not None else add_to_overlay_data
+    set_overlay_value('Iso', iso)
+    set_overlay_value('Shutterspeed', shutter_speed)
+    set_overlay_value('Daylight', daylight)
+    set_overlay_value('Quality', quality)
     # Set common controls
     controls = {
         "AwbEnable": config['camera_settings']['awb_enable'],
-        "AwbMode": getattr(libcamera.controls.AwbModeEnum, config['camera_settings']['awb_mode']),  # type: ignore
+        "AwbMode": getattr(control_enums.AwbModeEnum, config['camera_settings']['awb_mode']),  # type: ignore
         "AfMode": focus_mode,
         "LensPosition": lens_position,
         "ColourGains": tuple(config['camera_settings']['colour_gains_day']) if daylight else tuple(config['camera_settings']['colour_gains_night']),
@@ -52,6 +93,21 @@ def configure_camera(picam2, config, lux=None):
     if daylight and exposure_value is not None:
         controls["ExposureValue"] = exposure_value  # Apply exposure compensation
 
+    return controls
+
+def configure_camera(picam2, config, lux=None):
+    """
+    Creates a still configuration for the camera with the controls for the given Lux value.
+
+    Parameters:
+        picam2 (Picamera2): The camera instance.
+        config (dict): The configuration dictionary.
+        lux (float): The measured Lux value.
+
+    Returns:
+        dict: The still configuration, to pass to picam2.configure().
+    """
+    controls = build_camera_controls(config, lux)
     return picam2.create_still_configuration(
         main={"size": tuple(config['camera_settings']['main_size'])},
         display=None,
@@ -0,0 +1,251 @@
+# src/image/deflicker.py
+
+import threading
+from collections import deque
+import numpy as np
+from PIL import Image
+
+# Luminance is measured on a copy reduced to about this width
+MEASURE_WIDTH = 160
+
+# Rec. 601 luma weights for R, G and B
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Frames darker than this mean luma (0-255) are not corrected, there is nothing to recover
+MIN_LUMA = 2.0
+
+# Corrections are limited to this factor either way
+MAX_GAIN = 4.0
+
+LEVELS = np.arange(256, dtype=np.float64)
+
+def image_luma(image, width=MEASURE_WIDTH):
+    """
+    Returns the mean luma (0-255) of an image, measured on a reduced copy.
+
+    Parameters:
+        image (PIL.Image): The image.
+        width (int): The image is reduced by a whole factor to about this width first.
+
+    Returns:
+        float: The mean luma.
+    """
+    factor = max(1, image.width // width)
+    small = image.reduce(factor) if factor > 1 else image
+    if small.mode != 'RGB':
+        small = small.convert('RGB')
+    return float((np.asarray(small, dtype=np.float32) @ LUMA_WEIGHTS).mean())
+
+def file_luma(path, width=MEASURE_WIDTH):
+    """
+    Returns the mean luma of an image file. JPEGs are scaled by libjpeg while decoding,
+    so this is much cheaper than a full decode.
+
+    Parameters:
+        path (str): The image file.
+        width (int): Approximate width to measure at.
+
+    Returns:
+        float: The mean luma (0-255).
+    """
+    with Image.open(path) as image:
+        image.draft('RGB', (width, width * image.height // image.width))
+        return image_luma(image.convert('RGB'), width)
+
+def smooth_luma(luma, window):
+    """
+    Centered rolling mean of luma values in log space, the edges are padded with the first and last value.
+
+    Parameters:
+        luma (numpy.ndarray): Mean luma per frame, in frame order.
+        window (int): Frames in the rolling window, made odd so it is centered.
+
+    Returns:
+        numpy.ndarray: The smoothed luma per frame.
+    """
+    luma = np.maximum(np.asarray(luma, dtype=np.float64), MIN_LUMA)
+    if window <= 1 or len(luma) < 2:
+        return luma
+    half = window // 2
+    log_luma = np.pad(np.log(luma), half, mode='edge')
+    cumulative = np.concatenate(([0.0], np.cumsum(log_luma)))
+    return np.exp((cumulative[2 * half + 1:] - cumulative[:-2 * half - 1]) / (2 * half + 1))
+
+def correction_luts(luma, target, method='gain', max_gain=MAX_GAIN):
+    """
+    Builds a 256-entry lookup table per frame that moves its mean luma to the target.
+
+    'gain' scales all levels, 'gamma' bends the tone curve so the highlights stay put
+    while the mid-tones move.
+
+    Parameters:
+        luma (numpy.ndarray): Measured mean luma per frame.
+        target (numpy.ndarray): Target (smoothed) mean luma per frame.
+        method (str): 'gain' or 'gamma'.
+        max_gain (float): Largest correction factor either way.
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (frames, 256).
+    """
+    luma = np.maximum(np.asarray(luma, dtype=np.float64), MIN_LUMA)
+    gain = np.clip(np.asarray(target, dtype=np.float64) / luma, 1 / max_gain, max_gain)[:, None]
+    if method == 'gamma':
+        # Solve (luma / 255) ^ gamma = luma * gain / 255 for gamma
+        mean = np.clip(luma[:, None] / 255, 1e-3, 0.999)
+        goal = np.clip(mean * gain, 1e-3, 0.999)
+        gamma = np.log(goal) / np.log(mean)
+        luts = 255 * (LEVELS / 255) ** gamma
+    else:
+        luts = LEVELS * gain
+    return np.clip(luts + 0.5, 0, 255).astype(np.uint8)
+
+def apply_lut(image, lut):
+    """
+    Applies a luma lookup table to every channel of an image.
+
+    Parameters:
+        image (PIL.Image): An RGB image.
+        lut (numpy.ndarray): 256 uint8 values.
+
+    Returns:
+        PIL.Image: The corrected image.
+    """
+    return image.point(lut.tolist() * len(image.getbands()))
+
+def correct_file(path, output, lut, quality=95):
+    """
+    Applies a lookup table to an image file and saves the result as a JPEG.
+
+    Parameters:
+        path (str): The source image.
+        output (str): The corrected image.
+        lut (numpy.ndarray): 256 uint8 values.
+        quality (int): JPEG quality.
+    """
+    with Image.open(path) as image:
+        apply_lut(image.convert('RGB'), lut).save(output, 'JPEG', quality=quality)
+
+def plan_deflicker(luma, window, method='gain', max_gain=MAX_GAIN):
+    """
+    Calculates the corrections for a whole sequence of frames at once.
+
+    Parameters:
+        luma (array-like): Mean luma per frame, in frame order.
+        window (int): Frames in the rolling window.
+        method (str): 'gain' or 'gamma'.
+        max_gain (float): Largest correction factor either way.
+
+    Returns:
+        numpy.ndarray: uint8 lookup tables, shape (frames, 256).
+    """
+    luma = np.asarray(luma, dtype=np.float64)
+    return correction_luts(luma, smooth_luma(luma, window), method, max_gain)
+
+class Deflicker:
+    """
+    Inline deflicker for the running timelapse.
+
+    Every frame is corrected toward the mean luma of the previous frames, in log
+    space. Only past frames are known at capture time, so the correction follows a
+    trailing window instead of the centered window of plan_deflicker().
+    """
+
+    def __init__(self, window=15, method='gain', max_gain=MAX_GAIN, history=None):
+        """
+        Parameters:
+            window (int): Frames in the trailing window.
+            method (str): 'gain' or 'gamma'.
+            max_gain (float): Largest correction factor either way.
+            history (list, optional): Mean luma of the most recent frames, oldest first.
+        """
+        self.window = window
+        self.method = method
+        self.max_gain = max_gain
+        self.history = deque((max(value, MIN_LUMA) for value in history or ()), maxlen=max(window, 1))
+        self._lock = threading.Lock()
+
+    def correct(self, image, luma=None):
+        """
+        Corrects a frame toward the recent mean luma and adds it to the history.
+
+        Parameters:
+            image (PIL.Image): The frame.
+            luma (float, optional): Its mean luma, if already measured.
+
+        Returns:
+            PIL.Image: The corrected frame, or the same image if no correction is needed.
+        """
+        if luma is None:
+            luma = image_luma(image)
+        with self._lock:
+            self.history.append(max(luma, MIN_LUMA))
+            target = float(np.exp(np.mean(np.log(self.history))))
+        if len(self.history) < 2 or abs(target / max(luma, MIN_LUMA) - 1) < 0.005:
+            return image
+        lut = correction_luts([luma], [target], self.method, self.max_gain)[0]
+        return apply_lut(image if image.mode == 'RGB' else image.convert('RGB'), lut)
+
+# One inline deflicker per process, keeps the history between frames
+_deflicker = None
+_deflicker_lock = threading.Lock()
+
+def get_deflicker(config, file_name=None):
+    """
+    Returns the shared inline Deflicker for the deflicker settings.
+
+    On first use, the history is seeded from the frame stats index, so a fresh
+    process (subprocess mode, restart) continues where the last one stopped.
+
+    Parameters:
+        config (Settings): The settings.
+        file_name (str, optional): The frame about to be corrected. It may already be
+            in the index, and is left out of the seed so correct() does not count it twice.
+
+    Returns:
+        Deflicker: The deflicker.
+    """
+    global _deflicker
+    settings = config['deflicker']
+    with _deflicker_lock:
+        if _deflicker is None or (_deflicker.window, _deflicker.method, _deflicker.max_gain) != (
+                settings['window'], settings['method'], settings['max_gain']):
+            history = _deflicker.history if _deflicker is not None else _recent_luma(config, settings['window'], file_name)
+            _deflicker = Deflicker(settings['window'], settings['method'], settings['max_gain'], list(history))
+        return _deflicker
+
+def _recent_luma(config, count, exclude=None):
+    if not config['frame_stats']['enabled']:
+        return []
+    try:
+        from src.catalog.frame_stats_index import get_frame_stats_index
+        rows = get_frame_stats_index(config['frame_stats']['index_file']).recent(count + 1)
+        return [row['mean_luma'] for row in rows if row['file_name'] != exclude][-count:]
+    except Exception:
+        return []
+
+if __name__ == "__main__":
+    # Deflicker a folder of frames into another folder:
+    #     python3 -m src.image.deflicker /var/www/html/images/2024/06/15 /tmp/deflickered --window 15
+    import argparse
+    import os
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Deflicker a folder of frames.")
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    parser.add_argument('--window', type=int, default=15)
+    parser.add_argument('--method', choices=('gain', 'gamma'), default='gain')
+    parser.add_argument('--workers', type=int)
+    arguments = parser.parse_args()
+
+    paths = sorted(entry.path for entry in os.scandir(arguments.source)
+                   if entry.is_file() and entry.name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    os.makedirs(arguments.destination, exist_ok=True)
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=arguments.workers) as executor:
+        luma = list(executor.map(file_luma, paths, chunksize=16))
+        luts = plan_deflicker(luma, arguments.window, arguments.method)
+        outputs = [os.path.join(arguments.destination, os.path.basename(path)) for path in paths]
+        list(executor.map(correct_file, paths, outputs, luts, chunksize=4))
+    print(f"Deflickered {len(paths)} frames in {time.perf_counter() - start_time:.1f} s")
@@ -0,0 +1,138 @@
+# src/image/derivatives.py
+
+import os
+import threading
+import time
+from src.pipeline.publisher import save_atomic
+
+def derivative_root(config, name):
+    """
+    Returns the root folder of a derivative's image tree.
+
+    Parameters:
+        config (Settings): The settings.
+        name (str): The derivative name, e.g. 'thumb'.
+
+    Returns:
+        str: derivatives.root_folder/<name>, or <image_output.root_folder>_<name> next to the full-size tree.
+    """
+    root_folder = config['derivatives']['root_folder']
+    if root_folder:
+        return os.path.join(root_folder, name)
+    return os.path.normpath(config['image_output']['root_folder']) + '_' + name
+
+def derivative_path(config, name, file_name):
+    """
+    Returns where a derivative of an image is saved, at the same place in the derivative's tree.
+
+    Parameters:
+        config (Settings): The settings.
+        name (str): The derivative name.
+        file_name (str): The path of the full-size image.
+
+    Returns:
+        str: The derivative path, always a .jpg.
+    """
+    relative = os.path.relpath(file_name, config['image_output']['root_folder'])
+    return os.path.splitext(os.path.join(derivative_root(config, name), relative))[0] + '.jpg'
+
+def derivative_status_file(status_file, name):
+    """
+    Returns the status symlink of a derivative, next to image_output.status_file.
+
+    Parameters:
+        status_file (str): The status_file setting, e.g. /var/www/html/status.jpg.
+        name (str): The derivative name.
+
+    Returns:
+        str: e.g. /var/www/html/status_thumb.jpg.
+    """
+    return os.path.splitext(status_file)[0] + f'_{name}.jpg'
+
+def scale_to_width(image, width):
+    """
+    Scales an image down to a width, keeping the aspect ratio.
+
+    Most of the reduction is done with reduce(), which averages whole blocks of
+    pixels and is much faster than a filtered resize of the full frame. Only the
+    last step, less than 2x, is a bicubic resize.
+
+    Parameters:
+        image (PIL.Image): The full-size image.
+        width (int): The target width. Images that are not wider are returned as they are.
+
+    Returns:
+        PIL.Image: The scaled image.
+    """
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    factor = image.width // width
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != (width, height):
+        from PIL import Image
+        image = image.resize((width, height), Image.BICUBIC)
+    return image
+
+def save_derivative(image, path, width, quality, fsync='file'):
+    """
+    Scales and saves one derivative, with an atomic rename like the full-size image.
+
+    Parameters:
+        image (PIL.Image): The full-size image.
+        path (str): Where to save the derivative.
+        width (int): The derivative width.
+        quality (int): JPEG quality.
+        fsync (str): The fsync policy, see save_atomic().
+
+    Returns:
+        float: Seconds spent scaling, encoding and writing.
+    """
+    start_time = time.monotonic()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    scaled = scale_to_width(image, width)
+    if scaled.mode != 'RGB':
+        scaled = scaled.convert('RGB')
+    save_atomic(path, lambda file: scaled.save(file, 'JPEG', quality=quality), fsync)
+    return time.monotonic() - start_time
+
+# Derivatives are scaled and encoded in threads, PIL releases the GIL while it works
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+def get_derivative_executor(workers):
+    """
+    Returns the shared thread pool for derivatives, recreated if the number of workers changed.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='derivatives')
+            _executor_workers = workers
+        return _executor
+
+def start_derivatives(image, file_name, config):
+    """
+    Starts saving the configured derivatives of a frame in the background.
+
+    Parameters:
+        image (PIL.Image): The full-size frame, with the overlay.
+        file_name (str): The path of the full-size image.
+        config (Settings): The settings.
+
+    Returns:
+        list: (name, path, future) per derivative. Each future returns the seconds spent on it.
+    """
+    settings = config['derivatives']
+    executor = get_derivative_executor(settings['workers'])
+    started = []
+    for size in settings['sizes']:
+        path = derivative_path(config, size['name'], file_name)
+        future = executor.submit(save_derivative, image, path, size['width'], size.get('quality', 85), config['publish']['fsync'])
+        started.append((size['name'], path, future))
+    return started
@@ -1,33 +1,24 @@
 import os
 import json
 import time
-from picamera2 import Picamera2
+from src.camera.camera_session import CameraSession
 from datetime import datetime
-import yaml
+from src.config.settings import get_settings
 from src.log.logger import get_logger, log, log_warning
 from src.overlay.add_to_overlay_data import add_metadata_to_overlay
+from src.catalog.capture_catalog import get_capture_catalog
+from src.metrics.metrics import span
 
 # Set base directory for the project (two levels up)
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
 
-# Paths for storing metadata and config
+# Paths for storing metadata
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 METADATA_FILE = os.path.join(DATA_DIR, 'evaluation_metadata.json')
-CONFIG_FILE = os.path.join(BASE_DIR, 'config.yaml')
 
 # Create a logger instance for evaluate_light.py
 logger = get_logger('evaluate_light.log', echo_to_console=True)
 
-def read_config():
-    """
-    Reads the configuration from config.yaml.
-
-    Returns:
-        dict: The configuration dictionary.
-    """
-    with open(CONFIG_FILE, 'r') as config_file:
-        return yaml.safe_load(config_file)
-
 def create_directory_if_not_exists(directory):
     """
     Creates the directory if it doesn't already exist.
@@ -80,66 +71,99 @@ def get_file_age_in_seconds(file_path):
         current_time = time.time()
         return int(current_time - file_mod_time)
     return None
-def evaluate_light():
+def get_stored_lux(config):
+    """
+    Returns the most recent stored Lux value and its age, from the capture catalog
+    or, if the catalog is disabled, from evaluation_metadata.json.
+
+    Parameters:
+        config (Settings): The settings.
+
+    Returns:
+        tuple: (lux, age in seconds), or (None, None) if there is no stored value.
+    """
+    catalog = get_capture_catalog(config)
+    if catalog is not None:
+        entry = catalog.latest()
+        if entry is None or entry.get('lux') is None:
+            return None, None
+        return entry['lux'], time.time() - entry['timestamp']
+
+    file_age = get_file_age_in_seconds(METADATA_FILE)
+    if file_age is None:
+        return None, None
+    metadata = load_metadata(METADATA_FILE)
+    if not metadata or metadata.get('Lux') is None:
+        return None, None
+    return metadata['Lux'], file_age
+
+def evaluate_light(session=None, context=None, config=None):
     """
     Evaluates the light level using the camera sensor without saving an image.
-    If a camera instance is provided, it will be used; otherwise, a new instance will be created.
-    Automatically saves the metadata to a JSON file in the root data directory.
+    If a camera session is provided, it will be used; otherwise, a new session will be opened and closed.
+    With image.lux_source set to 'feedback', the Lux value of the session's previous capture is used,
+    so only the first frame after the camera is (re)configured needs a metering pass.
+    Without the capture catalog, the metadata is saved to a JSON file in the root data directory.
     
     Parameters:
-        picam2 (Picamera2): The camera instance to use, or None to create a new instance.
+        session (CameraSession): The camera session to use, or None to open a new one.
+        context (FrameContext, optional): Receives the metadata for the overlay. If None, it is written to overlay_data.json.
+        config (Settings, optional): The settings, the shared settings are used if None.
     
     Returns:
         str: The Lux value.
     """
     # Load the configuration
-    config = read_config()
+    if config is None:
+        config = get_settings()
     evaluate_every = config.get('image', {}).get('evaluate_light_every', 0)
-    log(logger, f"Evaluate light every: {evaluate_every} seconds")
+    log(logger, "Evaluate light every: %s seconds", evaluate_every)
 
     # Create the data directory if it doesn't exist
     create_directory_if_not_exists(DATA_DIR)
 
-    # Check the file age
-    file_age = get_file_age_in_seconds(METADATA_FILE)
-
-    # If file exists and it's been modified recently, use the stored Lux value
-    if file_age is not None and evaluate_every > 0 and file_age < evaluate_every:
-        metadata = load_metadata(METADATA_FILE)
-        if metadata:
-            lux = round(metadata.get('Lux', 'N/A'), 1)
-            log(logger, f"Returning stored Lux value: {lux} (metadata file age: {file_age} seconds)")
+    # If the light was measured recently, use the stored Lux value
+    if evaluate_every > 0:
+        stored_lux, age = get_stored_lux(config)
+        if stored_lux is not None and age < evaluate_every:
+            lux = round(stored_lux, 1)
+            log(logger, "Returning stored Lux value: %s (age: %.0f seconds)", lux, age)
             return lux
 
-    # If the metadata file is old or doesn't exist, evaluate the light again
-    log(logger, "Evaluating light level...")
-
-    # Initialize the camera
-    picam2 = Picamera2()
-
-    # Configure the camera for minimal preview
-    preview_config = picam2.create_preview_configuration(main={"size": (640, 480)})
-    picam2.configure(preview_config)
-
-    # Start the camera
-    picam2.start()
-    time.sleep(1)  # Allow camera to warm up
-
-    # Capture sensor metadata
-    metadata = picam2.capture_metadata()
-
-    # Stop the camera
-    picam2.stop()
-    picam2.close()  # Ensure the camera is properly closed
-    log(logger, "Camera stopped after light evaluation.")
+    lux_source = config.get('image', {}).get('lux_source', 'feedback')
+    metadata = None
+    if session is not None and lux_source == 'feedback':
+        # Reuse the metadata of the previous frame's capture request
+        metadata = session.last_metadata
+        if metadata is not None:
+            log(logger, "Using Lux value from the previous capture: %s", metadata.get('Lux'))
+
+    if metadata is not None:
+        # No metering pass needed
+        log(logger, "Skipping light evaluation, using capture metadata.")
+    elif session is None:
+        # If the metadata file is old or doesn't exist, evaluate the light again
+        log(logger, "Evaluating light level...")
+
+        # Standalone evaluation, open the camera just for this reading
+        with span('evaluate_light.standalone'), CameraSession(config) as own_session:
+            metadata = own_session.meter(config)
+        log(logger, "Camera stopped after light evaluation.")
+    else:
+        log(logger, "Evaluating light level...")
+
+        # Capture sensor metadata, the camera keeps streaming for the capture
+        with span('evaluate_light.meter'):
+            metadata = session.meter(config)
 
     # Extract the Lux value for display purposes
     lux = round(metadata.get('Lux', 'N/A'), 1) if metadata else 'N/A'
 
-    add_metadata_to_overlay(metadata)  # Add the Lux value etc to the overlay data
+    add_metadata_to_overlay(metadata, context)  # Add the Lux value etc to the overlay data
 
-    # Save metadata to the file
-    save_metadata_to_file(metadata, METADATA_FILE)
+    # The capture catalog records the Lux of every frame, the file is only needed without it
+    if get_capture_catalog(config) is None:
+        save_metadata_to_file(metadata, METADATA_FILE)
     
     # Return the Lux value
     return lux
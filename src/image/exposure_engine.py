@@ -0,0 +1,266 @@
+# src/image/exposure_engine.py
+
+import sys
+import numpy as np
+
+# Number of points in the Lux -> (gain, exposure) lookup table
+LUT_SIZE = 1024
+
+# Block size for the vectorized EMA in replay()
+EMA_BLOCK = 256
+
+# Lower bound for Lux on the log curve, log(0) is undefined
+MIN_LOG_LUX = 0.01
+
+class ExposureEngine:
+    """
+    Turns Lux readings into ISO (analogue gain) and shutter speed for the night exposure.
+
+    Between lux_day_night_threshold and lux_night_min the gain and exposure follow a
+    curve that is precomputed into a lookup table: 'linear' in Lux (like
+    calculate_iso_and_shutter), or 'log', which spreads the change evenly over
+    the light levels of dusk and dawn.
+
+    For the running timelapse, update() smooths the Lux readings with an EMA in log
+    space and uses hysteresis on the auto/manual switch, so the exposure does not
+    flicker between auto and manual when the light hovers around the threshold.
+    replay() does the same for a whole array of logged Lux values at once.
+    """
+
+    def __init__(self, config):
+        """
+        Parameters:
+            config (Settings): The settings. image.exposure_curve, image.exposure_smoothing
+                and image.exposure_hysteresis control the curve, EMA and hysteresis.
+        """
+        self.smoothed_log_lux = None
+        self.daylight = None
+        self.reconfigure(config)
+
+    def reconfigure(self, config):
+        """
+        Rebuilds the lookup table from new settings. The smoothing and day/night state are kept.
+
+        Parameters:
+            config (Settings): The settings.
+        """
+        image = config['image']
+        camera_settings = config['camera_settings']
+        self.curve = image.get('exposure_curve', 'linear')
+        self.smoothing = image.get('exposure_smoothing', 0.0)
+        self.hysteresis = image.get('exposure_hysteresis', 0.0)
+        self.threshold = image['lux_day_night_threshold']
+        self.night_min = image['lux_night_min']
+        self.iso_day = camera_settings['iso_day']
+        self.iso_night = camera_settings['iso_night']
+        self.shutter_speed_day = image['shutter_speed_day']
+        self.shutter_speed_start = image['shutter_speed_start']
+        self.shutter_speed_night = camera_settings['shutter_speed_night']
+
+        # Lookup table over the transition, in the domain the curve is linear in
+        if self.curve == 'log':
+            self.lut_x = np.linspace(self._to_domain(self.night_min), self._to_domain(self.threshold), LUT_SIZE)
+        else:
+            self.lut_x = np.linspace(self.night_min, self.threshold, LUT_SIZE)
+        factor = self._factor(self.lut_x)
+        self.lut_gain = np.clip(self.iso_day + factor * (self.iso_night - self.iso_day), self.iso_day, self.iso_night)
+        self.lut_exposure = np.clip(
+            self.shutter_speed_start + factor * (self.shutter_speed_night - self.shutter_speed_start),
+            self.shutter_speed_start, self.shutter_speed_night
+        )
+
+    def _to_domain(self, lux):
+        if self.curve == 'log':
+            return np.log(np.maximum(lux, MIN_LOG_LUX))
+        return np.asarray(lux, dtype=np.float64)
+
+    def _factor(self, x):
+        """
+        Interpolation factor, 0 at the day/night threshold and 1 at the darkest night.
+        """
+        low, high = self._to_domain(self.night_min), self._to_domain(self.threshold)
+        return np.clip((high - x) / (high - low), 0.0, 1.0)
+
+    def lookup(self, lux):
+        """
+        Returns the manual gain and exposure for Lux values, from the lookup table.
+
+        Parameters:
+            lux (float or numpy.ndarray): Lux values.
+
+        Returns:
+            tuple: (analogue gain, exposure time in µs), arrays if lux is an array.
+        """
+        x = self._to_domain(lux)
+        gain = np.interp(x, self.lut_x, self.lut_gain)
+        exposure = np.interp(x, self.lut_x, self.lut_exposure)
+        return np.round(gain, 1), np.round(exposure)
+
+    def calculate(self, lux):
+        """
+        Stateless ISO and shutter speed for one Lux value, with the same result as calculate_iso_and_shutter().
+
+        Parameters:
+            lux (float): The Lux value.
+
+        Returns:
+            tuple: (iso, shutter_speed, daylight), iso and shutter_speed are None for auto exposure.
+        """
+        if lux >= self.threshold:
+            return None if not self.shutter_speed_day else self.iso_day, self.shutter_speed_day or None, True
+        gain, exposure = self.lookup(lux)
+        gain, exposure = float(gain), int(exposure)
+        if exposure <= self.shutter_speed_start:
+            # The shutter speed hasn't increased beyond the start point, use auto-exposure
+            return None, None, False
+        return gain, exposure, False
+
+    def update(self, lux):
+        """
+        Smooths a new Lux reading and returns the ISO and shutter speed for the next frame.
+
+        The camera switches to manual exposure when the smoothed Lux drops below the
+        threshold, and only back to auto exposure when it rises above the threshold
+        plus the hysteresis margin.
+
+        Parameters:
+            lux (float): The Lux value of the latest frame.
+
+        Returns:
+            tuple: (iso, shutter_speed, daylight), iso and shutter_speed are None for auto exposure.
+        """
+        log_lux = float(np.log(max(lux, MIN_LOG_LUX)))
+        if self.smoothed_log_lux is None:
+            self.smoothed_log_lux = log_lux
+        else:
+            self.smoothed_log_lux = self.smoothing * self.smoothed_log_lux + (1 - self.smoothing) * log_lux
+        smoothed = float(np.exp(self.smoothed_log_lux))
+
+        if self.daylight is None:
+            self.daylight = smoothed >= self.threshold
+        elif self.daylight and smoothed < self.threshold:
+            self.daylight = False
+        elif not self.daylight and smoothed >= self.threshold * (1 + self.hysteresis):
+            self.daylight = True
+
+        if self.daylight:
+            return None if not self.shutter_speed_day else self.iso_day, self.shutter_speed_day or None, True
+        if self.hysteresis == 0:
+            # Without hysteresis, behave exactly like calculate_iso_and_shutter()
+            return self.calculate(smoothed)
+        gain, exposure = self.lookup(smoothed)
+        return float(gain), int(exposure), False
+
+    def replay(self, lux_values):
+        """
+        Replays logged Lux values through the smoothing, hysteresis and lookup table.
+
+        Everything is vectorized, so months of readings take milliseconds. The engine's
+        own state is not changed.
+
+        Parameters:
+            lux_values (array-like): Lux readings in capture order.
+
+        Returns:
+            dict: Arrays 'lux' (smoothed), 'daylight', 'analogue_gain' and 'exposure_time'.
+                For daylight frames gain and exposure are 0 (auto exposure).
+        """
+        log_lux = np.log(np.maximum(np.asarray(lux_values, dtype=np.float64), MIN_LOG_LUX))
+        smoothed = np.exp(ema(log_lux, self.smoothing))
+
+        # Hysteresis: +1 where the frame switches to day, -1 where it switches to night,
+        # and every other frame keeps the state of the last switch before it
+        switch = np.zeros(len(smoothed), dtype=np.int8)
+        switch[smoothed >= self.threshold * (1 + self.hysteresis)] = 1
+        switch[smoothed < self.threshold] = -1
+        last_switch = np.maximum.accumulate(np.where(switch != 0, np.arange(len(switch)), 0))
+        daylight = switch[last_switch] == 1
+        if len(switch) and switch[0] == 0:
+            # Before the first switch, start in the state the threshold gives
+            undecided = last_switch == 0
+            daylight[undecided] = smoothed[0] >= self.threshold
+
+        gain, exposure = self.lookup(smoothed)
+        if self.hysteresis == 0:
+            auto = exposure <= self.shutter_speed_start
+            gain[auto], exposure[auto] = 0, 0
+        gain[daylight], exposure[daylight] = 0, 0
+        return {
+            'lux': smoothed,
+            'daylight': daylight,
+            'analogue_gain': gain,
+            'exposure_time': exposure.astype(np.int64),
+        }
+
+def ema(values, smoothing, block=EMA_BLOCK):
+    """
+    Exponential moving average y[n] = smoothing * y[n-1] + (1 - smoothing) * x[n], starting at y[0] = x[0].
+
+    Computed block by block with a lower-triangular weight matrix, so there is no Python loop per value.
+
+    Parameters:
+        values (numpy.ndarray): The input values.
+        smoothing (float): Weight of the history, 0 for no smoothing.
+        block (int): Values per block.
+
+    Returns:
+        numpy.ndarray: The smoothed values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if smoothing == 0 or len(values) == 0:
+        return values.copy()
+
+    alpha = 1 - smoothing
+    steps = np.arange(block)
+    # weights[i, j] = alpha * smoothing^(i - j) for j <= i
+    weights = np.tril(alpha * smoothing ** (steps[:, None] - steps[None, :]).clip(min=0))
+    carry_weights = smoothing ** (steps + 1)
+
+    result = np.empty_like(values)
+    previous = values[0]
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        size = len(chunk)
+        result[start:start + size] = weights[:size, :size] @ chunk + carry_weights[:size] * previous
+        previous = result[start + size - 1]
+    return result
+
+def load_lux_log(path):
+    """
+    Loads Lux values from a text file with one value per line, or CSV with Lux in the last column.
+
+    Parameters:
+        path (str): The file path.
+
+    Returns:
+        numpy.ndarray: The Lux values.
+    """
+    values = []
+    with open(path, 'r') as file:
+        for line in file:
+            field = line.strip().split(',')[-1]
+            try:
+                values.append(float(field))
+            except ValueError:
+                continue  # Header or empty line
+    return np.array(values)
+
+if __name__ == "__main__":
+    # Preview the exposure schedule for logged Lux values:
+    #     python3 -m src.image.exposure_engine lux.csv
+    import time
+    from src.config.settings import get_settings
+
+    lux_values = load_lux_log(sys.argv[1])
+    engine = ExposureEngine(get_settings())
+    start = time.perf_counter()
+    schedule = engine.replay(lux_values)
+    duration = time.perf_counter() - start
+
+    night = ~schedule['daylight']
+    switches = int(np.count_nonzero(np.diff(schedule['daylight'].astype(np.int8))))
+    print(f"Replayed {len(lux_values)} Lux values in {duration * 1000:.1f} ms")
+    print(f"Night frames: {int(night.sum())}, day/night switches: {switches}")
+    if night.any():
+        print(f"Exposure time: {schedule['exposure_time'][night].min()} - {schedule['exposure_time'][night].max()} µs, "
+              f"gain: {schedule['analogue_gain'][night].min()} - {schedule['analogue_gain'][night].max()}")
@@ -0,0 +1,47 @@
+# src/image/frame_stats.py
+
+import numpy as np
+
+# The stats are computed on a copy of the frame reduced to about this width
+STATS_WIDTH = 320
+
+# Rec. 601 luma weights for R, G and B
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Pixels with a channel at or above / luma at or below these count as clipped
+HIGHLIGHT_LEVEL = 250
+SHADOW_LEVEL = 5
+
+def compute_frame_stats(image, max_width=STATS_WIDTH):
+    """
+    Computes cheap quality statistics of a frame on a downscaled copy.
+
+    Parameters:
+        image (PIL.Image): The captured frame.
+        max_width (int): The frame is reduced by a whole factor to about this width first.
+
+    Returns:
+        dict: 'mean_luma' (0-255), 'sharpness' (variance of the Laplacian of the luma),
+            'highlights' and 'shadows' (fraction of clipped pixels) and 'mean_r',
+            'mean_g', 'mean_b' (0-255).
+    """
+    factor = max(1, image.width // max_width)
+    small = image.reduce(factor) if factor > 1 else image
+    if small.mode != 'RGB':
+        small = small.convert('RGB')
+    rgb = np.asarray(small, dtype=np.float32)
+    luma = rgb @ LUMA_WEIGHTS
+
+    # 4-neighbour Laplacian, a blurry or fogged frame has little high-frequency energy
+    laplacian = (4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1]
+                 - luma[1:-1, :-2] - luma[1:-1, 2:])
+    mean_rgb = rgb.reshape(-1, 3).mean(axis=0)
+    return {
+        'mean_luma': float(luma.mean()),
+        'sharpness': float(laplacian.var()) if laplacian.size else 0.0,
+        'highlights': float(np.count_nonzero(rgb.max(axis=2) >= HIGHLIGHT_LEVEL)) / luma.size,
+        'shadows': float(np.count_nonzero(luma <= SHADOW_LEVEL)) / luma.size,
+        'mean_r': float(mean_rgb[0]),
+        'mean_g': float(mean_rgb[1]),
+        'mean_b': float(mean_rgb[2]),
+    }
@@ -0,0 +1,313 @@
+# src/image/hdr.py
+
+import os
+import threading
+import numpy as np
+from src.log.logger import get_logger, log
+
+logger = get_logger('hdr.log', echo_to_console=True)
+
+# Shortest manual exposure time of a bracket in µs
+MIN_EXPOSURE_TIME = 100
+
+# Spread of the well-exposedness weight around mid-grey, on the 0-1 scale (Mertens et al.)
+WELL_EXPOSED_SIGMA = 0.2
+
+# Added to every weight, so pixels that are badly exposed in all frames still get a mix
+WEIGHT_EPSILON = 1e-12
+
+def bracket_stops(config, stack_count=1):
+    """
+    Returns the exposure offsets of the extra frames of an HDR bracket.
+
+    Parameters:
+        config (Settings): The settings.
+        stack_count (int): The number of exposures stacked into the frame, see burst_size().
+            Stacked night frames are not bracketed.
+
+    Returns:
+        list: The offsets in EV, empty if the frame is not bracketed.
+    """
+    if not config['camera_settings']['hdr'] or stack_count > 1:
+        return []
+    return list(config['hdr']['stops'])
+
+def bracket_controls(config, controls, metadata, stop):
+    """
+    Returns the manual controls for one extra frame of a bracket.
+
+    The exposure time of the normal frame, auto or manual, is scaled by 2 ** stop
+    at the same analogue gain.
+
+    Parameters:
+        config (Settings): The settings.
+        controls (dict): The controls of the normal frame.
+        metadata (dict): The metadata of the normal frame, for its actual exposure.
+        stop (float): The exposure offset in EV.
+
+    Returns:
+        dict: The controls.
+    """
+    max_exposure_time = config['hdr']['max_exposure_time'] or config['camera_settings']['shutter_speed_night']
+    exposure_time = metadata.get('ExposureTime') or controls.get('ExposureTime') or MIN_EXPOSURE_TIME
+    controls = dict(controls)
+    controls.pop('ExposureValue', None)
+    controls['AeEnable'] = False
+    controls['ExposureTime'] = int(min(max(exposure_time * 2 ** stop, MIN_EXPOSURE_TIME), max_exposure_time))
+    controls['AnalogueGain'] = metadata.get('AnalogueGain') or controls.get('AnalogueGain') or 1.0
+    return controls
+
+def capture_bracket(session, config, controls, metadata, stops):
+    """
+    Captures the extra frames of an HDR bracket from the running camera session.
+
+    The camera keeps the manual exposure of the last frame until the next frame's
+    controls are applied, which switch auto exposure back on in daylight. The
+    session's last_metadata is set back to the normal frame's, so the Lux feedback
+    of the next frame is not read from a bracket exposure.
+
+    Parameters:
+        session (CameraSession): The camera session the normal frame was captured with.
+        config (Settings): The settings.
+        controls (dict): The controls of the normal frame.
+        metadata (dict): The metadata of the normal frame.
+        stops (list): The exposure offsets in EV, see bracket_stops().
+
+    Returns:
+        list: The frames as numpy arrays, in the order of the stops.
+    """
+    frames = []
+    try:
+        for stop in stops:
+            bracket = bracket_controls(config, controls, metadata, stop)
+            session.apply(config, bracket)
+            request = session.capture_request()
+            if not request:
+                raise ValueError("Failed to capture bracket request, request is None")
+            try:
+                frames.append(request.make_array("main"))
+            finally:
+                # Always return the buffers, or the camera runs out of them
+                request.release()
+            log(logger, "Captured bracket frame at %+g EV, %d µs.", stop, bracket['ExposureTime'])
+    finally:
+        session.last_metadata = metadata
+    return frames
+
+def pyramid_down(image):
+    """
+    Blurs an image and halves its size, rounding up.
+
+    The separable 5-tap binomial filter [1 4 6 4 1] / 16 is only computed for the
+    rows and columns that are kept. The edges are mirrored.
+    """
+    padded = np.pad(image, ((2, 2), (2, 2)) + ((0, 0),) * (image.ndim - 2), mode='reflect')
+    rows = padded[0:-4:2] + padded[4::2]
+    rows += 4 * (padded[1:-3:2] + padded[3:-1:2])
+    rows += 6 * padded[2:-2:2]
+    reduced = rows[:, 0:-4:2] + rows[:, 4::2]
+    reduced += 4 * (rows[:, 1:-3:2] + rows[:, 3:-1:2])
+    reduced += 6 * rows[:, 2:-2:2]
+    reduced *= 1 / 256
+    return reduced
+
+def _upsample_rows(image, rows):
+    # Inserting zero rows and blurring, without computing the zeros: even rows are
+    # [1 6 1] / 8 of the source rows, odd rows the mean of two neighbouring rows
+    padded = np.pad(image, ((1, 1),) + ((0, 0),) * (image.ndim - 1), mode='reflect')
+    upsampled = np.empty((2 * image.shape[0],) + image.shape[1:], dtype=image.dtype)
+    even = upsampled[0::2]
+    np.add(padded[:-2], padded[2:], out=even)
+    even += 6 * image
+    even *= 1 / 8
+    odd = upsampled[1::2]
+    np.add(padded[1:-1], padded[2:], out=odd)
+    odd *= 0.5
+    return upsampled[:rows]
+
+def pyramid_up(image, shape):
+    """
+    Doubles the size of an image to shape, the inverse of pyramid_down() without the details.
+    """
+    upsampled = _upsample_rows(image, shape[0])
+    # The columns are upsampled as the rows of the transposed view, which is faster than slicing columns
+    return _upsample_rows(upsampled.swapaxes(0, 1), shape[1]).swapaxes(0, 1)
+
+def gaussian_pyramid(image, levels):
+    """
+    Returns the image and levels successively halved copies.
+    """
+    pyramid = [image]
+    for _ in range(levels):
+        pyramid.append(pyramid_down(pyramid[-1]))
+    return pyramid
+
+def laplacian_pyramid(image, levels):
+    """
+    Returns the band-pass details of each level, and the smallest Gaussian level last.
+    """
+    gaussian = gaussian_pyramid(image, levels)
+    pyramid = [level - pyramid_up(smaller, level.shape) for level, smaller in zip(gaussian, gaussian[1:])]
+    pyramid.append(gaussian[-1])
+    return pyramid
+
+def collapse_pyramid(pyramid):
+    """
+    Rebuilds an image from its Laplacian pyramid.
+    """
+    image = pyramid[-1]
+    for level in reversed(pyramid[:-1]):
+        image = pyramid_up(image, level.shape)
+        image += level
+    return image
+
+def exposure_weights(image, contrast=1.0, saturation=1.0, exposedness=1.0):
+    """
+    Returns the Mertens weight of every pixel of one exposure.
+
+    Parameters:
+        image (numpy.ndarray): The RGB exposure as float32, 0-1.
+        contrast (float): Exponent of the local contrast, the absolute Laplacian of the grey image.
+        saturation (float): Exponent of the saturation, the standard deviation of R, G and B.
+        exposedness (float): Exponent of how close the pixel is to mid-grey.
+
+    Returns:
+        numpy.ndarray: The weights, shape (height, width), float32.
+    """
+    # Per channel instead of reductions over the short last axis, which are much slower
+    red, green, blue = image[:, :, 0], image[:, :, 1], image[:, :, 2]
+    weight = np.ones(image.shape[:2], dtype=np.float32)
+    grey = (red + green + blue) * (1 / 3)
+    if contrast:
+        padded = np.pad(grey, 1, mode='reflect')
+        laplacian = np.abs(padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:] - 4 * grey)
+        weight *= laplacian ** contrast
+    if saturation:
+        deviation = np.sqrt(((red - grey) ** 2 + (green - grey) ** 2 + (blue - grey) ** 2) * (1 / 3))
+        weight *= deviation ** saturation
+    if exposedness:
+        # The product of the channels' Gaussians is the Gaussian of the summed squares
+        distance = (red - 0.5) ** 2 + (green - 0.5) ** 2 + (blue - 0.5) ** 2
+        weight *= np.exp(distance * (-0.5 * exposedness / WELL_EXPOSED_SIGMA ** 2))
+    weight += WEIGHT_EPSILON
+    return weight
+
+def fuse_tile(tiles, levels=5, contrast=1.0, saturation=1.0, exposedness=1.0):
+    """
+    Fuses the same area of every exposure with Mertens exposure fusion.
+
+    The exposures are blended level by level of their Laplacian pyramids, weighted
+    by the Gaussian pyramids of their normalized weights, so there are no seams
+    where the weights change.
+
+    Parameters:
+        tiles (list): The area of each exposure, RGB uint8 arrays of the same shape.
+        levels (int): Pyramid levels.
+        contrast, saturation, exposedness (float): See exposure_weights().
+
+    Returns:
+        numpy.ndarray: The fused area, RGB uint8.
+    """
+    images = [tile.astype(np.float32) * (1 / 255) for tile in tiles]
+    weights = [exposure_weights(image, contrast, saturation, exposedness) for image in images]
+    total = sum(weights)
+
+    fused = None
+    for image, weight in zip(images, weights):
+        weight /= total
+        contributions = [detail * weight_level[:, :, None] for detail, weight_level
+                         in zip(laplacian_pyramid(image, levels), gaussian_pyramid(weight, levels))]
+        if fused is None:
+            fused = contributions
+        else:
+            for level, contribution in zip(fused, contributions):
+                level += contribution
+    image = collapse_pyramid(fused)
+    image *= 255
+    np.clip(image + 0.5, 0, 255, out=image)
+    return image.astype(np.uint8)
+
+def tile_margin(levels):
+    """
+    Returns how far a tile is extended on every side, so the pyramid of the extended
+    tile reaches as far as the pyramid of the whole frame would.
+    """
+    return 2 ** (levels + 1)
+
+# Tiles are fused in threads, the large NumPy operations release the GIL
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+def get_fusion_executor(workers):
+    """
+    Returns the shared thread pool for fusing tiles, recreated if the number of workers changed.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hdr')
+            _executor_workers = workers
+        return _executor
+
+def fuse_exposures(frames, levels=5, tile_size=512, workers=None, contrast=1.0, saturation=1.0, exposedness=1.0):
+    """
+    Fuses an exposure bracket into one frame, tile by tile in parallel.
+
+    Each tile is fused with a margin of its neighbours' pixels, and only its inner
+    part is kept, so the tiles join without seams. Only the tiles being fused are
+    converted to float32, so a 4K bracket needs little more memory than the frames.
+
+    Parameters:
+        frames (list): The exposures, RGB uint8 numpy arrays of the same shape.
+        levels (int): Pyramid levels.
+        tile_size (int): Width and height of the tiles.
+        workers (int, optional): Tiles fused at the same time, the number of CPU cores if None.
+        contrast, saturation, exposedness (float): See exposure_weights().
+
+    Returns:
+        numpy.ndarray: The fused RGB frame, uint8.
+    """
+    height, width = frames[0].shape[:2]
+    # The same levels for every tile, also for the small ones at the edges, or they would not match
+    levels = max(min(levels, int(np.log2(min(height, width))) - 2), 0)
+    margin = tile_margin(levels)
+    result = np.empty_like(frames[0])
+
+    def fuse(top, left):
+        bottom, right = min(top + tile_size, height), min(left + tile_size, width)
+        outer_top, outer_left = max(top - margin, 0), max(left - margin, 0)
+        outer_bottom, outer_right = min(bottom + margin, height), min(right + margin, width)
+        fused = fuse_tile([frame[outer_top:outer_bottom, outer_left:outer_right] for frame in frames],
+                          levels, contrast, saturation, exposedness)
+        result[top:bottom, left:right] = fused[top - outer_top:bottom - outer_top, left - outer_left:right - outer_left]
+
+    executor = get_fusion_executor(workers or os.cpu_count() or 1)
+    tiles = [(top, left) for top in range(0, height, tile_size) for left in range(0, width, tile_size)]
+    # list() waits for every tile and raises the first error
+    list(executor.map(lambda tile: fuse(*tile), tiles))
+    return result
+
+def fuse_bracket(frames, config):
+    """
+    Fuses an HDR bracket with the hdr settings.
+
+    Parameters:
+        frames (list): The normal frame and the bracket frames, as numpy arrays.
+        config (Settings): The settings.
+
+    Returns:
+        PIL.Image: The fused frame.
+    """
+    from PIL import Image
+
+    hdr = config['hdr']
+    image = fuse_exposures(
+        frames, levels=hdr['levels'], tile_size=hdr['tile_size'], workers=hdr['workers'],
+        contrast=hdr['contrast_weight'], saturation=hdr['saturation_weight'], exposedness=hdr['exposure_weight'],
+    )
+    log(logger, "Fused %d exposures.", len(frames))
+    return Image.fromarray(image)
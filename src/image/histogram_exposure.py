@@ -0,0 +1,214 @@
+# src/image/histogram_exposure.py
+
+import numpy as np
+from src.image.stacking import gain_lut
+from src.log.logger import get_logger, log
+
+logger = get_logger('histogram_exposure.log', echo_to_console=True)
+
+# Every n-th row and column of the lores luma is used, 1280x720 becomes 640x360
+SUBSAMPLE = 2
+
+# Luma values at or above / at or below these count as clipped
+HIGHLIGHT_LEVEL = 250
+SHADOW_LEVEL = 5
+
+# Max correction per frame, as a factor of the total exposure
+MAX_STEP = 4.0
+
+# Shortest manual exposure time in µs
+MIN_EXPOSURE_TIME = 100
+
+def luma_stats(luma, subsample=SUBSAMPLE):
+    """
+    Computes the luma histogram, mean and clipping of a frame.
+
+    Parameters:
+        luma (numpy.ndarray): 2D uint8 luma (the Y plane of a YUV frame). Not copied.
+        subsample (int): Use every n-th row and column.
+
+    Returns:
+        dict: See histogram_stats().
+    """
+    sample = luma[::subsample, ::subsample]
+    return histogram_stats(np.bincount(sample.ravel(), minlength=256))
+
+def histogram_stats(histogram):
+    """
+    Computes the mean and clipping of a luma histogram.
+
+    Parameters:
+        histogram (numpy.ndarray): 256 pixel counts.
+
+    Returns:
+        dict: 'histogram' (256 counts), 'mean' (0-255), 'highlights' and 'shadows'
+            (fraction of clipped pixels).
+    """
+    total = histogram.sum()
+    return {
+        'histogram': histogram,
+        'mean': float(histogram @ np.arange(256)) / total,
+        'highlights': float(histogram[HIGHLIGHT_LEVEL:].sum()) / total,
+        'shadows': float(histogram[:SHADOW_LEVEL + 1].sum()) / total,
+    }
+
+def stacked_stats(stats, gain):
+    """
+    Returns the stats of a frame brightened by gain in linear light, like stack_frames() does,
+    from the histogram of one of its exposures. Levels pushed past white count as highlights.
+
+    Parameters:
+        stats (dict): The luma_stats() of one exposure.
+        gain (float): The number of exposures in the stack.
+
+    Returns:
+        dict: See histogram_stats().
+    """
+    histogram = np.bincount(gain_lut(float(gain)), weights=stats['histogram'], minlength=256)
+    return histogram_stats(histogram.astype(np.int64))
+
+def request_luma_stats(request, size, stream="lores"):
+    """
+    Computes luma_stats() straight from a request's YUV420 buffer, without copying the frame.
+
+    Parameters:
+        request: The capture request, before it is released.
+        size (tuple): The (width, height) of the stream.
+        stream (str): The stream name.
+
+    Returns:
+        dict: See luma_stats().
+    """
+    width, height = size
+    mapped_array = getattr(request, 'mapped_array', None)
+    if mapped_array is None:
+        from picamera2 import MappedArray
+        mapped_array = lambda name: MappedArray(request, name)
+
+    # The YUV420 buffer is (height * 3 / 2, stride), the Y plane is the top rows
+    with mapped_array(stream) as mapped:
+        return luma_stats(mapped.array[:height, :width])
+
+def load_sample_luma(path):
+    """
+    Loads a stored sample frame as luma, for testing the controller without a camera.
+
+    Parameters:
+        path (str): A .npy file with a 2D uint8 array, or an image file.
+
+    Returns:
+        numpy.ndarray: The 2D uint8 luma.
+    """
+    if path.endswith('.npy'):
+        return np.load(path)
+    from PIL import Image
+    return np.asarray(Image.open(path).convert('L'))
+
+class HistogramExposure:
+    """
+    Adjusts ExposureTime and AnalogueGain at night so the frame's mean brightness moves
+    toward a target, measured on the low-resolution stream.
+
+    The Lux value from the sensor is often wrong under street lights or moonlight, so
+    after the first night frame the measured histogram of the previous frame decides
+    the next exposure. Exposure time is raised first, then gain.
+    """
+
+    def __init__(self, config):
+        """
+        Parameters:
+            config (Settings): The settings.
+        """
+        self.reconfigure(config)
+        self.reset()
+
+    def reconfigure(self, config):
+        """
+        Reads new settings, the current exposure is kept.
+
+        Parameters:
+            config (Settings): The settings.
+        """
+        image = config['image']
+        camera_settings = config['camera_settings']
+        self.target = image.get('histogram_target', 0.4) * 255
+        self.max_clipped = image.get('histogram_max_clipped', 0.01)
+        self.damping = image.get('histogram_damping', 0.5)
+        self.max_exposure_time = camera_settings['shutter_speed_night']
+        self.max_gain = camera_settings['iso_night']
+        self.min_gain = 1.0
+        self.lores_size = tuple(camera_settings.get('lores_size') or ())
+
+    def reset(self):
+        """
+        Forgets the measured exposure, e.g. when the camera switches to daytime auto exposure.
+        """
+        self.exposure_time = None
+        self.analogue_gain = None
+        self.last_stats = None
+
+    def observe(self, stats, metadata, stack_gain=1.0):
+        """
+        Calculates the next exposure from the stats and the exposure of the measured frame.
+
+        Parameters:
+            stats (dict): The frame's luma_stats().
+            metadata (dict): The frame's request metadata, for its actual ExposureTime and AnalogueGain.
+            stack_gain (float): For one exposure of a stacked burst, the number of exposures.
+                The stats are converted to those of the stacked frame with stacked_stats(), and
+                the exposure is controlled as if the burst were one long exposure, and split
+                again for the next burst.
+
+        Returns:
+            tuple: The next (analogue gain, exposure time in µs).
+        """
+        if stack_gain != 1.0:
+            stats = stacked_stats(stats, stack_gain)
+        self.last_stats = stats
+        current = metadata.get('ExposureTime', MIN_EXPOSURE_TIME) * metadata.get('AnalogueGain', 1.0) * stack_gain
+        mean = stats['mean']
+
+        # Correct toward the target mean in log space, damped to avoid oscillation
+        ratio = self.target / max(mean, 1.0)
+        if stats['highlights'] > self.max_clipped:
+            ratio = min(ratio, 1 / (1 + stats['highlights'] * 10))
+        ratio = min(max(ratio, 1 / MAX_STEP), MAX_STEP) ** (1 - self.damping)
+        total = current * ratio
+
+        # Prefer a longer exposure over more gain, to keep the noise down
+        exposure_time = min(max(total / self.min_gain, MIN_EXPOSURE_TIME), self.max_exposure_time)
+        gain = min(max(total / exposure_time, self.min_gain), self.max_gain)
+        self.exposure_time, self.analogue_gain = int(exposure_time), round(gain, 2)
+
+        log(logger, "Histogram mean %.1f, highlights %.2f%%, next exposure %d µs at gain %s",
+            mean, stats['highlights'] * 100, self.exposure_time, self.analogue_gain)
+        return self.analogue_gain, self.exposure_time
+
+    def measure(self, request, metadata, stack_gain=1.0):
+        """
+        Measures a captured request's lores stream and calculates the next exposure.
+
+        Parameters:
+            request: The capture request, before it is released.
+            metadata (dict): The request metadata.
+            stack_gain (float): See observe().
+
+        Returns:
+            tuple: The next (analogue gain, exposure time in µs).
+        """
+        return self.observe(request_luma_stats(request, self.lores_size), metadata, stack_gain)
+
+    def adjust(self, iso, shutter_speed):
+        """
+        Replaces the Lux-based night exposure with the measured one, once there is one.
+
+        Parameters:
+            iso (float): The Lux-based analogue gain.
+            shutter_speed (int): The Lux-based exposure time in µs.
+
+        Returns:
+            tuple: (iso, shutter_speed) for the next frame.
+        """
+        if self.exposure_time is None:
+            return iso, shutter_speed
+        return self.analogue_gain, self.exposure_time
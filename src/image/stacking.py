@@ -0,0 +1,340 @@
+# src/image/stacking.py
+
+from functools import lru_cache
+import numpy as np
+from src.log.logger import get_logger, log, log_warning
+
+logger = get_logger('stacking.log', echo_to_console=True)
+
+# Added to the cross-power spectrum magnitude, so empty frequencies do not divide by zero
+EPSILON = 1e-9
+
+# Steps of the table that encodes linear light back to 8-bit levels, fine enough for the darkest levels
+ENCODE_STEPS = 65536
+
+def srgb_to_linear(levels):
+    """
+    Converts gamma-encoded 0-255 levels to linear light in 0-1 with the sRGB curve.
+
+    The camera's RGB and luma output is gamma-encoded with a curve close to sRGB,
+    so exposures only add up and scale in proportion to the light after this.
+
+    Parameters:
+        levels (numpy.ndarray): The levels.
+
+    Returns:
+        numpy.ndarray: Linear light, float32.
+    """
+    values = np.asarray(levels, dtype=np.float32) / 255
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+def linear_to_srgb(linear):
+    """
+    Converts linear light in 0-1 to gamma-encoded 0-255 levels, the inverse of srgb_to_linear().
+    Light above 1 clips to white.
+
+    Parameters:
+        linear (numpy.ndarray): Linear light.
+
+    Returns:
+        numpy.ndarray: The levels, float32.
+    """
+    values = np.clip(np.asarray(linear, dtype=np.float32), 0, 1)
+    return (255 * np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055)).astype(np.float32)
+
+# Level -> linear light, and linear light in ENCODE_STEPS steps -> level
+LINEAR = srgb_to_linear(np.arange(256))
+ENCODE = (linear_to_srgb(np.arange(ENCODE_STEPS) / (ENCODE_STEPS - 1)) + 0.5).astype(np.uint8)
+
+def encode_linear(linear):
+    """
+    Encodes linear light to uint8 levels with the ENCODE table, much faster than the power curve.
+
+    Parameters:
+        linear (numpy.ndarray): Linear light, float32, not negative. Overwritten.
+
+    Returns:
+        numpy.ndarray: The levels, uint8.
+    """
+    linear *= ENCODE_STEPS - 1
+    linear += 0.5
+    np.minimum(linear, ENCODE_STEPS - 1, out=linear)
+    return ENCODE.take(linear.astype(np.uint16))
+
+@lru_cache(maxsize=None)
+def gain_lut(gain):
+    """
+    Returns what each level becomes when its light is multiplied by gain, e.g. when
+    a stack of short exposures is brightened to the long exposure they replace.
+
+    Parameters:
+        gain (float): The brightness factor in linear light.
+
+    Returns:
+        numpy.ndarray: 256 uint8 levels.
+    """
+    return encode_linear(LINEAR * gain)
+
+def burst_size(config, controls):
+    """
+    Returns how many exposures the next frame is stacked from.
+
+    Only manual night exposures of at least stacking.min_exposure_time are split
+    into a burst, daytime auto exposure is always a single frame.
+
+    Parameters:
+        config (Settings): The settings.
+        controls (dict): The camera controls of the next frame.
+
+    Returns:
+        int: The number of exposures, 1 for a single frame.
+    """
+    stacking = config['stacking']
+    exposure_time = controls.get('ExposureTime')
+    if not stacking['enabled'] or controls.get('AeEnable', True) or not exposure_time:
+        return 1
+    if exposure_time < stacking['min_exposure_time']:
+        return 1
+    return stacking['frames']
+
+def burst_controls(controls, frames):
+    """
+    Splits the exposure time of the controls over the exposures of a burst.
+
+    Parameters:
+        controls (dict): The camera controls of the next frame.
+        frames (int): The number of exposures.
+
+    Returns:
+        dict: The controls for each exposure of the burst.
+    """
+    controls = dict(controls)
+    controls['ExposureTime'] = max(int(controls['ExposureTime'] / frames), 1)
+    return controls
+
+def downscale_luma(frame, factor):
+    """
+    Returns the luma of a frame reduced by block averaging, as float32.
+    The factor must be at most 256.
+
+    Averaging factor x factor blocks instead of skipping pixels also averages out
+    most of the sensor noise, which would otherwise dominate the correlation.
+
+    Parameters:
+        frame (numpy.ndarray): An RGB frame of shape (height, width, 3), uint8.
+        factor (int): The block size.
+
+    Returns:
+        numpy.ndarray: The reduced luma, shape (height // factor, width // factor).
+    """
+    height, width = frame.shape[0] // factor * factor, frame.shape[1] // factor * factor
+    # Summing the rows of each block first, in integers, is much faster than one float mean
+    rows = frame[:height, :width].reshape(height // factor, factor, -1).sum(axis=1, dtype=np.uint16)
+    blocks = rows.reshape(height // factor, width // factor, -1).sum(axis=2, dtype=np.uint32)
+    return blocks.astype(np.float32) / (factor * factor * frame.shape[2])
+
+def _spectrum(luma):
+    # Remove the mean and taper the edges, so the image border does not correlate with itself
+    window = np.outer(np.hanning(luma.shape[0]), np.hanning(luma.shape[1])).astype(np.float32)
+    return np.fft.rfft2((luma - luma.mean()) * window)
+
+def phase_correlation(reference_spectrum, luma):
+    """
+    Finds the translation of a frame against the reference by phase correlation.
+
+    Parameters:
+        reference_spectrum (numpy.ndarray): _spectrum() of the reference luma.
+        luma (numpy.ndarray): The reduced luma of the frame, the same shape as the reference.
+
+    Returns:
+        tuple: (dy, dx) in reduced pixels, with sub-pixel precision: the frame's
+            content is moved by this much against the reference.
+    """
+    cross = np.conj(reference_spectrum) * _spectrum(luma)
+    cross /= np.abs(cross) + EPSILON
+    correlation = np.fft.irfft2(cross, s=luma.shape)
+    peak_y, peak_x = np.unravel_index(np.argmax(correlation), correlation.shape)
+    height, width = luma.shape
+    # Fit a parabola through the peak and its neighbours, the correlation wraps around
+    dy = peak_y + _peak_offset(correlation[(peak_y - 1) % height, peak_x], correlation[peak_y, peak_x],
+                               correlation[(peak_y + 1) % height, peak_x])
+    dx = peak_x + _peak_offset(correlation[peak_y, (peak_x - 1) % width], correlation[peak_y, peak_x],
+                               correlation[peak_y, (peak_x + 1) % width])
+    # The upper half of the range are negative shifts
+    if dy > height / 2:
+        dy -= height
+    if dx > width / 2:
+        dx -= width
+    return float(dy), float(dx)
+
+def _peak_offset(before, peak, after):
+    curvature = before - 2 * peak + after
+    return 0.5 * (before - after) / curvature if curvature < 0 else 0.0
+
+def align_burst(frames, align_width=640, max_shift=100):
+    """
+    Estimates the translation of every frame of a burst against the first frame.
+
+    Parameters:
+        frames (list): RGB frames as uint8 numpy arrays of the same shape.
+        align_width (int): The frames are reduced to about this width for the correlation.
+        max_shift (int): Frames moved by more than this many pixels, e.g. by a gust of
+            wind or a passing car, are left out of the stack.
+
+    Returns:
+        list: A (dy, dx) shift in full-size pixels per frame, or None for a left out frame.
+    """
+    factor = min(max(frames[0].shape[1] // align_width, 1), 256)
+    reference_spectrum = _spectrum(downscale_luma(frames[0], factor))
+    shifts = [(0, 0)]
+    for index, frame in enumerate(frames[1:], start=1):
+        dy, dx = phase_correlation(reference_spectrum, downscale_luma(frame, factor))
+        shift = (round(dy * factor), round(dx * factor))
+        if max(abs(shift[0]), abs(shift[1])) > max_shift:
+            log_warning(logger, "Frame %d of the burst moved by %s pixels, leaving it out of the stack.", index, shift)
+            shift = None
+        shifts.append(shift)
+    return shifts
+
+def aligned_rows(frame, shift, start, end, fill):
+    """
+    Returns rows start to end of a frame moved back onto the reference.
+
+    Parameters:
+        frame (numpy.ndarray): The RGB frame.
+        shift (tuple): Its (dy, dx) from align_burst().
+        start (int): First row.
+        end (int): Row after the last one.
+        fill (numpy.ndarray): The same rows of the reference, used where the moved frame has no pixels.
+
+    Returns:
+        numpy.ndarray: The rows, a view of the frame if it did not move.
+    """
+    dy, dx = shift
+    if dy == 0 and dx == 0:
+        return frame[start:end]
+    height, width = frame.shape[:2]
+    rows = fill.copy()
+    source_start, source_end = max(start + dy, 0), min(end + dy, height)
+    column_start, column_end = max(-dx, 0), min(width - dx, width)
+    if source_start < source_end and column_start < column_end:
+        rows[source_start - dy - start:source_end - dy - start, column_start:column_end] = \
+            frame[source_start:source_end, column_start + dx:column_end + dx]
+    return rows
+
+@lru_cache(maxsize=None)
+def sorting_network(count):
+    """
+    Returns the compare-exchange pairs of Batcher's merge-exchange sort for count values.
+
+    Parameters:
+        count (int): The number of values.
+
+    Returns:
+        tuple: (i, j) pairs, after exchanging every pair so value i <= value j the values are sorted.
+    """
+    pairs = []
+    if count < 2:
+        return ()
+    bits = (count - 1).bit_length()
+    p = 1 << (bits - 1)
+    while p > 0:
+        q, r, d = 1 << (bits - 1), 0, p
+        while True:
+            pairs.extend((i, i + d) for i in range(count - d) if i & p == r)
+            if q == p:
+                break
+            d, q, r = q - p, q // 2, p
+        p //= 2
+    return tuple(pairs)
+
+def median_rows(rows):
+    """
+    Returns the per-pixel median of a few frames, as float32.
+
+    With the few exposures of a burst, a sorting network of element-wise minimum and
+    maximum is several times faster than numpy.median() over a stacked array.
+
+    Parameters:
+        rows (list): uint8 or float32 arrays of the same shape.
+
+    Returns:
+        numpy.ndarray: The median.
+    """
+    rows = list(rows)
+    for i, j in sorting_network(len(rows)):
+        rows[i], rows[j] = np.minimum(rows[i], rows[j]), np.maximum(rows[i], rows[j])
+    middle = len(rows) // 2
+    if len(rows) % 2:
+        return rows[middle].astype(np.float32)
+    median = rows[middle - 1].astype(np.float32)
+    median += rows[middle]
+    median *= 0.5
+    return median
+
+def stack_frames(frames, shifts=None, method='mean', gain=1.0, chunk_rows=128):
+    """
+    Stacks aligned frames into one frame, a band of rows at a time.
+
+    The frames are gamma-encoded, so they are averaged and brightened in linear light
+    and encoded again. Only one band is converted to float32 at a time, so stacking a
+    4K burst needs little more memory than the frames themselves.
+
+    Parameters:
+        frames (list): RGB frames as uint8 numpy arrays of the same shape.
+        shifts (list, optional): A (dy, dx) or None per frame, see align_burst(). All (0, 0) if None.
+        method (str): 'mean', or 'median' to also remove outliers like hot pixels and planes.
+        gain (float): Brightness factor in linear light, e.g. the number of frames
+            to match a single exposure as long as the whole burst.
+        chunk_rows (int): Rows per band.
+
+    Returns:
+        numpy.ndarray: The stacked RGB frame, uint8.
+    """
+    if shifts is None:
+        shifts = [(0, 0)] * len(frames)
+    used = [(frame, shift) for frame, shift in zip(frames, shifts) if shift is not None]
+    reference = frames[0]
+    height = reference.shape[0]
+    result = np.empty_like(reference)
+
+    for start in range(0, height, chunk_rows):
+        end = min(start + chunk_rows, height)
+        fill = reference[start:end]
+        # take() is the fastest lookup of the linear light of each level
+        linear = (LINEAR.take(aligned_rows(frame, shift, start, end, fill)) for frame, shift in used)
+        if method == 'median':
+            stacked = median_rows(linear)
+        else:
+            stacked = next(linear)
+            for rows in linear:
+                stacked += rows
+            stacked /= len(used)
+        if gain != 1.0:
+            stacked *= gain
+        result[start:end] = encode_linear(stacked)
+    return result
+
+def stack_burst(frames, config, gain=None):
+    """
+    Aligns and stacks a burst with the stacking settings.
+
+    Parameters:
+        frames (list): RGB frames as uint8 numpy arrays, e.g. from request.make_array("main").
+        config (Settings): The settings.
+        gain (float, optional): Brightness factor, the number of frames if None.
+
+    Returns:
+        PIL.Image: The stacked frame.
+    """
+    from PIL import Image
+
+    stacking = config['stacking']
+    shifts = align_burst(frames, stacking['align_width'], stacking['max_shift']) if stacking['align'] else None
+    image = stack_frames(
+        frames, shifts, method=stacking['method'], gain=len(frames) if gain is None else gain,
+        chunk_rows=stacking['chunk_rows'],
+    )
+    used = len(frames) if shifts is None else sum(shift is not None for shift in shifts)
+    log(logger, "Stacked %d of %d frames (%s).", used, len(frames), stacking['method'])
+    return Image.fromarray(image)
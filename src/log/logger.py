@@ -1,110 +1,256 @@
+import atexit
+import contextvars
+import json
 import logging
 import os
-import yaml
-from logging.handlers import RotatingFileHandler
-from colored import fg, attr
+import queue
+import threading
+from datetime import datetime
+from src.config.settings import BASE_DIR, ConfigError, get_settings
+
+LOG_DIR = os.path.join(BASE_DIR, 'logs')
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The frame the current thread is working on, added to every record as frame_id
+_frame_id = contextvars.ContextVar('frame_id', default=None)
 
 # Function to read config.yaml
 def read_config():
-    config_path = 'config.yaml'
-    if os.path.exists(config_path):
-        with open(config_path, 'r') as file:
-            return yaml.safe_load(file)
-    return {}
+    try:
+        return get_settings()
+    except ConfigError:
+        return {}
 
 # Function to check if logging is enabled for a specific script
-def is_logging_enabled(script_name):
-    config = read_config()
+def is_logging_enabled(script_name, config=None):
+    if config is None:
+        config = read_config()
     return config.get('log', {}).get(script_name, False)
 
-def get_logger(log_file_name, echo_to_console=False):
-    script_name = log_file_name.replace('.log', '')
-
-    # Check if logging is enabled for the script
-    if not is_logging_enabled(script_name):
-        return logging.getLogger('dummy')
-
-    log_levels = read_config().get('log', {}).get('levels', [])
-    
-    # Handle 'all' case or default log levels
-    if 'all' in log_levels:
-        log_levels = ['info', 'warning', 'error']
-    
-    # Create 'logs' folder if it does not exist
-    log_dir = 'logs'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    log_file_path = os.path.join(log_dir, log_file_name)
-    logger = logging.getLogger(log_file_name)
+def set_frame_id(frame_id):
+    """
+    Sets the frame ID that is added to the log records of the current thread.
+
+    Parameters:
+        frame_id (str): The frame ID, or None outside of a frame.
+
+    Returns:
+        contextvars.Token: Pass to reset_frame_id() to restore the previous frame ID.
+    """
+    return _frame_id.set(frame_id)
+
+def reset_frame_id(token):
+    _frame_id.reset(token)
+
+def get_frame_id():
+    return _frame_id.get()
+
+class ColoredFormatter(logging.Formatter):
+    """
+    Colors the level and message of console output, the date stays white.
+    """
+    COLORS = {'INFO': 'green', 'WARNING': 'yellow', 'ERROR': 'red'}
+
+    def format(self, record):
+        from colored import fg, attr
+        color = fg(self.COLORS.get(record.levelname, 'white'))
+        date_part, rest_of_log = super().format(record).split(" - ", 1)
+        return f"{fg('white')}{date_part} - {color}{rest_of_log}{attr('reset')}"
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line, with the frame ID for correlating the lines of a frame.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name.replace('.log', ''),
+            'thread': record.threadName,
+            'frame_id': getattr(record, 'frame_id', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class LevelFilter(logging.Filter):
+    """
+    Passes the records whose level is in the log.levels setting, and stamps them with the current frame ID.
+
+    The logger is set up by the first record that reaches the filter, not by get_logger(),
+    so importing a module reads no config, opens no log file and starts no thread.
+    """
+
+    def __init__(self, log_file_name, echo_to_console=False, config=None):
+        super().__init__()
+        self.log_file_name = log_file_name
+        self.echo_to_console = echo_to_console
+        self.config = config
+        self.levels = None
+
+    def filter(self, record):
+        if self.levels is None:
+            _setup_logger(self)
+        if record.levelname.lower() not in self.levels:
+            return False
+        record.frame_id = _frame_id.get()
+        return True
+
+class LazyQueueHandler(logging.Handler):
+    """
+    Puts records on the queue without formatting them.
+
+    The standard QueueHandler formats the message in the calling thread. Here the
+    message and its arguments are formatted by the listener thread, so a log call
+    in the capture path costs little more than a queue put.
+    """
+
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+class RoutingHandler(logging.Handler):
+    """
+    Runs in the listener thread and passes each record to the handlers of its logger.
+    """
 
-    if logger.hasHandlers():
-        return logger
-
-    logger.setLevel(logging.DEBUG)
-
-    # Formatter for log messages
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-
-    file_handler = RotatingFileHandler(log_file_path, maxBytes=5 * 1024 * 1024, backupCount=3)
-    file_handler.setFormatter(formatter)
-    
-    # Add filter to handle allowed log levels
-    class LevelFilter(logging.Filter):
-        def filter(self, record):
-            return record.levelname.lower() in log_levels
-
-    file_handler.addFilter(LevelFilter())
-    logger.addHandler(file_handler)
-
-    # Custom function to apply colors based on log level for console output
-    if echo_to_console:
-        class ColoredFormatter(logging.Formatter):
-            def format(self, record):
-                # Define colors for each log level
-                if record.levelname == 'INFO':
-                    color = fg('green')
-                elif record.levelname == 'WARNING':
-                    color = fg('yellow')
-                elif record.levelname == 'ERROR':
-                    color = fg('red')
-                else:
-                    color = fg('white')
-                
-                # Reset color at the end
-                reset = attr('reset')
-
-                # Format the log entry
-                log_message = super(ColoredFormatter, self).format(record)
-                
-                # Split the log entry into date/time and the rest (level and message)
-                log_parts = log_message.split(" - ", 1)
-                date_part = log_parts[0]  # This is the date/time part
-                rest_of_log = log_parts[1]  # This contains the level and message
-
-                # Apply the color to the level and message part only, leave the date white
-                return f"{fg('white')}{date_part} - {color}{rest_of_log}{reset}"
-
-
-
-        console_handler = logging.StreamHandler()
-        console_formatter = ColoredFormatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-        console_handler.setFormatter(console_formatter)
-        console_handler.addFilter(LevelFilter())
-        logger.addHandler(console_handler)
+    def __init__(self):
+        super().__init__()
+        self.routes = {}
+        self.shared = []
 
+    def handle(self, record):
+        for handler in self.routes.get(record.name, ()) + self.shared:
+            handler.handle(record)
+        return True
+
+    def close(self):
+        for handlers in list(self.routes.values()) + [self.shared]:
+            for handler in handlers:
+                handler.close()
+        super().close()
+
+# One queue and listener thread for the whole process, created by the first get_logger()
+_queue = None
+_router = None
+_listener = None
+_setup_lock = threading.Lock()
+
+def _start_listener(config):
+    global _queue, _router, _listener
+    from logging.handlers import QueueListener, RotatingFileHandler
+    _queue = queue.SimpleQueue()
+    _router = RoutingHandler()
+
+    json_file = config.get('log', {}).get('json_file')
+    if json_file:
+        json_path = json_file if os.path.isabs(json_file) else os.path.join(LOG_DIR, json_file)
+        os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        json_handler = RotatingFileHandler(json_path, maxBytes=20 * 1024 * 1024, backupCount=3)
+        json_handler.setFormatter(JsonLinesFormatter())
+        _router.shared.append(json_handler)
+
+    _listener = QueueListener(_queue, _router)
+    _listener.start()
+
+# Registered on import, before the modules that log from their own exit handlers
+# (the capture catalog, the frame stats index), so it runs after them
+@atexit.register
+def stop_logging():
+    """
+    Writes the queued log records and stops the listener thread.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _router.close()
+            _listener = None
+
+def get_logger(log_file_name, echo_to_console=False, config=None):
+    """
+    Returns the logger of a script. Its handlers are set up when it logs the first record.
+
+    Parameters:
+        log_file_name (str): The log file in logs/, e.g. 'capture_image.log'. Logging is
+            enabled by the log setting of the same name, e.g. log.capture_image.
+        echo_to_console (bool): Also write the records to the console.
+        config (Settings, optional): The settings, read from config.yaml on the first record if None.
+
+    Returns:
+        logging.Logger: The logger.
+    """
+    logger = logging.getLogger(log_file_name)
+    with _setup_lock:
+        if not logger.filters:
+            # Records must reach the filter, which sets the real level
+            logger.setLevel(logging.DEBUG)
+            logger.addFilter(LevelFilter(log_file_name, echo_to_console, config))
     return logger
 
-def log(logger, message):
-    """Logs an info message (default)."""
-    logger.info(message)
+def _setup_logger(level_filter):
+    script_name = level_filter.log_file_name.replace('.log', '')
+    config = level_filter.config if level_filter.config is not None else read_config()
+    logger = logging.getLogger(level_filter.log_file_name)
+
+    with _setup_lock:
+        if level_filter.levels is not None:
+            return
+
+        # Check if logging is enabled for the script
+        if not is_logging_enabled(script_name, config):
+            # Like an unconfigured logger: warnings and errors still reach Python's last resort handler
+            level_filter.levels = {'warning', 'error', 'critical'}
+            logger.setLevel(logging.NOTSET)
+            return
+
+        log_levels = config.get('log', {}).get('levels', [])
+
+        # Handle 'all' case or default log levels
+        if 'all' in log_levels:
+            log_levels = ['info', 'warning', 'error']
+
+        if _listener is None:
+            _start_listener(config)
+        log_file_name = level_filter.log_file_name
+        echo_to_console = level_filter.echo_to_console
+
+        # Create 'logs' folder if it does not exist
+        os.makedirs(LOG_DIR, exist_ok=True)
+        from logging.handlers import RotatingFileHandler
+
+        # The file and console handlers run in the listener thread
+        file_handler = RotatingFileHandler(os.path.join(LOG_DIR, log_file_name), maxBytes=5 * 1024 * 1024, backupCount=3)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+        handlers = [file_handler]
+        if echo_to_console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(ColoredFormatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+            handlers.append(console_handler)
+        _router.routes[log_file_name] = handlers
+
+        # Records of disabled levels are dropped by the filter before they are queued
+        logger.propagate = False
+        logger.addHandler(LazyQueueHandler(_queue))
+        level_filter.levels = set(log_levels)
+
+def log(logger, message, *args):
+    """Logs an info message (default). With args, message is %-formatted later in the log thread."""
+    logger.info(message, *args)
 
-def log_warning(logger, message):
+def log_warning(logger, message, *args):
     """Logs a warning message."""
-    logger.warning(message)
+    logger.warning(message, *args)
 
-def log_error(logger, message):
+def log_error(logger, message, *args):
     """Logs an error message."""
-    logger.error(message)
-    
-    
+    logger.error(message, *args)
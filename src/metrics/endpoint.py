@@ -0,0 +1,30 @@
+# src/metrics/endpoint.py
+
+import json
+from http.server import BaseHTTPRequestHandler
+from src.metrics.metrics import get_metrics, prometheus_text
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the shared metrics: /metrics in the Prometheus text format, /stats as JSON.
+    """
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/metrics':
+            body = prometheus_text(get_metrics().snapshot()).encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path.split('?')[0] == '/stats':
+            body = json.dumps(get_metrics().snapshot(), indent=2).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the log
+        pass
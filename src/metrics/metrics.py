@@ -0,0 +1,308 @@
+# src/metrics/metrics.py
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from src.config.settings import BASE_DIR
+from src.log.logger import get_logger, log, log_error
+from src.pipeline.publisher import save_atomic
+
+logger = get_logger('metrics.log', echo_to_console=True)
+
+# Default location of the rolling stats file, next to the other data files
+STATS_FILE = os.path.join(BASE_DIR, 'data', 'metrics.json')
+
+# Number of recent durations the percentiles of a span are computed from
+SPAN_WINDOW = 1000
+
+# Environment variable with the file a capture_image.py subprocess reports its metrics to
+REPORT_ENV = 'TIMELAPSE_METRICS_REPORT'
+
+class SpanStats:
+    """
+    Durations of one span: totals since start, and percentiles over the recent samples.
+    """
+
+    def __init__(self, window=SPAN_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        self.max = max(self.max, duration)
+        self.recent.append(duration)
+
+    def as_dict(self):
+        recent = sorted(self.recent)
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'avg': self.total / self.count if self.count else 0.0,
+            'p50': recent[len(recent) // 2] if recent else 0.0,
+            'p95': recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0,
+            'max': self.max,
+            'recent_max': recent[-1] if recent else 0.0,
+            'last': self.last,
+        }
+
+class Metrics:
+    """
+    Thread-safe span timings and counters of the running process.
+
+    The capture loop, the save pipeline workers and the background services all
+    record into the one shared instance from get_metrics().
+    """
+
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name, duration):
+        """
+        Records one duration of a span.
+
+        Parameters:
+            name (str): The span name, e.g. 'capture' or 'camera.settle'.
+            duration (float): The duration in seconds.
+        """
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = SpanStats()
+            stats.add(duration)
+
+    def increment(self, name, value=1):
+        """
+        Adds to a counter, e.g. 'frames_failed'.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        Returns the current statistics.
+
+        Returns:
+            dict: 'time', 'uptime', 'spans' (span name to count, sum, avg, p50, p95,
+                max, recent_max and last, in seconds) and 'counters'.
+        """
+        with self._lock:
+            spans = {name: stats.as_dict() for name, stats in sorted(self.spans.items())}
+            counters = dict(sorted(self.counters.items()))
+        now = time.time()
+        return {'time': now, 'uptime': now - self.started, 'spans': spans, 'counters': counters}
+
+    def export(self):
+        """
+        Returns the recent durations of every span and the counters, for merge() in another process.
+
+        Returns:
+            dict: 'spans' (span name to a list of durations) and 'counters'.
+        """
+        with self._lock:
+            return {
+                'spans': {name: list(stats.recent) for name, stats in self.spans.items()},
+                'counters': dict(self.counters),
+            }
+
+    def merge(self, exported):
+        """
+        Records the durations and counters of another process, see export().
+
+        Parameters:
+            exported (dict): The result of export().
+        """
+        for name, durations in exported.get('spans', {}).items():
+            for duration in durations:
+                self.observe(name, duration)
+        for name, value in exported.get('counters', {}).items():
+            self.increment(name, value)
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+_metrics = Metrics()
+
+def get_metrics():
+    """
+    Returns the shared Metrics of this process.
+    """
+    return _metrics
+
+def write_report(path):
+    """
+    Writes the metrics of this process for the parent process, see read_report().
+
+    Parameters:
+        path (str): The report file.
+    """
+    try:
+        with open(path, 'w') as file:
+            json.dump(_metrics.export(), file)
+    except OSError as e:
+        log_error(logger, "Error writing the metrics report %s: %s", path, e)
+
+def read_report(path):
+    """
+    Merges the metrics a subprocess wrote with write_report() into the shared metrics.
+
+    Parameters:
+        path (str): The report file. A missing or empty file is ignored.
+    """
+    try:
+        with open(path) as file:
+            _metrics.merge(json.load(file))
+    except (OSError, ValueError):
+        pass
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block and records it as a span, also when it raises.
+    Also works as a function decorator.
+
+        with span('camera.open'):
+            picam2 = Picamera2()
+
+    Parameters:
+        name (str): The span name.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _metrics.observe(name, time.perf_counter() - start_time)
+
+def prometheus_text(snapshot):
+    """
+    Formats a snapshot in the Prometheus text exposition format.
+
+    Spans are exported as a summary with 0.5 and 0.95 quantiles over the recent
+    samples, plus a gauge with the max since start.
+
+    Parameters:
+        snapshot (dict): The result of Metrics.snapshot().
+
+    Returns:
+        str: The metrics page.
+    """
+    lines = [
+        "# HELP timelapse_span_seconds Duration of the capture phases and other timed spans.",
+        "# TYPE timelapse_span_seconds summary",
+    ]
+    for name, stats in snapshot['spans'].items():
+        lines.append(f'timelapse_span_seconds{{span="{name}",quantile="0.5"}} {stats["p50"]:.6f}')
+        lines.append(f'timelapse_span_seconds{{span="{name}",quantile="0.95"}} {stats["p95"]:.6f}')
+        lines.append(f'timelapse_span_seconds_sum{{span="{name}"}} {stats["sum"]:.6f}')
+        lines.append(f'timelapse_span_seconds_count{{span="{name}"}} {stats["count"]}')
+    lines.append("# HELP timelapse_span_max_seconds Longest duration of each span since start.")
+    lines.append("# TYPE timelapse_span_max_seconds gauge")
+    for name, stats in snapshot['spans'].items():
+        lines.append(f'timelapse_span_max_seconds{{span="{name}"}} {stats["max"]:.6f}')
+    for name, value in snapshot['counters'].items():
+        lines.append(f"# TYPE timelapse_{name}_total counter")
+        lines.append(f"timelapse_{name}_total {value}")
+    lines.append("# TYPE timelapse_uptime_seconds gauge")
+    lines.append(f"timelapse_uptime_seconds {snapshot['uptime']:.0f}")
+    return "\n".join(lines) + "\n"
+
+class MetricsService:
+    """
+    Publishes the shared metrics on a local HTTP endpoint for Prometheus (/metrics,
+    and /stats as JSON), and writes them to a stats file every metrics.interval
+    seconds, so the percentiles can be checked on the Pi without a scraper.
+    """
+
+    def __init__(self, config):
+        """
+        Parameters:
+            config (Settings): The settings.
+        """
+        metrics_config = config['metrics']
+        self.host = metrics_config['host']
+        self.port = metrics_config['port']
+        self.stats_file = metrics_config['stats_file'] or STATS_FILE
+        self.interval = metrics_config['interval']
+        self.server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self.port:
+            # The HTTP server is only imported when the endpoint is enabled
+            from http.server import ThreadingHTTPServer
+            from src.metrics.endpoint import MetricsRequestHandler
+            self.server = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+            self.server.daemon_threads = True
+            self._threads.append(threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True))
+            log(logger, "Metrics endpoint: http://%s:%d/metrics", self.host, self.server.server_address[1])
+        self._threads.append(threading.Thread(target=self._run, name='metrics-file', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self.write_stats_file()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write_stats_file()
+
+    def write_stats_file(self):
+        """
+        Replaces the stats file with the current snapshot.
+        """
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.stats_file)), exist_ok=True)
+            content = json.dumps(_metrics.snapshot(), indent=2).encode()
+            save_atomic(self.stats_file, lambda file: file.write(content), fsync='none')
+        except Exception as e:
+            log_error(logger, "Error writing the stats file: %s", e)
+
+def format_span_stats(snapshot, names=None):
+    """
+    Formats span percentiles for a log line or the console.
+
+    Parameters:
+        snapshot (dict): The result of Metrics.snapshot().
+        names (list, optional): The spans to include, all if None.
+
+    Returns:
+        str: One line per span with count, p50, p95 and max in milliseconds.
+    """
+    lines = []
+    for name, stats in snapshot['spans'].items():
+        if names is None or name in names:
+            lines.append(f"{name:<28} n={stats['count']:<6} p50 {stats['p50'] * 1000:9.1f} ms  "
+                         f"p95 {stats['p95'] * 1000:9.1f} ms  max {stats['max'] * 1000:9.1f} ms")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    # Show the stats file of the running timelapse:
+    #     python3 -m src.metrics.metrics [stats file]
+    import sys
+
+    with open(sys.argv[1] if len(sys.argv) > 1 else STATS_FILE) as stats_file:
+        snapshot = json.load(stats_file)
+    print(f"Uptime {snapshot['uptime'] / 3600:.1f} h, written {time.time() - snapshot['time']:.0f} s ago")
+    print(format_span_stats(snapshot))
+    for name, value in snapshot['counters'].items():
+        print(f"{name}: {value}")
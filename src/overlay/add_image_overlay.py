@@ -3,10 +3,11 @@
 import json
 from PIL import Image, ImageDraw, ImageFont
 import os
-import yaml
 from datetime import datetime
 import locale
+from src.config.settings import get_settings
 from src.overlay.add_to_overlay_data import load_overlay_data
+from src.metrics.metrics import span
 
 # Default configuration
 OVERLAY_IMAGE_PATH = os.path.join(os.path.dirname(__file__), '../../overlay/overlay.png')
@@ -14,115 +15,218 @@ FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
 FONT_SIZE = 50
 TEXT_COLOR = (255, 255, 255)  # White text, no alpha channel for JPEG
 TIME_FONT_SIZE = 70  # Font size for the time
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
 QUALITY = 80
 
-# Load the configuration file
-with open(CONFIG_PATH, 'r') as file:
-    config = yaml.safe_load(file)
+def set_overlay_locale(config):
+    """
+    Sets the locale used for the date in the overlay, e.g. Norwegian.
 
-# Set the locale to Norwegian
-if config.get('overlay', {}).get('locale'):
-    locale.setlocale(locale.LC_TIME, "nb_NO.UTF-8")
+    Parameters:
+        config (Settings): The settings.
+    """
+    overlay_locale = config.get('overlay', {}).get('locale')
+    if overlay_locale:
+        locale.setlocale(locale.LC_TIME, overlay_locale)
 
-def load_camera_name():
+def load_camera_name(config=None):
     """
-    Loads the camera name from the YAML configuration file.
+    Loads the camera name from the configuration.
 
     Parameters:
-        config_path (str): Path to the config.yaml file.
+        config (Settings, optional): The settings, the shared settings are used if None.
 
     Returns:
         str: The camera name.
     """
-
+    if config is None:
+        config = get_settings()
     return config.get('camera_settings', {}).get('name', "Camera Name")
 
-def overlay_image_with_text(input_image_path, output_image_path=None, text=None):
+class OverlayRenderer:
     """
-    Overlays an image with an overlay image, adds the camera name, and the full date in Norwegian.
+    Draws the overlay on captured frames, keeping everything that does not change between frames.
+
+    The overlay graphic, the fonts and a layer with the overlay and the camera name are
+    loaded once. Per frame only the date and the overlay data are drawn, and only the
+    region at the top covered by the overlay and the text is blended into the frame.
+    """
+
+    def __init__(self, text=None, lens_position=None, overlay_path=OVERLAY_IMAGE_PATH, font_path=FONT_PATH, config=None):
+        """
+        Parameters:
+            text (str, optional): The camera name, read from the config if None.
+            lens_position (float, optional): The lens position shown in the overlay, read from the config if None.
+            overlay_path (str): Path to the overlay graphic.
+            font_path (str): Path to the TrueType font.
+            config (Settings, optional): The settings, the shared settings are used if None.
+        """
+        if text is None or lens_position is None:
+            if config is None:
+                config = get_settings()
+            set_overlay_locale(config)
+        self.text = text if text is not None else load_camera_name(config)
+        self.lens_position = lens_position if lens_position is not None else config.get('camera_settings', {}).get('lens_position')
+        self.overlay = Image.open(overlay_path).convert("RGBA")
+        self.camerafont = ImageFont.truetype(font_path, FONT_SIZE)
+        self.datefont = ImageFont.truetype(font_path, 40)
+        self.overlay_font = ImageFont.truetype(font_path, 30)
+        self._static_layers = {}
+
+    def _static_layer(self, width):
+        """
+        Returns the cached layer with the overlay graphic and the camera name for a frame width,
+        and the y position below the camera name where the date goes.
+        """
+        if width not in self._static_layers:
+            # The region must fit the overlay graphic and all the text lines
+            name_bbox = self.camerafont.getbbox(self.text)
+            date_bottom = 10 + name_bbox[3] + 10 + self.datefont.getbbox("Ag")[3]
+            data_bottom = 85 + self.overlay_font.getbbox("Ag")[3]
+            height = max(self.overlay.height, date_bottom, data_bottom) + 1
+
+            layer = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+            layer.paste(self.overlay, (0, 0))
+            draw = ImageDraw.Draw(layer)
+
+            # Center the camera name, 10 pixels from the top edge
+            text_position = ((width - name_bbox[2]) // 2, 10)
+            draw.text(text_position, self.text, font=self.camerafont, fill=TEXT_COLOR)
+            self._static_layers[width] = (layer, text_position[1] + name_bbox[3] + 10)
+        return self._static_layers[width]
+
+    def render(self, image, overlay_data=None, capture_time=None):
+        """
+        Draws the overlay on a frame.
+
+        The frame is modified in place if it is an RGB image, so the pixels outside the
+        overlay region are never copied.
+
+        Parameters:
+            image (PIL.Image or numpy.ndarray): The captured frame, e.g. from request.make_image("main")
+                or request.make_array("main").
+            overlay_data (dict, optional): Additional data to be displayed on the image. Loaded from overlay_data.json if None.
+            capture_time (datetime, optional): The time shown on the frame. Defaults to now.
+
+        Returns:
+            PIL.Image: The RGB image with the overlay.
+        """
+        if overlay_data is None:
+            overlay_data = load_overlay_data()
+        metadata = overlay_data.get('camera_metadata')
+
+        # Wrap numpy arrays from make_array() without another copy through disk
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        layer, date_top = self._static_layer(image.width)
+        box = (0, 0, image.width, min(layer.height, image.height))
+        region = Image.alpha_composite(image.crop(box).convert("RGBA"), layer.crop((0, 0, box[2], box[3])))
+        draw = ImageDraw.Draw(region)
+
+        # Add the full date in Norwegian format just below the camera name
+        # The capture time, a frame saved later by the pipeline still shows when it was taken
+        full_date = (capture_time or datetime.now()).strftime("%A, %d. %B %Y %H:%M")
+        date_bbox = draw.textbbox((0, 0), full_date, font=self.datefont)
+        draw.text(((image.width - date_bbox[2]) // 2, date_top), full_date, font=self.datefont, fill=TEXT_COLOR)
+
+        if overlay_data:
+            overlay_text = (
+                f"ISO: {overlay_data.get('Iso', 'N/A')}, "
+                f"Shutter: {overlay_data.get('Shutterspeed', 'N/A')}, "
+                f"Light: {(metadata or {}).get('Lux', 'N/A')}, "
+                f"Day: {overlay_data.get('Daylight', 'N/A')}, "
+                f"HDR: {'On' if overlay_data.get('HDR') else 'Off'}"  # Include HDR state
+            )
+            if metadata is not None:
+                overlay_text_right = (
+                    f"Lux: {metadata['Lux']}, "
+                    f"AGain: {metadata['AnalogueGain']}, "
+                    f"DGain: {metadata['DigitalGain']}"
+                )
+                overlay_text_right_line_2 = (
+                    f"Exposuretime: {metadata['ExposureTime']}, "
+                    f"LensPos: {self.lens_position}, "
+                    f"SensorTemp: {metadata['SensorTemperature']}"
+                )
+                draw.text((2450, 25), overlay_text_right, font=self.overlay_font, fill=TEXT_COLOR)
+                draw.text((2450, 80), overlay_text_right_line_2, font=self.overlay_font, fill=TEXT_COLOR)
+
+            # Draw the text
+            draw.text((20, 85), overlay_text, font=self.overlay_font, fill=TEXT_COLOR)
+
+        # Only the overlay region goes back into the frame (JPEG doesn't support alpha channel)
+        image.paste(region.convert("RGB"), box)
+        return image
+
+# Renderers by camera name and lens position, so the overlay and fonts are loaded once per process
+_renderers = {}
+
+def get_overlay_renderer(text=None, config=None):
+    """
+    Returns the cached overlay renderer for the camera name and lens position.
+
+    Parameters:
+        text (str, optional): The camera name, read from the config if None.
+        config (Settings, optional): The settings, the shared settings are used if None.
+
+    Returns:
+        OverlayRenderer: The renderer.
+    """
+    if config is None:
+        config = get_settings()
+    if text is None:
+        text = load_camera_name(config)
+    key = (text, config['camera_settings']['lens_position'], config['overlay'].get('locale'))
+    if key not in _renderers:
+        _renderers[key] = OverlayRenderer(text, config=config)
+    return _renderers[key]
+
+def overlay_image(image, text=None, overlay_data=None, config=None, capture_time=None):
+    """
+    Overlays an in-memory frame with the overlay image, the camera name, the full date and the overlay data.
+
+    Nothing is read from or written to disk, so the caller can encode the result once.
+    An RGB frame is modified in place, see OverlayRenderer.render().
+
+    Parameters:
+        image (PIL.Image or numpy.ndarray): The captured frame, e.g. from request.make_image("main")
+            or request.make_array("main").
+        text (str): Camera name to add to the image.
+        overlay_data (dict, optional): Additional data to be displayed on the image. Loaded from overlay_data.json if None.
+        config (Settings, optional): The settings, the shared settings are used if None.
+        capture_time (datetime, optional): The time shown on the frame. Defaults to now.
+
+    Returns:
+        PIL.Image: The RGB image with the overlay.
+    """
+    return get_overlay_renderer(text, config).render(image, overlay_data, capture_time)
+
+def overlay_image_with_text(input_image_path, output_image_path=None, text=None, overlay_data=None):
+    """
+    Overlays an image file with an overlay image, adds the camera name, and the full date in Norwegian.
 
     Parameters:
         input_image_path (str): Path to the base image.
         output_image_path (str, optional): Path to save the output image. If None, the input image will be overwritten.
         text (str): Camera name to add to the image.
-        quality (int): Quality of the output image (applicable for JPEG format).
-        overlay_data (dict): Additional data to be displayed on the image.
+        overlay_data (dict, optional): Additional data to be displayed on the image. Loaded from overlay_data.json if None.
     """
-    overlay_data = load_overlay_data()
-    
-    metadata = overlay_data.get('camera_metadata')
+    if overlay_data is None:
+        overlay_data = load_overlay_data()
     quality = overlay_data.get('Quality', QUALITY)
-    
-    # Load camera name if text is not provided
-    if text is None:
-        text = load_camera_name()
-
-    # Load the base image
-    base_image = Image.open(input_image_path).convert("RGBA")
-
-    # Load the overlay image
-    overlay_image = Image.open(OVERLAY_IMAGE_PATH).convert("RGBA")
-
-    # Create a transparent layer the same size as the base image
-    transparent_layer = Image.new("RGBA", base_image.size, (0, 0, 0, 0))
-
-    # Paste the overlay onto the transparent layer
-    transparent_layer.paste(overlay_image, (0, 0))
-
-    # Composite the base image with the transparent layer containing the overlay
-    combined = Image.alpha_composite(base_image, transparent_layer)
-
-    # Add camera name and date text on top of the overlay
-    draw = ImageDraw.Draw(combined)
-    camerafont = ImageFont.truetype(FONT_PATH, FONT_SIZE)
-    datefont = ImageFont.truetype(FONT_PATH, 40)
-
-    # Center the camera name
-    text_bbox = draw.textbbox((0, 0), text, font=camerafont)
-    text_position = ((base_image.width - text_bbox[2]) // 2, 10)  # 10 pixels from the top edge
-    draw.text(text_position, text, font=camerafont, fill=TEXT_COLOR)
-
-    # Add the full date in Norwegian format just below the camera name
-    full_date = datetime.now().strftime("%A, %d. %B %Y %H:%M")
-    date_bbox = draw.textbbox((0, 0), full_date, font=datefont)
-    date_position = ((base_image.width - date_bbox[2]) // 2, text_position[1] + text_bbox[3] + 10)  # 10 pixels below the camera name
-    draw.text(date_position, full_date, font=datefont, fill=TEXT_COLOR)
-
-    if overlay_data:
-        overlay_font = ImageFont.truetype(FONT_PATH, 30)
-        overlay_text = (
-            f"ISO: {overlay_data.get('Iso', 'N/A')}, "
-            f"Shutter: {overlay_data.get('Shutterspeed', 'N/A')}, "
-            f"Light: { metadata.get('Lux', 'N/A')}, "
-            f"Day: {overlay_data.get('Daylight', 'N/A')}, "
-            f"HDR: {'On' if overlay_data.get('HDR') else 'Off'}"  # Include HDR state
-        )
-        if metadata is not None:
-            
-            overlay_text_right = ""
-            overlay_text_right += (
-                f"Lux: {metadata['Lux']}, "
-                f"AGain: {metadata['AnalogueGain']}, "
-                f"DGain: {metadata['DigitalGain']}"
-            )
-            overlay_text_right_line_2 = (
-                f"Exposuretime: {metadata['ExposureTime']}, "
-                f"LensPos: {config['camera_settings']['lens_position']}, "
-                f"SensorTemp: {metadata['SensorTemperature']}"
-            )
-            draw.text((2450, 25), overlay_text_right, font=overlay_font, fill=TEXT_COLOR)
-            draw.text((2450, 80), overlay_text_right_line_2, font=overlay_font, fill=TEXT_COLOR)
 
-        # Draw the text
-        draw.text((20, 85), overlay_text, font=overlay_font, fill=TEXT_COLOR)
-        
-    # Convert the final image to RGB mode (JPEG doesn't support alpha channel)
-    final_image = combined.convert("RGB")
+    with span('overlay.decode'):
+        image = Image.open(input_image_path)
+        image.load()
+    with span('overlay.render'):
+        final_image = overlay_image(image, text=text, overlay_data=overlay_data)
 
     # Save the result as a JPEG with the specified quality
     if output_image_path is None:
         output_image_path = input_image_path
 
-    final_image.save(output_image_path, "JPEG", quality=quality, optimize=True)
+    with span('overlay.encode'):
+        final_image.save(output_image_path, "JPEG", quality=quality, optimize=True)
     # print(f"Overlay added and saved to {output_image_path}")
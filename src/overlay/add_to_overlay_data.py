@@ -1,6 +1,9 @@
 import os
 import json
-from src.log.logger import log_error
+import tempfile
+from src.log.logger import get_logger, log_error
+
+logger = get_logger('add_to_overlay_data.log')
 
 # Set the path to the overlay data JSON file
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../data'))
@@ -19,6 +22,26 @@ def load_overlay_data():
             return json.load(f)
     return {}
 
+def write_json_atomic(file_path, data):
+    """
+    Writes JSON to a temporary file next to file_path and renames it over file_path,
+    so a reader sees either the old or the new file, never a partial one.
+
+    Parameters:
+        file_path (str): The file to write.
+        data (dict): The data to write.
+    """
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(file_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
 # Function to save the overlay data back to the JSON file
 def save_overlay_data(data):
     """
@@ -27,8 +50,7 @@ def save_overlay_data(data):
     Parameters:
         data (dict): The updated overlay data dictionary.
     """
-    with open(OVERLAY_DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+    write_json_atomic(OVERLAY_DATA_FILE, data)
 
 # Function to update the overlay data with a new key-value pair
 def add_to_overlay_data(key, value):
@@ -48,30 +70,43 @@ def add_to_overlay_data(key, value):
     # Save the updated overlay data back to the file
     save_overlay_data(overlay_data)
 
-def add_metadata_to_overlay(metadata):
+def extract_overlay_metadata(metadata):
+    """
+    Extracts the metadata values shown in the overlay.
+
+    Parameters:
+        metadata (dict): The metadata dictionary.
+
+    Returns:
+        dict: The rounded values.
+    """
+    return {
+        "Lux": round(metadata.get('Lux', 'N/A'), 1),
+        "ExposureTime": round(metadata.get('ExposureTime', 'N/A'), 1),
+        "AnalogueGain": round(metadata.get('AnalogueGain', 'N/A'), 1),
+        "DigitalGain": round(metadata.get('DigitalGain', 'N/A'), 1),
+        "FrameDuration": round(metadata.get('FrameDuration', 'N/A'), 1),
+        "SensorTemperature": round(metadata.get('SensorTemperature', 'N/A'), 1),
+        "LensPosition": round(metadata.get('LensPosition', 'N/A'), 1),
+        "ColourTemperature": round(metadata.get('ColourTemperature', 'N/A'), 1)
+    }
+
+def add_metadata_to_overlay(metadata, context=None):
     """
     Extracts relevant metadata and adds it to the overlay data.
 
     Parameters:
         metadata (dict): The metadata dictionary.
+        context (FrameContext, optional): The frame context to add it to. If None, it is written to overlay_data.json.
     """
     if metadata:
-        # Extract the required values
-        overlay_data = {
-            "Lux": round(metadata.get('Lux', 'N/A'), 1),
-            "ExposureTime": round(metadata.get('ExposureTime', 'N/A'), 1),
-            "AnalogueGain": round(metadata.get('AnalogueGain', 'N/A'), 1),
-            "DigitalGain": round(metadata.get('DigitalGain', 'N/A'), 1),
-            "FrameDuration": round(metadata.get('FrameDuration', 'N/A'), 1),
-            "SensorTemperature": round(metadata.get('SensorTemperature', 'N/A'), 1),
-            "LensPosition": round(metadata.get('LensPosition', 'N/A'), 1),
-            "ColourTemperature": round(metadata.get('ColourTemperature', 'N/A'), 1)
-        }
-
-        # Add all the extracted data to the overlay JSON
-        add_to_overlay_data("camera_metadata", overlay_data)
+        if context is not None:
+            context.add_camera_metadata(metadata)
+        else:
+            # Add all the extracted data to the overlay JSON
+            add_to_overlay_data("camera_metadata", extract_overlay_metadata(metadata))
     else:
-        log_error("No metadata available to add to overlay.")
+        log_error(logger, "No metadata available to add to overlay.")
 
 # Example usage
 if __name__ == "__main__":
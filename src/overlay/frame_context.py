@@ -0,0 +1,60 @@
+# src/overlay/frame_context.py
+
+from src.overlay.add_to_overlay_data import OVERLAY_DATA_FILE, extract_overlay_metadata, write_json_atomic
+
+class FrameContext:
+    """
+    Carries the per-frame overlay values (ISO, shutter speed, daylight, quality,
+    camera metadata) through the capture pipeline in memory.
+
+    It replaces the read-modify-write of overlay_data.json for every key. The file is
+    only written as a snapshot for external readers, see snapshot().
+    """
+
+    def __init__(self, values=None):
+        """
+        Parameters:
+            values (dict, optional): Initial overlay values.
+        """
+        self.values = dict(values or {})
+
+    def set(self, key, value):
+        """
+        Sets an overlay value for this frame.
+
+        Parameters:
+            key (str): The key, e.g. 'Iso' or 'Daylight'.
+            value (any): The value.
+        """
+        self.values[key] = value
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def add_camera_metadata(self, metadata):
+        """
+        Adds the relevant capture metadata (Lux, gains, exposure time etc.) as 'camera_metadata'.
+
+        Parameters:
+            metadata (dict): The capture request metadata.
+        """
+        if metadata:
+            self.values['camera_metadata'] = extract_overlay_metadata(metadata)
+
+    def as_overlay_data(self):
+        """
+        Returns a copy of the values in the overlay_data.json format.
+
+        Returns:
+            dict: The overlay data.
+        """
+        return dict(self.values)
+
+    def snapshot(self, file_path=OVERLAY_DATA_FILE):
+        """
+        Writes the values to overlay_data.json atomically, so readers never see a partial file.
+
+        Parameters:
+            file_path (str): The file to write.
+        """
+        write_json_atomic(file_path, self.values)
@@ -0,0 +1,91 @@
+# src/pipeline/publisher.py
+
+import os
+import threading
+
+# What save_atomic() flushes to the SD card before the rename:
+# 'none' relies on the OS, 'file' fsyncs the file, 'full' also fsyncs the folder so the rename survives a power cut
+FSYNC_POLICIES = ('none', 'file', 'full')
+
+def _temp_path(path):
+    # Unique per process and thread, so concurrent writers never share a temp file
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def _fsync_directory(directory):
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def save_atomic(path, write, fsync='file'):
+    """
+    Writes a file under a temporary name and renames it into place, so a reader
+    sees either the old file or the complete new one, never a partial file.
+
+    Parameters:
+        path (str): The file to write.
+        write (callable): Called with the open binary file object to write the content.
+        fsync (str): 'none', 'file' or 'full', see FSYNC_POLICIES.
+    """
+    temp_path = _temp_path(path)
+    try:
+        with open(temp_path, 'wb') as file:
+            write(file)
+            if fsync != 'none':
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if fsync == 'full':
+        _fsync_directory(os.path.dirname(path))
+
+def replace_symlink(symlink_path, target):
+    """
+    Points a symlink at a new target by renaming a new symlink over it.
+
+    The rename is atomic, so the path always exists for readers: it resolves to
+    either the old or the new target. Removing the old symlink first would leave
+    a moment where web clients get a 404.
+
+    Parameters:
+        symlink_path (str): The symlink, e.g. the status_file.
+        target (str): The file it should point to.
+    """
+    temp_path = _temp_path(symlink_path)
+    os.symlink(target, temp_path)
+    try:
+        os.replace(temp_path, symlink_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def recent_path(directory, number, extension='jpg'):
+    """
+    Returns the path of the n-th most recent frame in the ring, 1 is the latest.
+    """
+    return os.path.join(directory, f"recent_{number}.{extension}")
+
+def rotate_recent(directory, target, count, extension='jpg'):
+    """
+    Keeps a ring of symlinks to the latest frames: recent_1 is the newest, recent_<count> the oldest.
+
+    Every symlink is moved one step back with replace_symlink(), oldest first, so
+    none of them is ever missing for a reader.
+
+    Parameters:
+        directory (str): The folder of the ring.
+        target (str): The new latest frame.
+        count (int): The number of frames in the ring.
+        extension (str): The file extension of the symlinks.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for number in range(count, 1, -1):
+        previous = recent_path(directory, number - 1, extension)
+        if os.path.islink(previous):
+            replace_symlink(recent_path(directory, number, extension), os.readlink(previous))
+    replace_symlink(recent_path(directory, 1, extension), target)
@@ -0,0 +1,260 @@
+# src/pipeline/save_pipeline.py
+
+import queue
+import threading
+import time
+from src.log.logger import get_logger, log, log_warning, log_error
+from src.metrics.metrics import get_metrics
+
+logger = get_logger('save_pipeline.log', echo_to_console=True)
+
+# What submit() does when the queue is full
+POLICIES = ('block', 'drop', 'latest')
+
+class FrameJob:
+    """
+    A captured frame waiting to be processed by the save pipeline.
+    """
+
+    def __init__(self, config, image, metadata, file_name, overlay_data=None, capture_time=None, frame_id=None, burst=None, bracket=None):
+        """
+        Parameters:
+            config (dict): The configuration the frame was captured with.
+            image (PIL.Image): The captured frame, or None if it is stacked from the burst or fused from the bracket.
+            metadata (dict): The capture request metadata.
+            file_name (str): Where the frame is saved.
+            overlay_data (dict, optional): The overlay data at capture time.
+            capture_time (datetime, optional): The (scheduled) capture time of the frame.
+            frame_id (str, optional): The frame ID added to the log records while the frame is processed.
+            burst (list, optional): The exposures of a night burst as numpy arrays, stacked into the
+                image when the frame is processed.
+            bracket (list, optional): The exposures of an HDR bracket as numpy arrays, fused into the
+                image when the frame is processed.
+        """
+        self.config = config
+        self.image = image
+        self.metadata = metadata
+        self.file_name = file_name
+        self.overlay_data = overlay_data
+        self.capture_time = capture_time
+        self.frame_id = frame_id
+        self.burst = burst
+        self.bracket = bracket
+        self.sequence = None
+        self.submitted_at = None
+        self.queued_bytes = 0
+
+    def memory_size(self):
+        """
+        Returns the bytes of image data the job holds: the frame, or its burst or bracket exposures.
+        """
+        size = sum(frame.nbytes for frame in (self.burst or []) + (self.bracket or []))
+        if self.image is not None:
+            size += getattr(self.image, 'nbytes', None) or self.image.width * self.image.height * len(self.image.getbands())
+        return size
+
+class StageStats:
+    """
+    Running latency statistics for one pipeline stage.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        self.max = max(self.max, duration)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'last': self.last,
+        }
+
+class SavePipeline:
+    """
+    A bounded producer/consumer queue between the capture loop and the slow stages
+    (overlay, JPEG encode, symlink update and metadata writes).
+
+    The capture loop calls submit() and a pool of worker threads calls the handler
+    for every frame. When the queue is full the policy decides what happens:
+    'block' waits for a free slot (backpressure), 'drop' discards the new frame and
+    'latest' discards the oldest queued frame to make room for the new one.
+
+    A night burst or an HDR bracket holds several full-size exposures, so the queue
+    is also full when the queued frames would hold more than max_bytes of image data.
+    A single frame is always accepted into an empty queue, whatever its size.
+    """
+
+    def __init__(self, handler, workers=1, queue_size=4, policy='latest', max_bytes=None):
+        """
+        Parameters:
+            handler (callable): Called as handler(job, timings, is_latest) in a worker thread.
+                timings is a dict to record stage durations in, and is_latest() returns
+                False if a newer frame has already been published.
+            workers (int): The number of worker threads.
+            queue_size (int): Max number of frames waiting in the queue.
+            policy (str): 'block', 'drop' or 'latest'.
+            max_bytes (int, optional): Max bytes of image data waiting in the queue, unbounded if None.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown pipeline policy '{policy}', use one of {', '.join(POLICIES)}")
+        self.handler = handler
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.max_bytes = max_bytes
+        self.queued_bytes = 0
+        self.stages = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._sequence = 0
+        self._published = -1
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._workers = []
+        for index in range(max(1, workers)):
+            worker = threading.Thread(target=self._run, name=f"save-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, job):
+        """
+        Queues a frame for processing.
+
+        Parameters:
+            job (FrameJob): The frame to process.
+
+        Returns:
+            bool: False if the frame was dropped because the queue was full.
+        """
+        with self._lock:
+            job.sequence = self._sequence
+            self._sequence += 1
+        job.submitted_at = time.monotonic()
+        job.queued_bytes = job.memory_size()
+
+        if self.policy == 'block':
+            with self._space:
+                self._space.wait_for(lambda: self._fits(job))
+                self.queued_bytes += job.queued_bytes
+            self.queue.put(job)
+        else:
+            while True:
+                with self._lock:
+                    fits = self._fits(job)
+                    if fits:
+                        self.queued_bytes += job.queued_bytes
+                if fits:
+                    try:
+                        self.queue.put_nowait(job)
+                        break
+                    except queue.Full:
+                        self._release(job)
+                if self.policy == 'drop':
+                    self._drop(job)
+                    return False
+                try:
+                    oldest = self.queue.get_nowait()
+                    self._release(oldest)
+                    self._drop(oldest)
+                    self.queue.task_done()
+                except queue.Empty:
+                    pass
+
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _fits(self, job):
+        # Called with the lock held
+        return not self.max_bytes or not self.queued_bytes or self.queued_bytes + job.queued_bytes <= self.max_bytes
+
+    def _release(self, job):
+        with self._space:
+            self.queued_bytes -= job.queued_bytes
+            self._space.notify_all()
+
+    def _drop(self, job):
+        with self._lock:
+            self.dropped += 1
+        log_warning(logger, "Save queue full, dropped frame %s", job.file_name)
+
+    def _claim_latest(self, sequence):
+        """
+        Returns True if the frame is newer than the last published one, and marks it published.
+        """
+        with self._lock:
+            if sequence < self._published:
+                return False
+            self._published = sequence
+            return True
+
+    def _record(self, timings):
+        with self._lock:
+            for stage, duration in timings.items():
+                self.stages.setdefault(stage, StageStats()).add(duration)
+        # The stages themselves are recorded by the handler, see record_phase() in capture_image.py
+        get_metrics().observe('queue_wait', timings['queue_wait'])
+        get_metrics().observe('pipeline_total', timings['total'])
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            self._release(job)
+
+            timings = {'queue_wait': time.monotonic() - job.submitted_at}
+            try:
+                self.handler(job, timings, lambda: self._claim_latest(job.sequence))
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                log_error(logger, "Error processing frame %s: %s", job.file_name, e)
+            finally:
+                timings['total'] = time.monotonic() - job.submitted_at
+                self._record(timings)
+                self.queue.task_done()
+
+    def stats(self):
+        """
+        Returns the queue depth, frame counters and per-stage latency.
+
+        Returns:
+            dict: The pipeline statistics.
+        """
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queued_bytes': self.queued_bytes,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'stages': {stage: stats.as_dict() for stage, stats in self.stages.items()},
+            }
+
+    def close(self, timeout=None):
+        """
+        Processes the frames still in the queue and stops the workers.
+
+        Parameters:
+            timeout (float, optional): Max seconds to wait for each worker.
+        """
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        log(logger, f"Save pipeline stopped: {self.completed} frames saved, {self.dropped} dropped, {self.failed} failed.")
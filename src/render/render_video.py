@@ -0,0 +1,289 @@
+# src/render/render_video.py
+
+import os
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from PIL import Image
+from src.image.deflicker import apply_lut, file_luma, plan_deflicker
+from src.log.logger import get_logger, log, log_warning
+
+logger = get_logger('render_timelapse.log', echo_to_console=True)
+
+# Frames decoded ahead of the writer, per worker. Bounds the memory to a few frames per worker.
+FRAMES_PER_WORKER = 2
+
+# Log the progress every n frames
+PROGRESS_EVERY = 500
+
+def frame_directories(config, start, end):
+    """
+    Returns the image folders that can hold frames captured between start and end.
+
+    The folders are found by formatting image_output.folder_structure for every hour
+    in the range, so a range of a few days never scans the years around it.
+
+    Parameters:
+        config (Settings): The settings.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+
+    Returns:
+        list: The existing folders, in time order.
+    """
+    image_output = config['image_output']
+    directories = []
+    current = start.replace(minute=0, second=0, microsecond=0)
+    while current <= end:
+        directory = os.path.join(image_output['root_folder'], current.strftime(image_output['folder_structure']))
+        if directory not in directories and os.path.isdir(directory):
+            directories.append(directory)
+        current += timedelta(hours=1)
+    return directories
+
+def parse_frame_time(file_name, config):
+    """
+    Returns the capture time from an image file name, or None if the name does not match the output settings.
+
+    Parameters:
+        file_name (str): The file name, without folder.
+        config (Settings): The settings.
+
+    Returns:
+        datetime: The capture time.
+    """
+    image_output = config['image_output']
+    prefix = image_output['filename_prefix']
+    extension = '.' + image_output['image_extension']
+    if not file_name.startswith(prefix) or not file_name.endswith(extension):
+        return None
+    try:
+        return datetime.strptime(file_name[len(prefix):-len(extension)], image_output['filename_time_format'])
+    except ValueError:
+        return None
+
+def find_frames(config, start, end):
+    """
+    Finds the captured frames between start and end in the dated image tree.
+
+    Parameters:
+        config (Settings): The settings.
+        start (datetime): Start of the range, inclusive.
+        end (datetime): End of the range, exclusive.
+
+    Returns:
+        list: (capture time, path) tuples in capture order.
+    """
+    frames = []
+    for directory in frame_directories(config, start, end):
+        for entry in os.scandir(directory):
+            capture_time = parse_frame_time(entry.name, config)
+            if capture_time is not None and start <= capture_time < end and entry.is_file():
+                frames.append((capture_time, entry.path))
+    frames.sort()
+    return frames
+
+def filter_by_stats(frames, index, min_luma=None, min_sharpness=None, max_highlights=None):
+    """
+    Drops dark, blurry or over-exposed frames, using the frame stats index.
+
+    Frames without stats in the index are kept.
+
+    Parameters:
+        frames (list): (capture time, path) tuples, from find_frames().
+        index (FrameStatsIndex): The frame stats index.
+        min_luma (float, optional): Drop frames darker than this (0-255).
+        min_sharpness (float, optional): Drop frames less sharp than this.
+        max_highlights (float, optional): Drop frames with a larger fraction of clipped pixels.
+
+    Returns:
+        list: The frames to keep.
+    """
+    if not frames or (min_luma is None and min_sharpness is None and max_highlights is None):
+        return frames
+
+    stats = {
+        row['file_name']: row
+        for row in index.query(start=frames[0][0].timestamp(), end=frames[-1][0].timestamp() + 1)
+    }
+
+    def keep(path):
+        row = stats.get(path)
+        if row is None:
+            return True
+        return ((min_luma is None or row['mean_luma'] >= min_luma)
+                and (min_sharpness is None or row['sharpness'] >= min_sharpness)
+                and (max_highlights is None or row['highlights'] <= max_highlights))
+
+    kept = [frame for frame in frames if keep(frame[1])]
+    log(logger, f"Frame stats filter dropped {len(frames) - len(kept)} of {len(frames)} frames.")
+    return kept
+
+def deflicker_frames(frames, window, method='gain', workers=None, index=None):
+    """
+    Calculates the deflicker correction of every frame, see plan_deflicker().
+
+    The mean luma is taken from the frame stats index where it is available, and
+    measured on draft-decoded frames in a process pool otherwise. The index holds
+    the luma before the inline deflicker, so leave it out for frames that were
+    already deflickered while capturing.
+
+    Parameters:
+        frames (list): (capture time, path) tuples, from find_frames().
+        window (int): Frames in the rolling window.
+        method (str): 'gain' or 'gamma'.
+        workers (int, optional): Worker processes, the number of CPUs if None.
+        index (FrameStatsIndex, optional): The frame stats index.
+
+    Returns:
+        numpy.ndarray: A uint8 lookup table per frame, shape (frames, 256).
+    """
+    indexed = {}
+    if index is not None and frames:
+        rows = index.query(start=frames[0][0].timestamp(), end=frames[-1][0].timestamp() + 1)
+        indexed = {row['file_name']: row['mean_luma'] for row in rows}
+
+    missing = [path for _, path in frames if path not in indexed]
+    start_time = time.monotonic()
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            indexed.update(zip(missing, executor.map(file_luma, missing, chunksize=16)))
+    log(logger, f"Measured the luma of {len(missing)} frames in {time.monotonic() - start_time:.1f} s, "
+                f"{len(frames) - len(missing)} from the frame stats index.")
+    return plan_deflicker([indexed[path] for _, path in frames], window, method)
+
+def load_frame(path, size, output=None, quality=95, lut=None):
+    """
+    Decodes a frame and scales it to the video size. Runs in a worker process.
+
+    JPEGs are decoded with draft(), so libjpeg scales them down by 2, 4 or 8 while
+    decoding, and only the rest is resized.
+
+    Parameters:
+        path (str): The image file.
+        size (tuple): The (width, height) of the video.
+        output (str, optional): Save the scaled frame here instead of returning it.
+        quality (int): JPEG quality of the saved frame.
+        lut (numpy.ndarray, optional): A deflicker lookup table, applied after scaling.
+
+    Returns:
+        bytes: The frame as packed RGB24, or None if it was saved to output.
+    """
+    with Image.open(path) as image:
+        image.draft('RGB', size)
+        frame = image.convert('RGB')
+    if frame.size != tuple(size):
+        frame = frame.resize(size, Image.BICUBIC, reducing_gap=2.0)
+    if lut is not None:
+        frame = apply_lut(frame, lut)
+    if output is not None:
+        frame.save(output, 'JPEG', quality=quality)
+        return None
+    return frame.tobytes()
+
+def map_ordered(executor, function, argument_lists, window):
+    """
+    Runs function over argument_lists in the executor and yields the results in order,
+    with at most window calls queued or running at a time.
+    """
+    pending = deque()
+    for arguments in argument_lists:
+        pending.append(executor.submit(function, *arguments))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class FfmpegWriter:
+    """
+    Streams raw RGB24 frames into an ffmpeg process that encodes the video.
+    """
+
+    def __init__(self, output, size, fps, codec='libx264', crf=20):
+        """
+        Parameters:
+            output (str): The video file.
+            size (tuple): The (width, height) of the frames.
+            fps (float): Frames per second of the video.
+            codec (str): The ffmpeg video codec.
+            crf (int): The constant rate factor, lower is better quality.
+        """
+        width, height = size
+        command = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+            '-c:v', codec, '-pix_fmt', 'yuv420p', '-crf', str(crf), output,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(frame)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}")
+
+def render(frames, size, output=None, frames_dir=None, fps=25, workers=None, codec='libx264', crf=20, quality=95, luts=None):
+    """
+    Renders frames into a video with ffmpeg, or into a folder of numbered JPEGs.
+
+    Frames are decoded and scaled in a process pool. At most FRAMES_PER_WORKER
+    frames per worker are in flight, so memory use does not grow with the
+    length of the timelapse.
+
+    Parameters:
+        frames (list): (capture time, path) tuples, from find_frames().
+        size (tuple): The (width, height) of the video.
+        output (str, optional): The video file, encoded by ffmpeg.
+        frames_dir (str, optional): Write numbered frames (frame_000001.jpg, ...) here instead.
+        fps (float): Frames per second of the video.
+        workers (int, optional): Worker processes, the number of CPUs if None.
+        codec (str): The ffmpeg video codec.
+        crf (int): The ffmpeg constant rate factor.
+        quality (int): JPEG quality of numbered frames.
+        luts (numpy.ndarray, optional): A deflicker lookup table per frame, from deflicker_frames().
+
+    Returns:
+        dict: 'frames', 'seconds' and 'fps' (frames rendered per second).
+    """
+    if (output is None) == (frames_dir is None):
+        raise ValueError("Set exactly one of output and frames_dir")
+    size = tuple(size)
+    workers = workers or os.cpu_count() or 1
+    if not frames:
+        log_warning(logger, "No frames found to render.")
+        return {'frames': 0, 'seconds': 0.0, 'fps': 0.0}
+
+    if frames_dir is not None:
+        os.makedirs(frames_dir, exist_ok=True)
+        arguments = [(path, size, os.path.join(frames_dir, f"frame_{number:06d}.jpg"), quality,
+                      None if luts is None else luts[number - 1])
+                     for number, (_, path) in enumerate(frames, start=1)]
+        writer = None
+    else:
+        arguments = [(path, size, None, quality, None if luts is None else luts[number])
+                     for number, (_, path) in enumerate(frames)]
+        writer = FfmpegWriter(output, size, fps, codec, crf)
+
+    log(logger, f"Rendering {len(frames)} frames at {size[0]}x{size[1]} with {workers} workers.")
+    start_time = time.monotonic()
+    count = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for frame in map_ordered(executor, load_frame, arguments, workers * FRAMES_PER_WORKER):
+                if writer is not None:
+                    writer.write(frame)
+                count += 1
+                if count % PROGRESS_EVERY == 0:
+                    log(logger, f"{count} of {len(frames)} frames, {count / (time.monotonic() - start_time):.1f} frames/s")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    seconds = time.monotonic() - start_time
+    result = {'frames': count, 'seconds': seconds, 'fps': count / seconds if seconds else 0.0}
+    log(logger, f"Rendered {count} frames in {seconds:.1f} s ({result['fps']:.1f} frames/s).")
+    return result
@@ -0,0 +1,311 @@
+# src/storage/retention.py
+
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from src.image.derivatives import derivative_root
+from src.log.logger import get_logger, log, log_warning, log_error
+
+logger = get_logger('retention.log', echo_to_console=True)
+
+# Pause between deletions, so a large cleanup does not saturate the SD card while frames are saved
+DELETE_PAUSE = 0.005
+
+GB = 1024 ** 3
+
+class DirectoryState:
+    """
+    What the last scan found in one dated image folder.
+    """
+
+    def __init__(self, path, date):
+        self.path = path
+        self.date = date
+        self.mtime = None
+        self.size = 0
+        self.files = []  # (capture time or None, name, size)
+        self.thinned = False
+
+def frame_time(name, prefix, time_format):
+    """
+    Returns the capture time from an image file name, or None if it is not a frame.
+    """
+    stem = os.path.splitext(name)[0]
+    if not stem.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(stem[len(prefix):], time_format)
+    except ValueError:
+        return None
+
+class TreeIndex:
+    """
+    An incrementally updated index of the dated folders of one image tree.
+
+    Folders are found by walking only as deep as image_output.folder_structure,
+    and a folder's files are only listed again when its mtime changed, so a pass
+    over years of frames stats a few thousand folders instead of every file.
+    """
+
+    def __init__(self, name, root, config):
+        """
+        Parameters:
+            name (str): The tier name, 'full' or a derivative name.
+            root (str): The root folder of the tree.
+            config (Settings): The settings.
+        """
+        self.name = name
+        self.root = root
+        self.folder_format = config['image_output']['folder_structure'].strip('/')
+        self.prefix = config['image_output']['filename_prefix']
+        self.time_format = config['image_output']['filename_time_format']
+        self.depth = len(self.folder_format.split('/')) if self.folder_format else 0
+        self.directories = {}
+
+    def _folder_date(self, path):
+        relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+        try:
+            return datetime.strptime(relative, self.folder_format)
+        except ValueError:
+            return None
+
+    def _leaf_folders(self, path, depth):
+        if depth == 0:
+            yield path
+            return
+        try:
+            entries = [entry for entry in os.scandir(path) if entry.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            yield from self._leaf_folders(entry.path, depth - 1)
+
+    def refresh(self):
+        """
+        Updates the index: new folders are added, changed folders are listed again
+        and folders that no longer exist are dropped.
+        """
+        seen = set()
+        for path in self._leaf_folders(self.root, self.depth):
+            date = self._folder_date(path)
+            if date is None:
+                continue
+            seen.add(path)
+            state = self.directories.get(path)
+            if state is None:
+                state = self.directories[path] = DirectoryState(path, date)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if mtime != state.mtime:
+                state.mtime = mtime
+                state.files = []
+                for entry in os.scandir(path):
+                    if entry.is_file(follow_symlinks=False):
+                        state.files.append((frame_time(entry.name, self.prefix, self.time_format), entry.name, entry.stat().st_size))
+                state.size = sum(size for _, _, size in state.files)
+
+        for path in list(self.directories):
+            if path not in seen:
+                del self.directories[path]
+
+    def oldest_first(self):
+        return sorted(self.directories.values(), key=lambda state: state.date)
+
+    def total_size(self):
+        return sum(state.size for state in self.directories.values())
+
+class RetentionService:
+    """
+    Enforces the age and disk-usage budgets of each image tree in a background thread.
+
+    Each tier in retention.tiers names a tree: 'full' for image_output.root_folder,
+    or the name of a derivative size. Folders older than max_age_days are deleted,
+    or thinned to the first frame of every hour with expire: 'hourly'. A tier over
+    max_size_gb loses its oldest folders first, and when the disk has less than
+    min_free_gb free, the oldest folders are deleted from the tiers in order.
+    Today's folder is never touched.
+    """
+
+    def __init__(self, config, dry_run=False):
+        """
+        Parameters:
+            config (Settings): The settings.
+            dry_run (bool): Only log what would be deleted.
+        """
+        self.dry_run = dry_run
+        self.indexes = {}
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.update(config)
+
+    def update(self, config):
+        """
+        Applies new settings, e.g. after config.yaml was reloaded. Takes effect at the next pass.
+        """
+        self.config = config
+        indexes = {}
+        for tier in config['retention']['tiers']:
+            root = config['image_output']['root_folder'] if tier['tree'] == 'full' else derivative_root(config, tier['tree'])
+            index = self.indexes.get(tier['tree'])
+            indexes[tier['tree']] = index if index is not None and index.root == root else TreeIndex(tier['tree'], root, config)
+        self.indexes = indexes
+
+    def start(self):
+        """
+        Starts the background thread, which runs a pass every retention.check_interval seconds.
+        """
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pass()
+            except Exception as e:
+                log_error(logger, f"Error during the retention pass: {e}")
+            self._stop.wait(self.config['retention']['check_interval'])
+
+    def run_pass(self, now=None):
+        """
+        Runs one retention pass over all tiers.
+
+        Parameters:
+            now (datetime, optional): The current time, for testing.
+
+        Returns:
+            dict: 'files' and 'bytes' deleted in this pass.
+        """
+        now = now or datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start_files, start_bytes = self.deleted_files, self.deleted_bytes
+        start_time = time.monotonic()
+
+        tiers = self.config['retention']['tiers']
+        for tier in tiers:
+            index = self.indexes[tier['tree']]
+            index.refresh()
+
+            max_age_days = tier.get('max_age_days')
+            if max_age_days is not None:
+                cutoff = today - timedelta(days=max_age_days)
+                for state in index.oldest_first():
+                    if state.date >= cutoff or self._stop.is_set():
+                        break
+                    if self._is_current(index, state, now):
+                        continue
+                    if tier.get('expire', 'delete') == 'hourly':
+                        self._thin_hourly(state)
+                    else:
+                        self._delete_folder(index, state)
+
+            max_size_gb = tier.get('max_size_gb')
+            if max_size_gb is not None:
+                if not self._delete_until(index, today, now, lambda: index.total_size() <= max_size_gb * GB):
+                    log_warning(logger, f"The '{tier['tree']}' tier is still over {max_size_gb} GB with only today's frames left.")
+
+        min_free_gb = self.config['retention']['min_free_gb']
+        if min_free_gb:
+            root_folder = self.config['image_output']['root_folder']
+            # A dry run frees nothing, count what this pass would have freed so it stops where a real pass would
+            freed = lambda: self.deleted_bytes - start_bytes if self.dry_run else 0
+            enough_space = lambda: self._free_bytes(root_folder) + freed() >= min_free_gb * GB
+            if not any(self._delete_until(self.indexes[tier['tree']], today, now, enough_space) for tier in tiers):
+                log_warning(logger, f"Less than {min_free_gb} GB free with only today's frames left.")
+
+        deleted_files, deleted_bytes = self.deleted_files - start_files, self.deleted_bytes - start_bytes
+        if deleted_files:
+            log(logger, f"Retention pass {'(dry run) ' if self.dry_run else ''}removed {deleted_files} files, "
+                        f"{deleted_bytes / GB:.2f} GB in {time.monotonic() - start_time:.1f} s")
+        return {'files': deleted_files, 'bytes': deleted_bytes}
+
+    @staticmethod
+    def _free_bytes(path):
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    @staticmethod
+    def _is_current(index, state, now):
+        # With a coarse folder_structure such as '%Y/%m/' the folder frames are saved to now starts before today
+        return os.path.normpath(state.path) == os.path.normpath(os.path.join(index.root, now.strftime(index.folder_format)))
+
+    def _delete_until(self, index, today, now, done):
+        """
+        Deletes the oldest folders of a tree until done() is true. Returns done().
+        """
+        for state in index.oldest_first():
+            if done() or state.date >= today or self._stop.is_set():
+                break
+            if not self._is_current(index, state, now):
+                self._delete_folder(index, state)
+        return done() or self._stop.is_set()
+
+    def _remove(self, path, size):
+        if not self.dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            time.sleep(DELETE_PAUSE)
+        self.deleted_files += 1
+        self.deleted_bytes += size
+
+    def _delete_folder(self, index, state):
+        for _, name, size in state.files:
+            self._remove(os.path.join(state.path, name), size)
+        if not self.dry_run:
+            # Remove the empty folder and its empty parents up to the tree root
+            path = state.path
+            while os.path.normpath(path) != os.path.normpath(index.root):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    break
+                path = os.path.dirname(path)
+        del index.directories[state.path]
+
+    def _thin_hourly(self, state):
+        if state.thinned:
+            return
+        kept_hours = set()
+        kept = []
+        for capture_time, name, size in sorted(state.files, key=lambda file: (file[0] is None, file[0] or datetime.min)):
+            if capture_time is None:
+                kept.append((capture_time, name, size))  # Not a frame, leave it alone
+                continue
+            hour = capture_time.replace(minute=0, second=0, microsecond=0)
+            if hour in kept_hours:
+                self._remove(os.path.join(state.path, name), size)
+            else:
+                kept_hours.add(hour)
+                kept.append((capture_time, name, size))
+        state.files = kept
+        state.size = sum(size for _, _, size in kept)
+        state.thinned = True
+        if not self.dry_run:
+            state.mtime = os.stat(state.path).st_mtime
+
+if __name__ == "__main__":
+    # Run one retention pass, e.g. to preview it:
+    #     python3 -m src.storage.retention --dry-run
+    import argparse
+    from src.config.settings import get_settings
+
+    parser = argparse.ArgumentParser(description="Run one retention pass over the image trees.")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+    arguments = parser.parse_args()
+
+    service = RetentionService(get_settings(), dry_run=arguments.dry_run)
+    result = service.run_pass()
+    print(f"{'Would remove' if arguments.dry_run else 'Removed'} {result['files']} files, {result['bytes'] / GB:.2f} GB")
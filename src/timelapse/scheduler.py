@@ -0,0 +1,216 @@
+# src/timelapse/scheduler.py
+
+import math
+import time
+from collections import deque
+from datetime import datetime
+
+# Re-anchor the schedule when the wall clock jumps by more than this (e.g. an NTP sync after boot)
+RESYNC_THRESHOLD = 1.0
+
+# Number of recent frames the jitter percentiles are computed from
+JITTER_WINDOW = 1000
+
+# Environment variable with the slot's wall-clock time (Unix time) a capture_image.py subprocess names its frame after
+CAPTURE_TIME_ENV = 'TIMELAPSE_CAPTURE_TIME'
+
+class MonotonicClock:
+    """
+    The real clocks: time.monotonic() for deadlines, time.time() for wall-clock slot alignment.
+    """
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class SimulatedClock:
+    """
+    A clock that only moves when told to, so scheduling can be tested deterministically.
+    sleep() returns at once and advances the clock, advance() simulates work such as a capture.
+    """
+
+    def __init__(self, start_time=1_700_000_000.0, monotonic_start=1000.0):
+        self.wall_offset = start_time - monotonic_start
+        self.now = monotonic_start
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now + self.wall_offset
+
+    def sleep(self, seconds):
+        self.advance(max(0.0, seconds))
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def jump_wall_clock(self, seconds):
+        """
+        Moves only the wall clock, like an NTP step.
+        """
+        self.wall_offset += seconds
+
+class Slot:
+    """
+    A capture slot handed out by the scheduler.
+    """
+
+    def __init__(self, index, wall_time, lateness):
+        """
+        Parameters:
+            index (int): The slot number since the schedule was anchored.
+            wall_time (float): The scheduled wall-clock time of the slot (epoch seconds).
+            lateness (float): Seconds between the deadline and when the slot was handed out.
+        """
+        self.index = index
+        self.wall_time = wall_time
+        self.lateness = lateness
+
+    @property
+    def datetime(self):
+        return datetime.fromtimestamp(self.wall_time)
+
+class Scheduler:
+    """
+    Hands out capture slots on absolute deadlines, aligned to the wall clock.
+
+    With a 30 second interval the slots are at exactly :00 and :30. Deadlines are kept
+    on the monotonic clock, so a slow capture delays only its own frame and never
+    shifts the following slots. When a capture overruns:
+
+    - 'skip': slots whose deadline passed more than max_lateness ago are skipped and counted as missed.
+    - 'catch_up': up to max_catch_up overdue slots are captured back to back, older ones are counted as missed.
+    """
+
+    def __init__(self, interval, policy='skip', max_lateness=None, max_catch_up=1, align=True, clock=None):
+        """
+        Parameters:
+            interval (float): Seconds between slots.
+            policy (str): 'skip' or 'catch_up'.
+            max_lateness (float, optional): For 'skip', how late a slot may still be captured. Defaults to half the interval.
+            max_catch_up (int): For 'catch_up', the max number of overdue slots captured back to back.
+            align (bool): Align the slots to multiples of the interval on the wall clock.
+            clock (MonotonicClock or SimulatedClock, optional): The clock, the real one if None.
+        """
+        self.align = align
+        self.clock = clock or MonotonicClock()
+        self.frames = 0
+        self.missed = 0
+        self.resyncs = 0
+        self.jitter = deque(maxlen=JITTER_WINDOW)
+        self.interval = interval
+        self.set_policy(policy, max_lateness, max_catch_up)
+        self.set_interval(interval)
+
+    def set_interval(self, interval):
+        """
+        Changes the interval and re-anchors the schedule from the next slot.
+
+        Parameters:
+            interval (float): Seconds between slots.
+        """
+        self.interval = interval
+        self.max_lateness = self._max_lateness if self._max_lateness is not None else interval / 2
+        self._anchor()
+
+    def set_policy(self, policy, max_lateness=None, max_catch_up=1):
+        """
+        Changes how overruns are handled, from the next slot. The schedule and the stats are kept.
+
+        Parameters:
+            policy (str): 'skip' or 'catch_up'.
+            max_lateness (float, optional): For 'skip', how late a slot may still be captured. Defaults to half the interval.
+            max_catch_up (int): For 'catch_up', the max number of overdue slots captured back to back.
+        """
+        if policy not in ('skip', 'catch_up'):
+            raise ValueError(f"Unknown schedule policy '{policy}', use 'skip' or 'catch_up'")
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self._max_lateness = max_lateness
+        self.max_lateness = max_lateness if max_lateness is not None else self.interval / 2
+
+    def _anchor(self):
+        """
+        Places slot 0 at the next wall-clock multiple of the interval (or now, if not aligned).
+        """
+        now = self.clock.monotonic()
+        wall = self.clock.time()
+        self._wall_offset = wall - now
+        first_wall = math.ceil(wall / self.interval) * self.interval if self.align else wall
+        self._first_deadline = now + (first_wall - wall)
+        self.next_index = 0
+
+    def _resync(self):
+        """
+        Re-anchors when the wall clock jumped, so slots stay aligned to real time.
+        """
+        offset = self.clock.time() - self.clock.monotonic()
+        if abs(offset - self._wall_offset) > RESYNC_THRESHOLD:
+            self.resyncs += 1
+            self._anchor()
+
+    def deadline(self, index):
+        """
+        Returns the monotonic deadline of a slot.
+        """
+        return self._first_deadline + index * self.interval
+
+    def next_slot(self):
+        """
+        Sleeps until the next slot is due, and returns it.
+
+        Returns:
+            Slot: The slot to capture now.
+        """
+        self._resync()
+        now = self.clock.monotonic()
+        index = self.next_index
+
+        if self.policy == 'skip':
+            while now - self.deadline(index) > self.max_lateness:
+                index += 1
+                self.missed += 1
+        else:
+            # Index of the latest slot that is already due
+            latest_due = math.floor((now - self._first_deadline) / self.interval)
+            overdue = latest_due - index
+            if overdue > self.max_catch_up:
+                self.missed += overdue - self.max_catch_up
+                index = latest_due - self.max_catch_up
+
+        deadline = self.deadline(index)
+        remaining = deadline - self.clock.monotonic()
+        if remaining > 0:
+            self.clock.sleep(remaining)
+
+        lateness = self.clock.monotonic() - deadline
+        self.next_index = index + 1
+        self.frames += 1
+        self.jitter.append(lateness)
+        return Slot(index, deadline + self._wall_offset, lateness)
+
+    def stats(self):
+        """
+        Returns frame and missed-slot counters and jitter statistics over the recent frames.
+
+        Returns:
+            dict: The scheduler statistics, jitter values in seconds.
+        """
+        jitter = sorted(self.jitter)
+        if not jitter:
+            return {'frames': self.frames, 'missed': self.missed, 'resyncs': self.resyncs}
+        return {
+            'frames': self.frames,
+            'missed': self.missed,
+            'resyncs': self.resyncs,
+            'jitter_mean': sum(jitter) / len(jitter),
+            'jitter_p50': jitter[len(jitter) // 2],
+            'jitter_p95': jitter[min(len(jitter) - 1, int(len(jitter) * 0.95))],
+            'jitter_max': jitter[-1],
+        }
@@ -0,0 +1,34 @@
+# tests/conftest.py
+#
+# Run from the project folder:
+#     python3 -m pytest tests
+
+import os
+import sys
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from src.config.settings import Settings, freeze, validate
+
+EXAMPLE_CONFIG = os.path.join(BASE_DIR, 'config_example.yaml')
+
+@pytest.fixture
+def make_settings():
+    """
+    Returns a function that builds Settings from config_example.yaml with some sections changed, e.g.
+    make_settings(image={'exposure_mode': 'histogram'}).
+    """
+    import yaml
+
+    def make(**sections):
+        with open(EXAMPLE_CONFIG) as file:
+            raw = yaml.safe_load(file)
+        for section, values in sections.items():
+            raw[section] = dict(raw.get(section) or {}, **values)
+        config = validate(raw)
+        return Settings({key: freeze(value) for key, value in config.items()})
+
+    return make
@@ -0,0 +1,117 @@
+# tests/test_camera_session.py
+
+import pytest
+from src.camera import camera_session
+from src.camera.camera_session import CameraSession
+from src.camera.fake_camera import FakePicamera2
+
+MANUAL = {'AeEnable': False, 'ExposureTime': 20000, 'AnalogueGain': 2.0}
+
+def make_config(**camera_settings):
+    return {'camera_settings': dict({'backend': 'fake', 'main_size': [640, 480], 'settle_time': 2,
+                                     'metering_time': 1, 'settle_frames': 3}, **camera_settings)}
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Records the settle sleeps instead of waiting.
+    """
+    calls = []
+    monkeypatch.setattr(camera_session.time, 'sleep', calls.append)
+    return calls
+
+@pytest.fixture
+def session():
+    cameras = []
+
+    def camera_factory(config):
+        cameras.append(FakePicamera2(control_delay=1))
+        return cameras[-1]
+
+    with CameraSession(make_config(), camera_factory=camera_factory) as session:
+        yield session
+    assert len(cameras) == 1
+
+def test_the_first_apply_configures_and_settles(session, sleeps):
+    assert session.apply(make_config(), {'AeEnable': True})
+
+    assert session.camera.configure_count == 1
+    assert session.camera.started
+    assert sleeps == [2]
+
+def test_a_controls_only_change_does_not_reconfigure(session, sleeps):
+    session.apply(make_config(), {'AeEnable': True})
+    frame_count = session.camera.frame_count
+
+    assert not session.apply(make_config(), MANUAL)
+
+    assert session.camera.set_controls_count == 1
+    assert session.camera.configure_count == 1
+    assert sleeps == [2]
+    # apply() does not wait for the controls to take effect
+    assert session.camera.frame_count == frame_count
+
+def test_the_frame_before_new_controls_is_discarded(session, sleeps):
+    session.apply(make_config(), {'AeEnable': True})
+    session.apply(make_config(), MANUAL)
+    frame_count = session.camera.frame_count
+
+    request = session.capture_request()
+
+    # The fake camera applies controls one frame late, that frame is released and captured again
+    assert request.get_metadata()['ExposureTime'] == 20000
+    assert session.camera.frame_count == frame_count + 2
+    request.release()
+
+def test_long_exposures_are_not_discarded(session, sleeps):
+    session.apply(make_config(), {'AeEnable': True})
+    session.apply(make_config(), dict(MANUAL, ExposureTime=20_000_000))
+    frame_count = session.camera.frame_count
+
+    request = session.capture_request()
+
+    # A second 20 s exposure would end after max_settle_time, so the first frame is kept
+    assert request.get_metadata()['ExposureTime'] != 20_000_000
+    assert session.camera.frame_count == frame_count + 1
+    request.release()
+    assert session.capture_request().get_metadata()['ExposureTime'] == 20_000_000
+
+def test_unchanged_controls_are_not_sent_again(session, sleeps):
+    session.apply(make_config(), MANUAL)
+
+    assert not session.apply(make_config(), dict(MANUAL))
+
+    assert session.camera.set_controls_count == 0
+    assert session.camera.configure_count == 1
+
+def test_a_new_main_size_reconfigures(session, sleeps):
+    session.apply(make_config(), MANUAL)
+
+    assert session.apply(make_config(main_size=[320, 240]), MANUAL)
+
+    assert session.camera.configure_count == 2
+    assert session.camera.configuration['main']['size'] == (320, 240)
+
+def test_a_new_lores_size_reconfigures(session, sleeps):
+    session.apply(make_config(), MANUAL)
+    config = dict(make_config(lores_size=[320, 240]), image={'exposure_mode': 'histogram'})
+
+    assert session.apply(config, MANUAL)
+
+    assert session.camera.configure_count == 2
+    assert session.camera.configuration['lores'] == {'size': (320, 240)}
+
+def test_re_enabling_auto_exposure_settles(session, sleeps):
+    session.apply(make_config(), MANUAL)
+    frame_count = session.camera.frame_count
+
+    assert not session.apply(make_config(), {'AeEnable': True})
+
+    assert session.camera.configure_count == 1
+    assert sleeps == [2, 2]
+    # Auto exposure converges during the sleep, no frames are dropped
+    assert session.camera.frame_count == frame_count
+
+def test_the_fake_backend_needs_no_libcamera():
+    from src.image.configure_camera import get_control_enums
+    assert get_control_enums(make_config()).AfModeEnum.Manual == 0
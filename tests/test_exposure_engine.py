@@ -0,0 +1,55 @@
+# tests/test_exposure_engine.py
+
+import numpy as np
+import pytest
+from src.image.exposure_engine import ExposureEngine
+
+def reference_iso_and_shutter(lux, config):
+    """
+    The interpolation of calculate_iso_and_shutter() before the ExposureEngine, as the reference.
+    """
+    threshold = config['image']['lux_day_night_threshold']
+    night_min = config['image']['lux_night_min']
+    iso_day = config['camera_settings']['iso_day']
+    iso_night = config['camera_settings']['iso_night']
+    shutter_speed_day = config['image']['shutter_speed_day']
+    shutter_speed_start = config['image']['shutter_speed_start']
+    shutter_speed_night = config['camera_settings']['shutter_speed_night']
+
+    if lux >= threshold:
+        iso, shutter_speed, daylight = iso_day, shutter_speed_day, True
+    elif lux <= night_min:
+        iso, shutter_speed, daylight = iso_night, shutter_speed_night, False
+    else:
+        daylight = False
+        factor = max(0, min((threshold - lux) / (threshold - night_min), 1))
+        iso = round(max(iso_day, min(iso_day + factor * (iso_night - iso_day), iso_night)), 1)
+        shutter_speed = shutter_speed_start + factor * (shutter_speed_night - shutter_speed_start)
+        shutter_speed = int(round(max(shutter_speed_start, min(shutter_speed, shutter_speed_night)), 0))
+        if shutter_speed <= shutter_speed_start:
+            shutter_speed, iso = 0, iso_day
+    return iso if shutter_speed else None, shutter_speed if shutter_speed else None, daylight
+
+def test_calculate_matches_the_reference_formula(make_settings):
+    config = make_settings(image={'exposure_curve': 'linear'})
+    engine = ExposureEngine(config)
+    threshold = config['image']['lux_day_night_threshold']
+
+    for lux in list(np.linspace(0, threshold * 2, 997)) + [0.5, threshold, threshold - 1e-6]:
+        # The lookup table interpolates the straight line of the formula, so the results are the same
+        assert engine.calculate(float(lux)) == reference_iso_and_shutter(float(lux), config), lux
+
+def test_update_without_smoothing_equals_calculate(make_settings):
+    config = make_settings(image={'exposure_smoothing': 0.0, 'exposure_hysteresis': 0.0})
+    engine = ExposureEngine(config)
+    for lux in (500.0, 40.0, 20.0, 5.0, 0.2, 12.0, 300.0):
+        assert engine.update(lux) == engine.calculate(lux)
+
+def test_hysteresis_holds_manual_exposure_just_above_the_threshold(make_settings):
+    config = make_settings(image={'exposure_hysteresis': 0.2})
+    engine = ExposureEngine(config)
+    threshold = config['image']['lux_day_night_threshold']
+
+    assert engine.update(threshold * 0.5)[2] is False
+    assert engine.update(threshold * 1.1)[2] is False
+    assert engine.update(threshold * 1.3)[2] is True
@@ -0,0 +1,75 @@
+# tests/test_hdr.py
+
+import numpy as np
+import pytest
+from src.camera.camera_session import CameraSession
+from src.camera.fake_camera import FakePicamera2
+from src.image.configure_camera import build_camera_controls
+from src.image.hdr import bracket_controls, capture_bracket, fuse_exposures, fuse_tile
+from src.overlay.frame_context import FrameContext
+
+STOPS = (0, -2, 2)
+
+def synthetic_bracket(width, height, stops=STOPS):
+    """
+    A gradient scene with texture and a bright window, exposed at each stop, like benchmarks/bench_hdr.py.
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    radiance = np.exp(x / width * 6 - 3) * (1 + 0.3 * np.sin(y / 17) * np.cos(x / 29))
+    radiance[height // 5:height * 2 // 5, width // 6:width // 3] *= 30
+    radiance = radiance[:, :, None] * np.array([1.0, 0.9, 0.8], dtype=np.float32)
+    return [np.clip(255 * (radiance * 2.0 ** stop / 4) ** (1 / 2.2), 0, 255).astype(np.uint8) for stop in stops]
+
+@pytest.mark.parametrize('width, height, tile_size', [(320, 240, 64), (300, 200, 96), (256, 256, 256)])
+def test_tiles_join_without_seams(width, height, tile_size):
+    frames = synthetic_bracket(width, height)
+
+    whole = fuse_tile(frames, levels=4)
+    tiled = fuse_exposures(frames, levels=4, tile_size=tile_size, workers=2)
+
+    # Only rounding differences, also on the rows and columns where the tiles meet
+    difference = np.abs(tiled.astype(int) - whole)
+    assert difference.max() <= 1
+    for edge in range(tile_size, width, tile_size):
+        assert difference[:, edge - 1:edge + 1].max() <= 1
+    for edge in range(tile_size, height, tile_size):
+        assert difference[edge - 1:edge + 1].max() <= 1
+
+def test_fusion_recovers_shadows_and_highlights():
+    frames = synthetic_bracket(320, 240)
+    fused = fuse_exposures(frames, levels=4, tile_size=128).astype(int)
+    normal = frames[0].astype(int)
+
+    # The bright window is clipped in the normal exposure, the dark left edge nearly black
+    window = (slice(48, 96), slice(53, 106))
+    assert fused[window].std() > normal[window].std()
+    assert fused[:, :20].mean() > normal[:, :20].mean()
+
+def test_bracket_controls_scale_the_exposure(make_settings):
+    config = make_settings(hdr={'max_exposure_time': None})
+    controls = bracket_controls(config, {'AeEnable': True, 'ExposureValue': 0}, {'ExposureTime': 10000, 'AnalogueGain': 2.0}, -2)
+
+    assert controls == {'AeEnable': False, 'ExposureTime': 2500, 'AnalogueGain': 2.0}
+
+def test_capture_bracket_with_the_fake_camera(make_settings):
+    config = make_settings(camera_settings={'backend': 'fake', 'main_size': [320, 240], 'settle_time': 0,
+                                            'metering_time': 0, 'hdr': True})
+    cameras = []
+
+    def camera_factory(config):
+        cameras.append(FakePicamera2(lux=400.0, control_delay=0))
+        return cameras[-1]
+
+    with CameraSession(config, camera_factory=camera_factory) as session:
+        controls = build_camera_controls(config, lux=400.0, context=FrameContext())
+        session.apply(config, controls)
+        request = session.capture_request()
+        metadata = request.get_metadata()
+        request.release()
+
+        frames = capture_bracket(session, config, controls, metadata, [-2, 2])
+
+        assert [frame.shape for frame in frames] == [(240, 320, 3)] * 2
+        # The next frame's Lux feedback comes from the normal frame, not the last bracket exposure
+        assert session.last_metadata is metadata
+        assert cameras[0].controls['ExposureTime'] == metadata['ExposureTime'] * 4
@@ -0,0 +1,78 @@
+# tests/test_histogram_exposure.py
+
+import numpy as np
+import pytest
+from src.image.histogram_exposure import MAX_STEP, HistogramExposure, load_sample_luma, luma_stats, stacked_stats
+from src.image.stacking import linear_to_srgb
+
+@pytest.fixture
+def histogram_exposure(make_settings):
+    config = make_settings(image={'exposure_mode': 'histogram', 'histogram_target': 0.4, 'histogram_damping': 0.0})
+    return HistogramExposure(config)
+
+def sample_luma(tmp_path, mean, clipped=0.0):
+    """
+    Stores a 640x360 luma frame with the given mean level and fraction of blown-out pixels, and loads it back.
+    """
+    rng = np.random.default_rng(0)
+    luma = np.clip(rng.normal(mean, 10, (360, 640)), 0, 240).astype(np.uint8)
+    luma.ravel()[:int(luma.size * clipped)] = 255
+    path = str(tmp_path / f'luma_{mean}_{clipped}.npy')
+    np.save(path, luma)
+    return load_sample_luma(path)
+
+def test_a_dark_frame_gets_a_longer_exposure(tmp_path, histogram_exposure):
+    stats = luma_stats(sample_luma(tmp_path, 50))
+    gain, exposure_time = histogram_exposure.observe(stats, {'ExposureTime': 100000, 'AnalogueGain': 1.0})
+
+    assert gain == 1.0
+    assert exposure_time == pytest.approx(100000 * 102 / stats['mean'], rel=0.01)
+
+def test_the_correction_per_frame_is_limited(tmp_path, histogram_exposure):
+    stats = luma_stats(sample_luma(tmp_path, 5))
+    _, exposure_time = histogram_exposure.observe(stats, {'ExposureTime': 100000, 'AnalogueGain': 1.0})
+
+    assert exposure_time == 100000 * MAX_STEP
+
+def test_the_gain_is_only_raised_at_the_longest_exposure(tmp_path, histogram_exposure):
+    max_exposure_time = histogram_exposure.max_exposure_time
+    stats = luma_stats(sample_luma(tmp_path, 30))
+    gain, exposure_time = histogram_exposure.observe(stats, {'ExposureTime': max_exposure_time, 'AnalogueGain': 1.0})
+
+    assert exposure_time == max_exposure_time
+    assert gain > 1.0
+
+def test_clipped_highlights_shorten_the_exposure(tmp_path, histogram_exposure):
+    stats = luma_stats(sample_luma(tmp_path, 90, clipped=0.05))
+    assert stats['mean'] < histogram_exposure.target
+    _, exposure_time = histogram_exposure.observe(stats, {'ExposureTime': 100000, 'AnalogueGain': 1.0})
+
+    assert exposure_time < 100000
+
+def test_a_frame_on_target_keeps_its_exposure(tmp_path, histogram_exposure):
+    stats = luma_stats(sample_luma(tmp_path, 102), subsample=1)
+    gain, exposure_time = histogram_exposure.observe(stats, {'ExposureTime': 200000, 'AnalogueGain': 2.0})
+
+    assert gain * exposure_time == pytest.approx(400000, rel=0.02)
+    assert histogram_exposure.adjust(8.0, 1000000) == (gain, exposure_time)
+
+def night_luma(light):
+    return np.clip(linear_to_srgb(light) + 0.5, 0, 255).astype(np.uint8)
+
+def test_the_stack_gain_is_applied_in_linear_light(histogram_exposure):
+    # A dark gradient with a street light, which clips in the long exposure
+    light = np.tile(np.linspace(0.001, 0.1, 640), (360, 1))
+    light[100:140, 200:260] = 2.0
+    long_stats = luma_stats(night_luma(light), subsample=1)
+    short_stats = luma_stats(night_luma(light / 4), subsample=1)
+
+    stats = stacked_stats(short_stats, 4)
+
+    # Scaling the gamma-encoded mean by 4 would make it about twice as bright
+    assert stats['mean'] == pytest.approx(long_stats['mean'], abs=0.5)
+    assert stats['highlights'] == pytest.approx(long_stats['highlights'], abs=0.001)
+
+    short = histogram_exposure.observe(short_stats, {'ExposureTime': 250000, 'AnalogueGain': 2.0}, stack_gain=4)
+    histogram_exposure.reset()
+    single = histogram_exposure.observe(long_stats, {'ExposureTime': 1000000, 'AnalogueGain': 2.0})
+    assert short[0] * short[1] == pytest.approx(single[0] * single[1], rel=0.01)
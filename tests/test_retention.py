@@ -0,0 +1,106 @@
+# tests/test_retention.py
+
+import os
+from datetime import datetime
+import pytest
+from src.config.settings import ConfigError
+from src.storage import retention
+from src.storage.retention import GB, RetentionService
+
+NOW = datetime(2024, 6, 20, 12, 0)
+
+FRAME_TIMES = ('10:00', '10:10', '10:20', '11:00', '11:30')
+
+FRAME_SIZE = 1000
+
+@pytest.fixture(autouse=True)
+def no_delete_pause(monkeypatch):
+    monkeypatch.setattr(retention, 'DELETE_PAUSE', 0)
+
+def make_tree(root, days, prefix='test_tl_'):
+    """
+    Creates a dated folder with FRAME_TIMES frames of FRAME_SIZE bytes for each day of June 2024.
+    """
+    for day in days:
+        folder = os.path.join(root, f'2024/06/{day:02d}')
+        os.makedirs(folder)
+        for frame_time in FRAME_TIMES:
+            capture_time = datetime.strptime(f'2024-06-{day:02d} {frame_time}', '%Y-%m-%d %H:%M')
+            with open(os.path.join(folder, f"{prefix}{capture_time:%Y_%m_%d_%H_%M_%S}.jpg"), 'wb') as file:
+                file.write(b'\0' * FRAME_SIZE)
+
+def list_tree(root):
+    return sorted(os.path.relpath(os.path.join(path, name), root) for path, _, names in os.walk(root) for name in names)
+
+@pytest.fixture
+def tiers_config(tmp_path, make_settings):
+    root = str(tmp_path / 'images')
+    make_tree(root, (10, 15, 20))
+    make_tree(root + '_web', (10, 15, 20))
+    make_tree(root + '_thumb', (10, 15, 20))
+    return make_settings(
+        image_output={'root_folder': root},
+        derivatives={'root_folder': None},
+        retention={'min_free_gb': 0, 'tiers': [
+            {'tree': 'full', 'max_age_days': 7, 'expire': 'hourly'},
+            {'tree': 'web', 'max_age_days': 7, 'max_size_gb': 6000 / GB},
+            {'tree': 'thumb'},
+        ]},
+    )
+
+def test_dry_run_reports_the_tiers_without_deleting(tiers_config):
+    root = tiers_config['image_output']['root_folder']
+    trees = [root, root + '_web', root + '_thumb']
+    before = [list_tree(tree) for tree in trees]
+
+    result = RetentionService(tiers_config, dry_run=True).run_pass(now=NOW)
+
+    # full: 3 frames thinned from the old day, web: the old day by age and the next by size
+    assert result == {'files': 13, 'bytes': 13 * FRAME_SIZE}
+    assert [list_tree(tree) for tree in trees] == before
+
+def test_a_real_pass_deletes_what_the_dry_run_reported(tiers_config):
+    root = tiers_config['image_output']['root_folder']
+    dry_run = RetentionService(tiers_config, dry_run=True).run_pass(now=NOW)
+
+    result = RetentionService(tiers_config).run_pass(now=NOW)
+
+    assert result == dry_run
+    assert [name for name in list_tree(root) if name.startswith('2024/06/10')] == [
+        '2024/06/10/test_tl_2024_06_10_10_00_00.jpg', '2024/06/10/test_tl_2024_06_10_11_00_00.jpg',
+    ]
+    assert len(list_tree(root)) == 12
+    assert list_tree(root + '_web') == [f'2024/06/20/test_tl_2024_06_20_{time.replace(":", "_")}_00.jpg'
+                                        for time in FRAME_TIMES]
+    assert len(list_tree(root + '_thumb')) == 15
+
+def test_dry_run_stops_at_min_free_gb(tmp_path, make_settings, monkeypatch):
+    root = str(tmp_path / 'images')
+    make_tree(root, (10, 12, 15, 20))
+    free = 1 * GB
+    monkeypatch.setattr(RetentionService, '_free_bytes', staticmethod(lambda path: free))
+    # 7000 bytes short, so the two oldest days of 5000 bytes each are enough
+    config = make_settings(
+        image_output={'root_folder': root},
+        retention={'min_free_gb': (free + 7000) / GB, 'tiers': [{'tree': 'full'}]},
+    )
+
+    result = RetentionService(config, dry_run=True).run_pass(now=NOW)
+
+    assert result == {'files': 10, 'bytes': 10 * FRAME_SIZE}
+    assert len(list_tree(root)) == 20
+
+def test_todays_folder_is_never_deleted(tmp_path, make_settings, monkeypatch):
+    root = str(tmp_path / 'images')
+    make_tree(root, (19, 20))
+    monkeypatch.setattr(RetentionService, '_free_bytes', staticmethod(lambda path: 0))
+    config = make_settings(image_output={'root_folder': root}, retention={'min_free_gb': 1, 'tiers': [{'tree': 'full'}]})
+
+    result = RetentionService(config).run_pass(now=NOW)
+
+    assert result['files'] == 5
+    assert all(name.startswith('2024/06/20') for name in list_tree(root))
+
+def test_invalid_tiers_are_rejected(make_settings):
+    with pytest.raises(ConfigError):
+        make_settings(retention={'tiers': [{'tree': 'full', 'expire': 'weekly'}]})
@@ -0,0 +1,101 @@
+# tests/test_save_pipeline.py
+
+import threading
+import numpy as np
+import pytest
+from src.pipeline.save_pipeline import FrameJob, SavePipeline
+
+class BlockingHandler:
+    """
+    Records the frames it processes, and holds the first one until released,
+    so the queue fills up deterministically behind it.
+    """
+
+    def __init__(self):
+        self.processed = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, job, timings, is_latest):
+        self.started.set()
+        self.release.wait(5)
+        self.processed.append(job.file_name)
+
+def job(name, exposures=0, size=1000):
+    burst = [np.zeros(size, dtype=np.uint8) for _ in range(exposures)] or None
+    return FrameJob({}, None, {}, name, burst=burst)
+
+def start(pipeline, handler):
+    # The first frame is taken by the worker, the queue is empty behind it
+    assert pipeline.submit(job('first'))
+    assert handler.started.wait(5)
+
+def test_drop_policy_discards_the_new_frame():
+    handler = BlockingHandler()
+    pipeline = SavePipeline(handler, workers=1, queue_size=2, policy='drop')
+    start(pipeline, handler)
+
+    results = [pipeline.submit(job(name)) for name in ('a', 'b', 'c')]
+    handler.release.set()
+    pipeline.close(timeout=5)
+
+    assert results == [True, True, False]
+    assert handler.processed == ['first', 'a', 'b']
+    assert pipeline.stats()['dropped'] == 1
+
+def test_latest_policy_discards_the_oldest_queued_frame():
+    handler = BlockingHandler()
+    pipeline = SavePipeline(handler, workers=1, queue_size=2, policy='latest')
+    start(pipeline, handler)
+
+    results = [pipeline.submit(job(name)) for name in ('a', 'b', 'c', 'd')]
+    handler.release.set()
+    pipeline.close(timeout=5)
+
+    assert results == [True, True, True, True]
+    assert handler.processed == ['first', 'c', 'd']
+    assert pipeline.stats()['dropped'] == 2
+
+@pytest.mark.parametrize('policy, processed', [('drop', ['first', 'a']), ('latest', ['first', 'c'])])
+def test_the_queue_is_full_above_max_bytes(policy, processed):
+    handler = BlockingHandler()
+    pipeline = SavePipeline(handler, workers=1, queue_size=10, policy=policy, max_bytes=3000)
+    start(pipeline, handler)
+
+    # Each burst holds 2000 bytes, so only one fits in the queue
+    for name in ('a', 'b', 'c'):
+        pipeline.submit(job(name, exposures=2))
+    assert pipeline.stats()['queued_bytes'] == 2000
+    handler.release.set()
+    pipeline.close(timeout=5)
+
+    assert handler.processed == processed
+    assert pipeline.stats()['queued_bytes'] == 0
+
+def test_a_job_larger_than_max_bytes_is_accepted_into_an_empty_queue():
+    handler = BlockingHandler()
+    handler.release.set()
+    pipeline = SavePipeline(handler, workers=1, queue_size=2, policy='drop', max_bytes=100)
+
+    assert pipeline.submit(job('large', exposures=4))
+    pipeline.close(timeout=5)
+
+    assert handler.processed == ['large']
+
+def test_an_older_frame_finishing_last_is_not_latest():
+    claims = {}
+    newer_claimed = threading.Event()
+
+    def handler(job, timings, is_latest):
+        if job.file_name == 'older':
+            newer_claimed.wait(5)
+        claims[job.file_name] = is_latest()
+        if job.file_name == 'newer':
+            newer_claimed.set()
+
+    pipeline = SavePipeline(handler, workers=2, queue_size=4, policy='block')
+    pipeline.submit(job('older'))
+    pipeline.submit(job('newer'))
+    pipeline.close(timeout=5)
+
+    assert claims == {'older': False, 'newer': True}
@@ -0,0 +1,92 @@
+# tests/test_scheduler.py
+
+from datetime import datetime
+import pytest
+from src.timelapse.scheduler import CAPTURE_TIME_ENV, Scheduler, SimulatedClock
+
+def test_slots_are_aligned_to_the_wall_clock():
+    clock = SimulatedClock(start_time=1_700_000_007.0)
+    scheduler = Scheduler(30, clock=clock)
+
+    times = []
+    for _ in range(4):
+        slot = scheduler.next_slot()
+        times.append(slot.wall_time)
+        clock.advance(2)  # The capture
+
+    assert times[0] % 30 == 0
+    assert times[0] - 1_700_000_007.0 < 30
+    assert [later - earlier for earlier, later in zip(times, times[1:])] == [30, 30, 30]
+    assert scheduler.stats()['missed'] == 0
+
+def test_a_slow_capture_does_not_shift_the_following_slots():
+    clock = SimulatedClock(start_time=1_700_000_010.0)
+    scheduler = Scheduler(30, clock=clock)
+
+    first = scheduler.next_slot()
+    clock.advance(20)
+    second = scheduler.next_slot()
+
+    assert second.wall_time - first.wall_time == 30
+    assert second.lateness == pytest.approx(0)
+
+def test_skip_policy_skips_the_overrun_slots():
+    clock = SimulatedClock(start_time=1_700_000_010.0)
+    scheduler = Scheduler(30, policy='skip', clock=clock)
+
+    first = scheduler.next_slot()
+    clock.advance(70)  # Runs past the next two deadlines
+    second = scheduler.next_slot()
+
+    # Slot 1 is 40 s late and slot 2 10 s late, within max_lateness (15 s)
+    assert second.index == 2
+    assert second.wall_time - first.wall_time == 60
+    assert second.lateness == pytest.approx(10)
+    assert scheduler.stats()['missed'] == 1
+
+def test_catch_up_policy_captures_overdue_slots_back_to_back():
+    clock = SimulatedClock(start_time=1_700_000_010.0)
+    scheduler = Scheduler(30, policy='catch_up', max_catch_up=1, clock=clock)
+
+    scheduler.next_slot()
+    clock.advance(100)  # Slots 1, 2 and 3 are due
+    indexes = [scheduler.next_slot().index, scheduler.next_slot().index]
+
+    assert indexes == [2, 3]
+    assert scheduler.stats()['missed'] == 1
+
+def test_set_policy_keeps_the_schedule_and_stats():
+    clock = SimulatedClock(start_time=1_700_000_010.0)
+    scheduler = Scheduler(30, clock=clock)
+    scheduler.next_slot()
+    clock.advance(70)
+    scheduler.next_slot()
+
+    scheduler.set_policy('catch_up', max_catch_up=2)
+    slot = scheduler.next_slot()
+
+    assert slot.index == 3
+    assert scheduler.stats()['missed'] == 1
+    assert scheduler.max_lateness == 15
+
+def test_a_wall_clock_jump_resyncs_the_schedule():
+    clock = SimulatedClock(start_time=1_700_000_010.0)
+    scheduler = Scheduler(30, clock=clock)
+    scheduler.next_slot()
+
+    clock.jump_wall_clock(3600 + 5)
+    slot = scheduler.next_slot()
+
+    assert scheduler.stats()['resyncs'] == 1
+    assert slot.wall_time % 30 == 0
+
+def test_the_capture_subprocess_gets_the_slot_time(monkeypatch):
+    import run_timelapse
+    calls = []
+    monkeypatch.setattr(run_timelapse.subprocess, 'run', lambda args, **kwargs: calls.append(kwargs['env']))
+    scheduler = Scheduler(30, clock=SimulatedClock(start_time=1_700_000_010.0))
+    slot = scheduler.next_slot()
+
+    run_timelapse.run_subprocess_capture(slot)
+
+    assert datetime.fromtimestamp(float(calls[0][CAPTURE_TIME_ENV])) == slot.datetime
@@ -0,0 +1,60 @@
+# tests/test_stacking.py
+
+import numpy as np
+import pytest
+from src.image.stacking import burst_controls, burst_size, stack_burst, stack_frames
+
+FRAMES = 4
+
+def encode(light):
+    """
+    Gamma-encodes linear light like the camera, with the sRGB curve. Light above 1 clips.
+    """
+    light = np.clip(light, 0, 1)
+    levels = 255 * np.where(light <= 0.0031308, light * 12.92, 1.055 * light ** (1 / 2.4) - 0.055)
+    return np.clip(levels + 0.5, 0, 255).astype(np.uint8)
+
+def night_scene(width=320, height=240):
+    """
+    Linear light of a dark scene with a few lights that clip in the long exposure.
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    light = 0.002 + 0.15 * x / width + 0.05 * np.sin(y / 13) ** 2
+    light[height // 3:height // 2, width // 4:width // 3] = 3.0
+    return np.repeat(light[:, :, None], 3, axis=2) * np.array([1.0, 0.9, 0.7])
+
+@pytest.mark.parametrize('method', ['mean', 'median'])
+def test_a_stacked_burst_is_as_bright_as_the_long_exposure(method):
+    light = night_scene()
+    single = encode(light)
+    burst = [encode(light / FRAMES) for _ in range(FRAMES)]
+
+    stacked = stack_frames(burst, method=method, gain=FRAMES, chunk_rows=64)
+
+    # Scaling the gamma-encoded levels by FRAMES would make it about twice as bright
+    assert stacked.mean() == pytest.approx(single.mean(), abs=0.5)
+    assert np.abs(stacked.astype(int) - single).max() <= 3
+    assert (stacked[single == 255] == 255).all()
+
+def test_stacking_without_gain_keeps_the_frame():
+    frame = encode(night_scene())
+    assert np.array_equal(stack_frames([frame, frame.copy()]), frame)
+
+def test_stack_burst_brightens_by_the_number_of_frames(make_settings):
+    config = make_settings(stacking={'align': False})
+    light = night_scene()
+    burst = [encode(light / FRAMES) for _ in range(FRAMES)]
+
+    stacked = np.asarray(stack_burst(burst, config))
+
+    assert stacked.mean() == pytest.approx(encode(light).mean(), abs=0.5)
+
+def test_only_long_manual_exposures_are_split(make_settings):
+    config = make_settings(stacking={'enabled': True, 'frames': FRAMES, 'min_exposure_time': 1000000})
+
+    assert burst_size(config, {'AeEnable': False, 'ExposureTime': 2000000}) == FRAMES
+    assert burst_size(config, {'AeEnable': False, 'ExposureTime': 500000}) == 1
+    assert burst_size(config, {'AeEnable': True}) == 1
+    assert burst_controls({'AeEnable': False, 'ExposureTime': 2000000, 'AnalogueGain': 4.0}, FRAMES) == {
+        'AeEnable': False, 'ExposureTime': 500000, 'AnalogueGain': 4.0,
+    }